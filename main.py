@@ -30,6 +30,11 @@ try:
 except Exception:
     pass
 
+# --- 启动后后台预热 ---
+# True: 窗口显示后在后台导入各模块的重型依赖 (torch / sklearn / jieba 等，见各模块的 warm_up)，
+# 首次打开相关页面不再等待；代价是启动后常驻内存多出数百 MB。默认关闭，只在打开页面时预热。
+BACKGROUND_WARM_UP = False
+
 ctk.set_appearance_mode("Light")       
 ctk.set_default_color_theme("blue")    
 
@@ -121,6 +126,18 @@ class App(ctk.CTk):
         if self.modules:
             self.select_module(0)
 
+        if BACKGROUND_WARM_UP:
+            self.after(2000, self.start_background_warm_up)
+
+    def start_background_warm_up(self):
+        """依次调用各模块的 warm_up (只导入依赖)，放在一个后台线程里，不阻塞界面"""
+        warm_ups = [m.warm_up for m in self.modules if hasattr(m, 'warm_up')]
+        def _run():
+            for warm_up in warm_ups:
+                try: warm_up()
+                except Exception: pass
+        threading.Thread(target=_run, daemon=True).start()
+
     # ==================== 新增：悬浮中断控制器逻辑 ====================
     def init_floating_control(self):
         """初始化右下角的悬浮控制条"""
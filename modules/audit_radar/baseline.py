@@ -0,0 +1,151 @@
+import numpy as np
+import pandas as pd
+
+class BaselineScorer:
+    """
+    统计基线检测器 (免训练，只用 NumPy/pandas 分组运算，百万行数秒内完成)
+    三个分项，各自换算成百分位后取最大值作为评分 (任一维度极端即靠前)，原因取贡献最大的分项：
+    1. 稳健 Z：按科目对 log(1+|金额|) 求 中位数 / MAD，Z = (x - 中位数) / (MAD / 0.6745)。
+       MAD 为 0 (金额高度集中) 时改用平均绝对偏差 x 1.2533；科目行数过少时不计算。
+    2. 罕见组合：科目 x 对方单位 x 月份 的组合在该科目内的占比，分值 = -ln(占比)。
+    3. 本福特：按科目统计首位数字分布，与本福特定律的平均绝对偏差 (MAD) 超过 Nigrini 非一致界限的科目里，
+       首位数字出现得比理论值多的行按超出比例计分。
+    """
+    COMPONENTS = {"robust_z": "金额偏离(稳健Z)", "rarity": "罕见组合", "benford": "本福特偏差"}
+    # 报告中的分项明细列
+    REPORT_COLUMNS = ("稳健Z", "组合频次", "本福特偏差")
+    # 作为 "对方单位" 的候选列名关键词 (按顺序匹配第一个)
+    COUNTERPARTY_KEYWORDS = ("对方", "往来", "客户", "供应商", "辅助")
+
+    MIN_GROUP_ROWS = 10             # 科目行数少于该值时不计算稳健 Z
+    BENFORD_MIN_ROWS = 100          # 科目有效金额行数少于该值时不做本福特检验
+    BENFORD_MIN_AMOUNT = 10         # 小于 10 元的金额不参与首位数字统计 (Nigrini)
+    BENFORD_MAD_THRESHOLD = 0.015   # 首位数字 MAD 超过该值判定为 "不符合" (Nigrini)
+    BENFORD_EXPECTED = np.log10(1 + 1 / np.arange(1, 10))
+    BLEND_WEIGHT = 0.5              # 与自编码器融合时统计基线所占权重
+
+    def __init__(self):
+        self.components = {}    # {分项: 每行原始分值}
+        self.benford_mad = {}   # {科目: 首位数字 MAD} (只含参与检验的科目)
+        self.columns = {}       # 实际使用的 科目 / 对方单位 / 日期 列
+        self._combo_counts = None
+
+    @classmethod
+    def guess_columns(cls, df, preferred_cols=()):
+        """
+        从勾选的特征列 (优先) 及全部列名中推断 科目 / 对方单位 / 日期 列；
+        返回 (subject_col, counterparty_col, date_col)，后两者找不到时为 None。
+        """
+        candidates = list(preferred_cols) + [c for c in df.columns if c not in preferred_cols]
+        subject = next((c for c in candidates if '科目' in str(c)), None)
+        if subject is None and preferred_cols: subject = preferred_cols[0]
+        if subject is None: raise ValueError("未找到科目列 (列名需包含 '科目')")
+        counterparty = next((c for kw in cls.COUNTERPARTY_KEYWORDS for c in candidates
+                             if kw in str(c) and c != subject), None)
+        date = next((c for c in candidates
+                     if '日期' in str(c) or 'date' in str(c).lower() or 'time' in str(c).lower()), None)
+        return subject, counterparty, date
+
+    def score(self, df, amt_cols, subject_col, counterparty_col=None, date_col=None, threshold=0):
+        """
+        返回 (scores: 0~1 float32 数组, reasons: object 数组)，与 AuditEngine.predict_with_reason 同形；
+        各分项原始分值保存在 self.components。
+        threshold: 重要性水平，最大金额低于该值的行评分置 0、原因为 "忽略(金额小)" (与自编码器一致)
+        """
+        self.columns = {"subject": subject_col, "counterparty": counterparty_col, "date": date_col}
+        n_rows = len(df)
+        max_abs = df[amt_cols].apply(pd.to_numeric, errors='coerce').abs().max(axis=1).fillna(0).to_numpy(dtype=np.float64)
+        subject = self._codes(df[subject_col])
+        subject_sizes = np.bincount(subject) if n_rows else np.array([], dtype=np.int64)
+
+        self.components = {
+            "robust_z": self._robust_z(np.log1p(max_abs), subject, subject_sizes),
+            "rarity": self._rarity(df, subject, subject_sizes, counterparty_col, date_col),
+            "benford": self._benford(max_abs, subject, df[subject_col]),
+        }
+
+        # 各分项 -> 百分位 (分值为 0 的行不参与排名，百分位记 0)
+        pct = np.zeros((n_rows, len(self.components)), dtype=np.float32)
+        for j, values in enumerate(self.components.values()):
+            magnitude = np.abs(values)
+            ranked = pd.Series(np.where(magnitude > 0, magnitude, np.nan)).rank(pct=True).fillna(0)
+            pct[:, j] = ranked.to_numpy()
+        scores = pct.max(axis=1) if n_rows else np.zeros(0, dtype=np.float32)
+        labels = np.array(list(self.COMPONENTS.values()), dtype=object)
+        reasons = labels[pct.argmax(axis=1)] if n_rows else np.array([], dtype=object)
+
+        if threshold > 0:
+            mask_small = max_abs < threshold
+            scores[mask_small] = 0.0
+            reasons[mask_small] = "忽略(金额小)"
+        return scores, reasons
+
+    def component_frame(self, index=None):
+        """报告用的分项明细列：稳健Z (带符号) / 组合频次 / 本福特偏差"""
+        values = [np.round(self.components["robust_z"], 2), self._combo_counts, np.round(self.components["benford"], 2)]
+        return pd.DataFrame(dict(zip(self.REPORT_COLUMNS, values)), index=index)
+
+    @staticmethod
+    def blend(ae_scores, base_scores, weight=None):
+        """
+        自编码器评分 与 统计基线评分 融合：两者都换算成百分位后加权平均 (量纲无关)。
+        自编码器评分为 0 的行 (已被重要性水平 / 摘要过滤) 保持 0。
+        """
+        weight = BaselineScorer.BLEND_WEIGHT if weight is None else weight
+        ae_scores = np.asarray(ae_scores, dtype=np.float64)
+        ae_pct = pd.Series(ae_scores).rank(pct=True).to_numpy()
+        base_pct = pd.Series(np.asarray(base_scores, dtype=np.float64)).rank(pct=True).to_numpy()
+        blended = (1 - weight) * ae_pct + weight * base_pct
+        blended[ae_scores == 0] = 0.0
+        return blended.astype(np.float32)
+
+    @staticmethod
+    def _codes(series):
+        """分组编码：空值单独成一组"""
+        codes, uniques = pd.factorize(series)
+        codes[codes < 0] = len(uniques)
+        return codes
+
+    def _robust_z(self, x, subject, sizes):
+        groups = pd.Series(x).groupby(subject)
+        median = groups.transform('median').to_numpy()
+        deviation = pd.Series(np.abs(x - median)).groupby(subject)
+        mad = deviation.transform('median').to_numpy() / 0.6745
+        mean_ad = deviation.transform('mean').to_numpy() * 1.2533
+        scale = np.where(mad > 0, mad, mean_ad)
+        z = np.divide(x - median, scale, out=np.zeros_like(x), where=scale > 0)
+        z[sizes[subject] < self.MIN_GROUP_ROWS] = 0.0
+        return z
+
+    def _rarity(self, df, subject, sizes, counterparty_col, date_col):
+        keys = {"subject": subject}
+        if counterparty_col is not None: keys["counterparty"] = self._codes(df[counterparty_col])
+        if date_col is not None:
+            keys["month"] = pd.to_datetime(df[date_col], errors='coerce').dt.month.fillna(0).to_numpy(dtype=np.int64)
+        combo = pd.DataFrame(keys).groupby(list(keys), sort=False).ngroup().to_numpy()
+        counts = np.bincount(combo)[combo] if len(combo) else np.zeros(0, dtype=np.int64)
+        self._combo_counts = counts
+        if len(keys) == 1: return np.zeros(len(subject))  # 只有科目，没有组合可言
+        return -np.log(counts / sizes[subject])
+
+    def _benford(self, amounts, subject, subject_values):
+        self.benford_mad = {}
+        n_groups = int(subject.max()) + 1 if len(subject) else 0
+        valid = amounts >= self.BENFORD_MIN_AMOUNT
+        exponent = np.floor(np.log10(np.where(valid, amounts, 1.0)))
+        digit = np.clip((amounts / 10 ** exponent).astype(np.int64), 1, 9)
+
+        counts = np.bincount(subject[valid] * 9 + digit[valid] - 1, minlength=n_groups * 9).reshape(n_groups, 9)
+        totals = counts.sum(axis=1)
+        observed = counts / np.maximum(totals, 1)[:, None]
+        mad = np.abs(observed - self.BENFORD_EXPECTED).mean(axis=1)
+        tested = totals >= self.BENFORD_MIN_ROWS
+        nonconforming = tested & (mad > self.BENFORD_MAD_THRESHOLD)
+
+        # 记录参与检验的科目 MAD (供日志展示)
+        first_row = pd.Series(np.arange(len(subject))).groupby(subject).first()
+        for g in np.flatnonzero(tested):
+            self.benford_mad[str(subject_values.iloc[first_row[g]])] = float(mad[g])
+
+        excess = (observed[subject, digit - 1] - self.BENFORD_EXPECTED[digit - 1]) / self.BENFORD_EXPECTED[digit - 1]
+        return np.where(valid & nonconforming[subject], np.maximum(excess, 0.0), 0.0)
@@ -0,0 +1,123 @@
+"""
+会计分录测试 (审计雷达) - CPU 吞吐基准
+
+测量 预处理 / 统计基线 / 训练 / 评分 各阶段的 行/秒，评分阶段逐一比较
+fp32 / bf16 / int8 与 eager / TorchScript / torch.compile 的组合，并给出相对 fp32 的最大评分偏差。
+
+用法：
+    python -m modules.audit_radar.benchmark --rows 500000
+    python -m modules.audit_radar.benchmark --file 序时账.xlsx --amt 借方金额 贷方金额 --cat 科目名称 制单人
+    python -m modules.audit_radar.benchmark --threads 4 --json result.json
+    python -m modules.audit_radar.benchmark --rows 2000000 --sample-rows 200000
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+
+from .baseline import BaselineScorer
+from .data_processor import AuditDataProcessor
+from .engine import AuditEngine
+
+SUBJECTS = ["银行存款", "库存现金", "应收账款", "应付账款", "管理费用", "销售费用",
+            "主营业务收入", "主营业务成本", "应交税费", "其他应收款", "其他应付款", "固定资产"]
+USERS = ["张三", "李四", "王五", "赵六"]
+
+def make_ledger(n_rows, seed=0):
+    """合成序时账：科目 / 制单人 / 日期 / 借贷金额 (对数正态)"""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 366, n_rows), unit="D")
+    amount = np.round(np.exp(rng.normal(7, 2, n_rows)), 2)
+    is_debit = rng.random(n_rows) < 0.5
+    return pd.DataFrame({
+        "制单日期": dates.strftime("%Y-%m-%d"),
+        "科目名称": rng.choice(SUBJECTS, n_rows),
+        "制单人": rng.choice(USERS, n_rows),
+        "借方金额": np.where(is_debit, amount, 0.0),
+        "贷方金额": np.where(is_debit, 0.0, amount),
+    })
+
+def _rate(rows, seconds):
+    return rows / seconds if seconds > 0 else float("inf")
+
+def run_benchmark(df, amt_cols, cat_cols, epochs=5, batch_size=4096, sample_rows=None, log=print):
+    device = torch.device('cpu')
+    result = {"rows": len(df), "threads": torch.get_num_threads(), "scoring": []}
+
+    started = time.perf_counter()
+    processor = AuditDataProcessor()
+    processed = processor.preprocess(df, amt_cols, cat_cols)
+    cats, conts = processor.get_tensors(processed, device)
+    result["preprocess_rows_per_sec"] = _rate(len(df), time.perf_counter() - started)
+    log(f"预处理: {result['preprocess_rows_per_sec']:,.0f} 行/秒")
+
+    started = time.perf_counter()
+    BaselineScorer().score(df, amt_cols, *BaselineScorer.guess_columns(df, cat_cols))
+    result["baseline_rows_per_sec"] = _rate(len(df), time.perf_counter() - started)
+    log(f"统计基线: {result['baseline_rows_per_sec']:,.0f} 行/秒 (免训练)")
+
+    train_cats, train_conts = cats, conts
+    if sample_rows:
+        positions, stats = processor.stratified_sample(processed, sample_rows)
+        idx = torch.as_tensor(positions)
+        train_cats, train_conts = cats[idx], conts[idx]
+        result["train_rows"] = stats["sampled"]
+        log(f"分层抽样: {stats['sampled']:,} / {stats['rows']:,} 行 ({stats['strata']} 层)")
+
+    engine = AuditEngine(processor, device)
+    started = time.perf_counter()
+    # 关掉早停，保证每次都跑满 epochs 轮，吞吐可比
+    engine.train_model(train_cats, train_conts, epochs=epochs, batch_size=batch_size, patience=epochs + 1)
+    train_seconds = time.perf_counter() - started
+    result["train_seconds"] = train_seconds
+    result["train_rows_per_sec"] = _rate(len(train_cats) * epochs, train_seconds)
+    log(f"训练:   {result['train_rows_per_sec']:,.0f} 行/秒 (按 {epochs} 轮累计) | 用时 {train_seconds:.1f}s")
+
+    baseline = None
+    sample_cats, sample_conts = cats[:256], conts[:256]
+    for precision in AuditEngine.PRECISIONS:
+        for compile_mode in AuditEngine.COMPILE_MODES:
+            if (precision, compile_mode) in AuditEngine.UNSUPPORTED_MODES: continue
+            desc = engine.optimize_for_cpu(sample_cats, sample_conts, precision, compile_mode)
+            started = time.perf_counter()
+            scores, _ = engine.predict_with_reason(cats, conts)
+            rate = _rate(len(df), time.perf_counter() - started)
+            if baseline is None: baseline = scores
+            deviation = float(np.abs(scores - baseline).max())
+            result["scoring"].append({"mode": desc, "rows_per_sec": rate, "max_deviation": deviation})
+            log(f"评分 {desc:<40} {rate:>12,.0f} 行/秒 | 偏差 {deviation:.2e}")
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="审计雷达 CPU 吞吐基准")
+    parser.add_argument("--rows", type=int, default=200000, help="合成序时账行数 (未指定 --file 时)")
+    parser.add_argument("--file", help="使用真实序时账 (Excel/CSV)")
+    parser.add_argument("--amt", nargs="+", default=["借方金额", "贷方金额"], help="金额列")
+    parser.add_argument("--cat", nargs="+", default=["科目名称", "制单人", "制单日期"], help="特征列")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=4096)
+    parser.add_argument("--sample-rows", type=int, help="分层抽样训练的样本上限 (评分仍覆盖全部行)")
+    parser.add_argument("--threads", type=int, help="算子线程数 (默认物理核数)")
+    parser.add_argument("--json", help="把结果保存为 JSON")
+    args = parser.parse_args(argv)
+
+    threads = AuditEngine.configure_cpu(args.threads)
+    if args.file:
+        df = pd.read_csv(args.file) if args.file.endswith('.csv') else pd.read_excel(args.file)
+    else:
+        df = make_ledger(args.rows)
+    print(f"行数 {len(df):,} | 线程 {threads}")
+
+    result = run_benchmark(df, args.amt, args.cat, args.epochs, args.batch_size, args.sample_rows)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+        print(f"结果已保存: {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
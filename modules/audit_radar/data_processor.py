@@ -1,103 +1,281 @@
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import LabelEncoder, StandardScaler
 import torch
 
 class AuditDataProcessor:
+    """
+    序时账 -> 自编码器输入
+    向量化流程 (不拷贝整表，只生成模型需要的列)：
+    1. 日期识别只在抽样行上试转换，确认后整列转换一次，月份/周末用 datetime64 直接算。
+    2. 分类列用 pd.factorize 一次完成 编码 + 基数统计 (取代 nunique + LabelEncoder 两遍扫描)，
+       字符串化只作用在去重后的取值上。
+    3. 金额 log 变换 + 标准化全部用 NumPy。
+    """
+    # 训练时没见过的类别 (以及空值) 统一归入该类
+    UNKNOWN = "Unknown"
+    STATE_VERSION = 1
+    # 类型识别的抽样行数
+    SAMPLE_ROWS = 10000
+
     def __init__(self):
-        self.label_encoders = {}
-        self.scaler = StandardScaler()
+        self.categories = {}     # {列名: 类别取值数组 (下标即编码)}
         self.cat_cols = []
         self.cont_cols = []
         self.cat_dims = []
         self.emb_dims = []
-        
+        self.date_cols = []      # 被识别为日期、已展开为 _Month/_IsWeekend 的原始列
+        self.cont_mean = None    # 拟合后的标准化参数 (transform 时直接使用)
+        self.cont_scale = None
+        self.unknown_counts = {} # transform 时各列归入 Unknown 的行数
+
     def preprocess(self, df, cont_col_names, cat_col_names):
         """
-        df: 原始 DataFrame
+        df: 原始 DataFrame (不会被修改，也不会整表拷贝)
         cont_col_names: 金额列名列表
         cat_col_names: 分类列名列表
+        返回只包含 编码后分类列 + 数值化金额列 的新 DataFrame
         """
-        # 拷贝副本
-        data = df.copy()
-        
-        # --- 1. 智能日期特征提取 (新增功能) ---
+        n_rows = len(df)
+        data = {}
+
+        # --- 1. 智能日期特征提取 ---
         # 我们会在 cat_col_names 里寻找像 '日期'、'Date'、'Time' 这样的列
         # 如果找到了，就自动生成 'Month' 和 'Is_Weekend' 特征
         final_cat_cols = []
-        
+        self.date_cols = []
+        self.categories = {}
+        self.cat_dims = []
+        self.emb_dims = []
+
         for col in cat_col_names:
-            # 尝试转为日期格式
-            is_date = False
-            if '日期' in str(col) or 'time' in str(col).lower() or 'date' in str(col).lower():
-                try:
-                    # 尝试转换，失败则忽略
-                    temp_series = pd.to_datetime(data[col], errors='coerce')
-                    if temp_series.notna().sum() > len(data) * 0.5: # 超过一半转换成功
-                        is_date = True
-                        # 生成新特征
-                        data[f'{col}_Month'] = temp_series.dt.month.fillna(0).astype(int).astype(str)
-                        # data[f'{col}_Weekday'] = temp_series.dt.weekday.fillna(0).astype(int).astype(str) # 0-6
-                        # 甚至可以加一个是否周末
-                        data[f'{col}_IsWeekend'] = temp_series.dt.weekday.apply(lambda x: 'Yes' if x>=5 else 'No').astype(str)
-                        
-                        final_cat_cols.append(f'{col}_Month')
-                        final_cat_cols.append(f'{col}_IsWeekend')
-                except:
-                    pass
-            
-            # 如果不是日期，或者转换失败，就作为普通分类处理
-            # 但我们要过滤掉唯一值太多的列（比如摘要、凭证号），因为它们是噪音
-            if not is_date:
-                unique_count = data[col].nunique()
-                # 如果唯一值数量超过行数的 80% (且行数>100)，说明这列几乎每行都不一样(如摘要、编号)
-                # 这种列对于自编码器是毁灭性的噪音，必须丢弃！
-                if len(data) > 100 and unique_count > len(data) * 0.8:
-                    print(f"[警告] 列 '{col}' 的唯一值过多 ({unique_count})，判定为噪音，已自动跳过。")
-                    continue
-                
-                final_cat_cols.append(col)
+            if self._looks_like_date(df[col]):
+                final_cat_cols.extend(self._add_date_features(data, col, pd.to_datetime(df[col], errors='coerce')))
+                self.date_cols.append(col)
+                continue
+
+            # 不是日期就作为普通分类处理；编码的同时得到唯一值数量
+            codes, classes = self._factorize(df[col])
+            # 如果唯一值数量超过行数的 80% (且行数>100)，说明这列几乎每行都不一样(如摘要、编号)
+            # 这种列对于自编码器是毁灭性的噪音，必须丢弃！
+            unique_count = len(classes) - 1  # 不含补上的 Unknown
+            if n_rows > 100 and unique_count > n_rows * 0.8:
+                print(f"[警告] 列 '{col}' 的唯一值过多 ({unique_count})，判定为噪音，已自动跳过。")
+                continue
+
+            data[col] = codes
+            self.categories[col] = classes
+            final_cat_cols.append(col)
+
+        # 日期派生列同样编码
+        for col in final_cat_cols:
+            if col in self.categories: continue
+            data[col], self.categories[col] = self._factorize(pd.Series(data[col]))
 
         self.cat_cols = final_cat_cols
         self.cont_cols = cont_col_names
-        
+        for col in self.cat_cols:
+            dim = len(self.categories[col])
+            self.cat_dims.append(dim)
+            self.emb_dims.append(min(50, (dim + 1) // 2))
+
         # --- 2. 处理连续变量 (金额) ---
-        processed_conts = []
-        for col in cont_col_names:
+        cont_matrix = self._log_amounts(df, data)
+        if cont_matrix is not None:
+            self.cont_mean = cont_matrix.mean(axis=0)
+            scale = cont_matrix.std(axis=0)
+            scale[scale == 0] = 1.0  # 常数列不缩放 (与 StandardScaler 一致)
+            self.cont_scale = scale
+            self.cont_data = (cont_matrix - self.cont_mean) / self.cont_scale
+        else:
+            self.cont_data = np.array([])
+
+        return pd.DataFrame(data, index=df.index)
+
+    def transform(self, df):
+        """
+        用已拟合 (或已加载) 的参数处理新期间的数据，不重新拟合：
+        日期列按训练时的判定展开，金额用训练时的均值/标准差标准化，
+        没见过的类别归入 Unknown (各列数量记录在 self.unknown_counts)。
+        """
+        missing = [c for c in self.date_cols + self.cont_cols + self.cat_cols
+                   if c not in df.columns and c not in self._date_feature_cols()]
+        if missing:
+            raise ValueError(f"新数据缺少训练时使用的列: {missing}")
+
+        data = {}
+        for col in self.date_cols:
+            self._add_date_features(data, col, pd.to_datetime(df[col], errors='coerce'))
+
+        cont_matrix = self._log_amounts(df, data)
+        if cont_matrix is not None:
+            self.cont_data = (cont_matrix - self.cont_mean) / self.cont_scale
+        else:
+            self.cont_data = np.array([])
+
+        self.unknown_counts = {}
+        for col in self.cat_cols:
+            source = pd.Series(data[col]) if col in data else df[col]
+            classes = self.categories[col]
+            lookup = {c: i for i, c in enumerate(classes)}
+            unknown_idx = lookup[self.UNKNOWN]
+
+            raw_codes, uniques = pd.factorize(source)
+            # 只对去重后的取值查表，再按编码广播回每一行
+            mapped = np.array([lookup.get(str(u), -1) for u in uniques] + [unknown_idx], dtype=np.int64)
+            codes = mapped[raw_codes]  # raw_codes 为 -1 (空值) 时取到末尾的 Unknown
+            unseen = codes < 0
+            if unseen.any(): self.unknown_counts[col] = int(unseen.sum())
+            codes[unseen] = unknown_idx
+            data[col] = codes
+        return pd.DataFrame(data, index=df.index)
+
+    def stratified_sample(self, processed_df, max_rows, seed=42):
+        """
+        大账套抽样训练：按 科目 x 月份 分层，每层先保底 1 行，余下名额按各层剩余行数比例分配 (最大余数法)，
+        样本数恰好为 max_rows，小科目、小月份同样出现在训练样本中；评分仍然覆盖全部行。
+        层数多于 max_rows 时只能保证行数最多的 max_rows 个层各 1 行。
+        processed_df: preprocess / transform 的返回值
+        返回 (行位置数组 (升序), 统计信息 dict)；行数不超过 max_rows 时返回全部行。
+        """
+        n_rows = len(processed_df)
+        strata_cols = self._strata_cols()
+        if strata_cols:
+            strata = processed_df.groupby(strata_cols, sort=False).ngroup().to_numpy()
+        else:
+            strata = np.zeros(n_rows, dtype=np.int64)
+        sizes = np.bincount(strata) if n_rows else np.array([], dtype=np.int64)
+
+        stats = {"rows": n_rows, "strata_cols": strata_cols, "strata": len(sizes),
+                 "min_stratum": int(sizes.min()) if len(sizes) else 0,
+                 "max_stratum": int(sizes.max()) if len(sizes) else 0}
+        if n_rows <= max_rows:
+            stats["sampled"] = n_rows
+            return np.arange(n_rows), stats
+
+        n_strata = len(sizes)
+        if n_strata <= max_rows:
+            extra = (sizes - 1) * ((max_rows - n_strata) / (n_rows - n_strata))
+            quota = 1 + np.floor(extra).astype(np.int64)
+            # 向下取整后差的名额给余数最大的层 (稳定排序，结果可复现)
+            short = max_rows - int(quota.sum())
+            quota[np.argsort(np.floor(extra) - extra, kind='stable')[:short]] += 1
+        else:
+            quota = np.zeros(n_strata, dtype=np.int64)
+            quota[np.argsort(-sizes, kind='stable')[:max_rows]] = 1
+        # 层内随机排名：先按 (层, 随机数) 排序，排名 = 位置 - 该层起点
+        rng = np.random.default_rng(seed)
+        order = np.lexsort((rng.random(n_rows), strata))
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        rank = np.arange(n_rows) - starts[strata[order]]
+        positions = np.sort(order[rank < quota[strata[order]]])
+        stats["sampled"] = len(positions)
+        return positions, stats
+
+    def _strata_cols(self):
+        """分层依据：名称含 '科目' 的特征列 (没有则取第一个非日期特征列) + 日期月份列"""
+        date_features = set(self._date_feature_cols())
+        plain = [c for c in self.cat_cols if c not in date_features]
+        subject = [c for c in plain if '科目' in str(c)][:1] or plain[:1]
+        months = [f'{col}_Month' for col in self.date_cols if f'{col}_Month' in self.cat_cols][:1]
+        return subject + months
+
+    def _looks_like_date(self, series):
+        """列名像日期，且抽样行中超过一半能转换成日期"""
+        col = str(series.name)
+        if not ('日期' in col or 'time' in col.lower() or 'date' in col.lower()): return False
+        if pd.api.types.is_datetime64_any_dtype(series): return True
+        step = max(1, len(series) // self.SAMPLE_ROWS)
+        sample = series.iloc[::step]
+        try:
+            parsed = pd.to_datetime(sample, errors='coerce')
+        except (TypeError, ValueError):
+            return False
+        return parsed.notna().sum() > len(sample) * 0.5
+
+    def _factorize(self, series):
+        """
+        返回 (编码数组, 类别数组)：类别统一为字符串，空值及 Unknown 共用一个编码，且 Unknown 类必定存在
+        (供日后给新期间评分时承接没见过的取值)
+        """
+        raw_codes, uniques = pd.factorize(series)
+        # 先对原值去重，再字符串化去重后的取值 (1 与 "1" 会在这里合并)
+        str_codes, classes = pd.factorize(pd.Index(uniques).astype(str))
+        classes = list(classes)
+        if self.UNKNOWN in classes:
+            unknown_idx = classes.index(self.UNKNOWN)
+        else:
+            unknown_idx = len(classes)
+            classes.append(self.UNKNOWN)
+        mapped = np.append(str_codes, unknown_idx).astype(np.int64)
+        return mapped[raw_codes], np.array(classes, dtype=object)
+
+    def _date_feature_cols(self):
+        return [f'{col}_{suffix}' for col in self.date_cols for suffix in ('Month', 'IsWeekend')]
+
+    def source_cat_cols(self):
+        """训练时选用的原始特征列 (日期展开出的 _Month/_IsWeekend 还原为原列名)，载入模型后供统计基线推断列用"""
+        date_features = set(self._date_feature_cols())
+        return [c for c in self.cat_cols if c not in date_features] + list(self.date_cols)
+
+    @staticmethod
+    def _add_date_features(data, col, temp_series):
+        """由日期列生成 月份 / 是否周末 两个分类特征 (datetime64 直接运算)，返回新列名"""
+        values = temp_series.values.astype('datetime64[D]')
+        is_nat = np.isnat(values)
+        days = values.astype(np.int64)
+        months = values.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        # 1970-01-01 是周四：(天数 + 3) % 7 即 周一=0 ... 周日=6
+        weekday = (days + 3) % 7
+
+        data[f'{col}_Month'] = np.where(is_nat, "0", months.astype(str))
+        data[f'{col}_IsWeekend'] = np.where(~is_nat & (weekday >= 5), 'Yes', 'No')
+        return [f'{col}_Month', f'{col}_IsWeekend']
+
+    def _log_amounts(self, df, data):
+        """金额列 -> 带符号的 log1p 矩阵 (无金额列时返回 None)；数值化后的金额同时写入 data"""
+        if not self.cont_cols: return None
+        matrix = np.empty((len(df), len(self.cont_cols)), dtype=np.float64)
+        for i, col in enumerate(self.cont_cols):
             # 转数字，非数字变0
-            data[col] = pd.to_numeric(data[col], errors='coerce').fillna(0)
-            
+            col_val = pd.to_numeric(df[col], errors='coerce').fillna(0).values
+            data[col] = col_val
+
             # 关键：保留正负号信息的 Log 处理
             # log1p(abs(x)) * sign(x)
             # 这样 AI 既能理解金额大小，也能理解借贷方向
-            col_val = data[col].values
-            sign = np.sign(col_val)
-            log_abs = np.log1p(np.abs(col_val))
-            transformed = log_abs * sign
-            
-            processed_conts.append(transformed.reshape(-1, 1))
-            
-        if processed_conts:
-            cont_matrix = np.hstack(processed_conts)
-            self.cont_data = self.scaler.fit_transform(cont_matrix)
-        else:
-            self.cont_data = np.array([])
+            matrix[:, i] = np.log1p(np.abs(col_val)) * np.sign(col_val)
+        return matrix
 
-        # --- 3. 处理分类变量 ---
-        self.cat_dims = []
-        self.emb_dims = []
-        
-        for col in self.cat_cols:
-            data[col] = data[col].fillna("Unknown").astype(str)
-            le = LabelEncoder()
-            data[col] = le.fit_transform(data[col])
-            self.label_encoders[col] = le
-            
-            dim = len(le.classes_)
-            self.cat_dims.append(dim)
-            self.emb_dims.append(min(50, (dim + 1) // 2))
-            
-        return data
+    # --- 持久化 (只含 list/str/float，可直接随模型权重 torch.save) ---
+    def get_state(self):
+        return {
+            "version": self.STATE_VERSION,
+            "cat_cols": list(self.cat_cols),
+            "cont_cols": list(self.cont_cols),
+            "date_cols": list(self.date_cols),
+            "cat_dims": list(self.cat_dims),
+            "emb_dims": list(self.emb_dims),
+            "classes": {col: [str(c) for c in classes] for col, classes in self.categories.items()},
+            "cont_mean": self.cont_mean.tolist() if self.cont_mean is not None else None,
+            "cont_scale": self.cont_scale.tolist() if self.cont_scale is not None else None,
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        if state.get("version") != cls.STATE_VERSION:
+            raise ValueError(f"模型文件版本不兼容: {state.get('version')}")
+        processor = cls()
+        processor.cat_cols = list(state["cat_cols"])
+        processor.cont_cols = list(state["cont_cols"])
+        processor.date_cols = list(state["date_cols"])
+        processor.cat_dims = list(state["cat_dims"])
+        processor.emb_dims = list(state["emb_dims"])
+        for col, classes in state["classes"].items():
+            processor.categories[col] = np.array(classes, dtype=object)
+        if state["cont_mean"] is not None:
+            processor.cont_mean = np.array(state["cont_mean"])
+            processor.cont_scale = np.array(state["cont_scale"])
+        return processor
 
     def get_tensors(self, df, device):
         if self.cat_cols:
@@ -105,10 +283,10 @@ class AuditDataProcessor:
             cats = torch.tensor(cats, dtype=torch.long).to(device)
         else:
             cats = torch.tensor([], dtype=torch.long).to(device)
-        
+
         if self.cont_cols:
             conts = torch.tensor(self.cont_data, dtype=torch.float).to(device)
         else:
             conts = torch.tensor([], dtype=torch.float).to(device)
-        
-        return cats, conts
\ No newline at end of file
+
+        return cats, conts
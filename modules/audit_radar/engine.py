@@ -1,87 +1,335 @@
+import contextlib
+import warnings
 import torch
 import torch.nn as nn
 import torch.optim as optim
 import numpy as np
 from .model import AuditAutoEncoder
+from .data_processor import AuditDataProcessor
+
+# PyTorch 自己的默认算子线程数 (按物理核数)，须在任何 set_num_threads 之前读取
+DEFAULT_NUM_THREADS = torch.get_num_threads()
 
 class AuditEngine:
+    # 行数少于该值时不留验证集 (样本太少，验证 Loss 噪声大于信号)
+    VAL_MIN_ROWS = 1000
+
+    # 模型文件扩展名 (预处理参数 + 网络权重打包在一个文件里)
+    MODEL_EXT = ".radar"
+
+    # CPU 推理模式
+    PRECISIONS = ("fp32", "bf16", "int8")
+    COMPILE_MODES = (None, "script", "compile")
+    # 不支持的组合：TorchScript trace 不能记录 autocast，bf16 + script 必然失败
+    UNSUPPORTED_MODES = {("bf16", "script")}
+    # 算子间线程数是进程级设置，只设一次
+    _interop_configured = False
+
     def __init__(self, processor, device=None):
         self.processor = processor
         self.device = device if device else torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.model = None
+        # optimize_for_cpu 生成的推理专用模型 (为空时直接用 self.model)
+        self.inference_model = None
+        self.inference_bf16 = False
+        # 最近一次 predict_with_reason 的逐行特征归因 {features, top_idx, top_share}
+        self.attribution = None
+
+    @staticmethod
+    def configure_cpu(num_threads=None):
+        """
+        设置 CPU 算子内并行线程数：默认沿用 PyTorch 启动时的线程数 (即物理核数，不假设开启超线程)。
+        返回实际使用的线程数。
+        """
+        if num_threads is None:
+            num_threads = DEFAULT_NUM_THREADS
+        torch.set_num_threads(num_threads)
+        if not AuditEngine._interop_configured:
+            AuditEngine._interop_configured = True
+            try:
+                # 算子间并行只能在首次并行计算前设置，之后调用会报错，忽略即可
+                torch.set_num_interop_threads(1)
+            except RuntimeError:
+                pass
+        return num_threads
+
+    def optimize_for_cpu(self, sample_cats, sample_conts, precision="fp32", compile_mode=None):
+        """
+        为 CPU 推理准备模型 (训练用的 self.model 不受影响)：
+        precision:    fp32 / bf16 (autocast 自动混合精度) / int8 (Linear 层动态量化)
+        compile_mode: None / "script" (TorchScript trace + freeze，不支持 bf16) / "compile" (torch.compile，需要编译器环境)
+        sample_cats / sample_conts: 一小批样例输入，用于 trace 及编译预热。
+        返回实际生效的模式说明；某一步不可用时回退并在说明里注明。
+        """
+        if precision not in self.PRECISIONS: raise ValueError(f"未知精度: {precision}")
+        if compile_mode not in self.COMPILE_MODES: raise ValueError(f"未知编译模式: {compile_mode}")
+        if (precision, compile_mode) in self.UNSUPPORTED_MODES: raise ValueError(f"不支持 {precision} + {compile_mode}")
+
+        model = self.model.eval()
+        notes = []
+        self.inference_bf16 = False
+
+        if precision == "int8":
+            try:
+                model = self._quantize(model)
+            except Exception as e:
+                # 动态量化接口在新版 PyTorch 中可能被移除，回退到 fp32
+                notes.append(f"int8 不可用，已回退 fp32 ({type(e).__name__})")
+                precision = "fp32"
+        elif precision == "bf16":
+            self.inference_bf16 = True
+
+        if compile_mode:
+            try:
+                with torch.no_grad(), self._autocast():
+                    if compile_mode == "script":
+                        with _legacy_api_warnings():
+                            model = torch.jit.freeze(torch.jit.trace(model, (sample_cats, sample_conts)))
+                    else:
+                        # dynamic=True: 末批行数不同也不会重新编译
+                        model = torch.compile(model, dynamic=True)
+                    # 预热：编译/优化在首次调用时发生，失败也在这里暴露
+                    model(sample_cats, sample_conts)
+            except Exception as e:
+                notes.append(f"{compile_mode} 不可用，已回退 ({type(e).__name__})")
+                compile_mode = None
+                model = self.model.eval() if precision != "int8" else self._quantize(self.model)
+
+        self.inference_model = model
+        desc = f"{precision}" + (f" + {compile_mode}" if compile_mode else "")
+        return desc + (f" ({'; '.join(notes)})" if notes else "")
+
+    @staticmethod
+    def _quantize(model):
+        with _legacy_api_warnings():
+            return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+    def _autocast(self):
+        if self.inference_bf16:
+            return torch.autocast(device_type='cpu', dtype=torch.bfloat16)
+        return contextlib.nullcontext()
+
+    def save_model(self, path):
+        """保存 预处理参数 + 权重，用于日后给新期间直接评分 (不再重新训练)"""
+        torch.save({
+            "processor": self.processor.get_state(),
+            "model": self.model.state_dict(),
+        }, path)
+
+    @classmethod
+    def load_model(cls, path, device=None):
+        """读取 save_model 生成的文件，返回可直接 predict_with_reason 的引擎"""
+        bundle = torch.load(path, map_location='cpu')
+        processor = AuditDataProcessor.from_state(bundle["processor"])
+        engine = cls(processor, device)
+        engine.model = AuditAutoEncoder(
+            num_cont=len(processor.cont_cols),
+            cat_dims=processor.cat_dims,
+            emb_dims=processor.emb_dims
+        )
+        engine.model.load_state_dict(bundle["model"])
+        engine.model.to(engine.device).eval()
+        return engine
         
-    def train_model(self, cats, conts, epochs=100, lr=0.001, log_callback=None, stop_event=None):
+    def train_model(self, cats, conts, epochs=100, lr=0.001, log_callback=None, stop_event=None,
+                    batch_size=4096, val_ratio=0.1, patience=15, min_delta=1e-4, seed=42):
+        """
+        小批量训练 (内存占用只与 batch_size 有关，与序时账行数无关)
+        batch_size: 每批行数；每轮按随机顺序遍历全部训练行
+        val_ratio:  留出做验证集的比例 (行数不足 VAL_MIN_ROWS 时不留验证集，改为监控训练 Loss)
+        patience:   监控 Loss 连续 patience 轮未下降 min_delta 即提前停止，并恢复最佳权重
+        学习率按 ReduceLROnPlateau 在 Loss 停滞时减半。
+        返回 (是否完成, 最佳轮次的训练 Loss)
+        """
         self.model = AuditAutoEncoder(
             num_cont=len(self.processor.cont_cols),
             cat_dims=self.processor.cat_dims,
             emb_dims=self.processor.emb_dims
         ).to(self.device)
+        self.inference_model = None
+        self.inference_bf16 = False
         
         optimizer = optim.Adam(self.model.parameters(), lr=lr)
+        scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, factor=0.5, patience=max(1, patience // 3))
         criterion = nn.MSELoss()
+
+        # 划分训练/验证集 (只打乱下标，不复制数据)
+        n_rows = len(cats) if cats.numel() > 0 else len(conts)
+        generator = torch.Generator().manual_seed(seed)
+        perm = torch.randperm(n_rows, generator=generator)
+        n_val = int(n_rows * val_ratio) if n_rows >= self.VAL_MIN_ROWS else 0
+        val_idx, train_idx = perm[:n_val], perm[n_val:]
         
         self.model.train()
         
-        final_loss = 0.0
+        best_loss = float('inf')
+        best_state = None
+        best_train_loss = 0.0
+        stale_epochs = 0
         
         for epoch in range(epochs):
-            if stop_event and stop_event.is_set():
-                if log_callback: log_callback("训练中断")
-                return False, None
+            # 每轮重新打乱训练行
+            order = train_idx[torch.randperm(len(train_idx), generator=generator)]
+            total_loss, total_rows = 0.0, 0
+            for batch_idx in torch.split(order, batch_size):
+                if stop_event and stop_event.is_set():
+                    if log_callback: log_callback("训练中断")
+                    return False, None
+                # BatchNorm 训练模式下单行批次无法计算方差，直接跳过
+                if len(batch_idx) < 2: continue
+                batch_idx = batch_idx.to(self.device)
                 
-            optimizer.zero_grad()
-            decoded, original = self.model(cats, conts)
-            loss = criterion(decoded, original)
-            loss.backward()
-            optimizer.step()
+                optimizer.zero_grad()
+                decoded, original = self.model(self._take(cats, batch_idx), self._take(conts, batch_idx))
+                loss = criterion(decoded, original)
+                loss.backward()
+                optimizer.step()
+
+                total_loss += loss.item() * len(batch_idx)
+                total_rows += len(batch_idx)
             
-            final_loss = loss.item()
+            train_loss = total_loss / max(total_rows, 1)
+            monitor_loss = self._evaluate(cats, conts, val_idx, batch_size, criterion) if n_val > 0 else train_loss
+            scheduler.step(monitor_loss)
+
+            if monitor_loss < best_loss - min_delta:
+                best_loss = monitor_loss
+                best_train_loss = train_loss
+                best_state = {k: v.detach().clone() for k, v in self.model.state_dict().items()}
+                stale_epochs = 0
+            else:
+                stale_epochs += 1
             
             # === 【修改点】逻辑优化：每10轮打印一次，且最后一轮必须打印 ===
             current_round = epoch + 1
-            if log_callback and (current_round % 10 == 0 or current_round == epochs):
-                log_callback(f"Training Epoch {current_round}/{epochs} | Loss: {final_loss:.4f}")
-        
-        return True, final_loss
+            logged = current_round % 10 == 0 or current_round == epochs
+            if log_callback and logged:
+                log_callback(f"Training Epoch {current_round}/{epochs} | Loss: {train_loss:.4f}")
+
+            if stale_epochs >= patience:
+                if log_callback:
+                    # 早停的这一轮若已按周期打印过，不再重复
+                    if not logged: log_callback(f"Training Epoch {current_round}/{epochs} | Loss: {train_loss:.4f}")
+                    log_callback(f"早停：{'验证集' if n_val > 0 else '训练'} Loss 连续 {patience} 轮未下降 (最佳 {best_loss:.4f})")
+                break
+
+        # 恢复监控 Loss 最低的那一轮权重
+        if best_state is not None: self.model.load_state_dict(best_state)
+        return True, best_train_loss
+
+    @staticmethod
+    def _take(tensor, idx):
+        """按下标取一批 (空张量表示没有该类特征，原样返回)"""
+        return tensor[idx] if tensor.numel() > 0 else tensor
 
-    def predict_with_reason(self, cats, conts, raw_df=None, amt_cols=None, threshold=0):
+    def _evaluate(self, cats, conts, idx, batch_size, criterion):
+        """分批计算验证集 Loss (eval 模式，不记录梯度)"""
         self.model.eval()
+        total_loss = 0.0
         with torch.no_grad():
-            decoded, original = self.model(cats, conts)
-            diff_square = (decoded - original) ** 2
-            
-            # 归因分析
-            num_cont = len(self.processor.cont_cols)
-            split_idx = original.shape[1] - num_cont
-            
-            if split_idx > 0:
-                diff_cat = diff_square[:, :split_idx].mean(dim=1)
-            else:
-                diff_cat = torch.zeros(diff_square.shape[0]).to(self.device)
-                
-            if num_cont > 0:
-                diff_cont = diff_square[:, split_idx:].mean(dim=1)
-            else:
-                diff_cont = torch.zeros(diff_square.shape[0]).to(self.device)
-            
-            scores = diff_square.mean(dim=1)
-            
-            reasons = []
-            v_cat = diff_cat.cpu().numpy()
-            v_cont = diff_cont.cpu().numpy()
-            
-            for c, a in zip(v_cat, v_cont):
-                if a > c: reasons.append("金额异常")
-                else: reasons.append("科目/组合模式异常")
+            for batch_idx in torch.split(idx, batch_size):
+                batch_idx = batch_idx.to(self.device)
+                decoded, original = self.model(self._take(cats, batch_idx), self._take(conts, batch_idx))
+                total_loss += criterion(decoded, original).item() * len(batch_idx)
+        self.model.train()
+        return total_loss / max(len(idx), 1)
+
+    def predict_with_reason(self, cats, conts, raw_df=None, amt_cols=None, threshold=0, batch_size=65536, top_k=3):
+        """
+        分批评分：每批前向一次，结果写入预分配数组 (内存占用与 batch_size 有关，与行数无关)
+        归因：同一次前向里按特征把平方误差分段求和 (每个分类列对应一段嵌入宽度，每个金额列一格)，
+        得到各特征的误差贡献；再比较 "类别部分误差" 与 "金额部分误差"，向量化生成原因标签。
+        每行贡献最大的 top_k 个特征及占比保存在 self.attribution，可用 describe_attribution() 转成文字。
+        返回 (scores: float32 数组, reasons: object 数组)
+        """
+        self.model.eval()
+        model = self.inference_model if self.inference_model is not None else self.model
+        n_rows = len(cats) if cats.numel() > 0 else len(conts)
+        num_cont = len(self.processor.cont_cols)
+        num_cat_feat = len(self.processor.cat_cols)
 
-            scores = scores.cpu().numpy()
+        # 段号：第 j 个输入维度属于第几个特征
+        feature_names = list(self.processor.cat_cols) + list(self.processor.cont_cols)
+        widths = torch.tensor(list(self.processor.emb_dims) + [1] * num_cont)
+        segments = torch.repeat_interleave(torch.arange(len(feature_names)), widths).to(self.device)
+        top_k = min(top_k, len(feature_names))
+
+        scores = np.empty(n_rows, dtype=np.float32)
+        v_cat = np.zeros(n_rows, dtype=np.float32)
+        v_cont = np.zeros(n_rows, dtype=np.float32)
+        top_idx = np.zeros((n_rows, top_k), dtype=np.int16)
+        top_share = np.zeros((n_rows, top_k), dtype=np.float32)
+
+        with torch.no_grad(), self._autocast():
+            for start in range(0, n_rows, batch_size):
+                end = min(start + batch_size, n_rows)
+                batch_cats = cats[start:end] if cats.numel() > 0 else cats
+                batch_conts = conts[start:end] if conts.numel() > 0 else conts
+
+                decoded, original = model(batch_cats, batch_conts)
+                # bf16 推理时误差仍按 fp32 计算，避免平方后精度损失
+                diff_square = (decoded.float() - original.float()) ** 2
+                scores[start:end] = diff_square.mean(dim=1).cpu().numpy()
+
+                # 分段求和：[行, 输入维度] -> [行, 特征]
+                feat_err = torch.zeros(end - start, len(feature_names), device=diff_square.device)
+                feat_err.index_add_(1, segments, diff_square)
+
+                # 归因分析：前半段为嵌入 (科目/组合)，后 num_cont 列为金额
+                split_idx = original.shape[1] - num_cont
+                if split_idx > 0:
+                    v_cat[start:end] = (feat_err[:, :num_cat_feat].sum(dim=1) / split_idx).cpu().numpy()
+                if num_cont > 0:
+                    v_cont[start:end] = (feat_err[:, num_cat_feat:].sum(dim=1) / num_cont).cpu().numpy()
+
+                if top_k > 0:
+                    share = feat_err / feat_err.sum(dim=1, keepdim=True).clamp_min(1e-12)
+                    values, indices = torch.topk(share, top_k, dim=1)
+                    top_idx[start:end] = indices.cpu().numpy()
+                    top_share[start:end] = values.cpu().numpy()
+
+        self.attribution = {"features": feature_names, "top_idx": top_idx, "top_share": top_share}
+        reasons = np.where(v_cont > v_cat, "金额异常", "科目/组合模式异常").astype(object)
 
         # 重要性水平过滤逻辑 (此处仅做计算，统计逻辑放到UI层展示更灵活)
         if threshold > 0 and raw_df is not None and amt_cols:
             max_abs_amt = raw_df[amt_cols].abs().max(axis=1).fillna(0).values
             mask_small = max_abs_amt < threshold
             scores[mask_small] = 0.0
-            for i in range(len(reasons)):
-                if mask_small[i]: reasons[i] = "忽略(金额小)"
+            reasons[mask_small] = "忽略(金额小)"
             
-        return scores, reasons
\ No newline at end of file
+        return scores, reasons
+
+    def describe_attribution(self, min_share=0.05):
+        """
+        把 self.attribution 转成每行一段文字，如 "科目名称 62% | 借方金额 30%" (按列向量化拼接，不逐行循环)
+        占比低于 min_share 的特征不列出。
+        """
+        if self.attribution is None: return None
+        names = np.array(self.attribution["features"], dtype=object)
+        top_idx, top_share = self.attribution["top_idx"], self.attribution["top_share"]
+        n_rows = len(top_idx)
+        text = np.full(n_rows, "", dtype=object)
+        if n_rows == 0: return text
+
+        percent_text = np.array([f" {p}%" for p in range(101)], dtype=object)
+        for j in range(top_idx.shape[1]):
+            percent = np.clip(np.rint(top_share[:, j] * 100), 0, 100).astype(np.int64)
+            part = names[top_idx[:, j]] + percent_text[percent]
+            keep = top_share[:, j] >= min_share
+            sep = np.where(text == "", "", " | ").astype(object)
+            text = np.where(keep, text + sep + part, text)
+        return text
+
+@contextlib.contextmanager
+def _legacy_api_warnings():
+    """
+    torch.ao.quantization 动态量化与 TorchScript (trace / freeze) 在新版 PyTorch 中已标记弃用，
+    但目前仍是 CPU 上无额外依赖的最快方案；这里只屏蔽对应的弃用提示。
+    接口被移除后 optimize_for_cpu 会回退 (int8 -> fp32，script -> 原模型) 并在模式说明里注明。
+    """
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message=r".*torch\.ao\.quantization is deprecated", category=DeprecationWarning)
+        warnings.filterwarnings("ignore", message=r".*quantized tensor creation functions", category=UserWarning)
+        warnings.filterwarnings("ignore", message=r".*torch\.jit\.\w+` is deprecated", category=FutureWarning)
+        yield
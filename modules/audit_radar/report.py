@@ -0,0 +1,110 @@
+import importlib.util
+import os
+
+import numpy as np
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import ColorScaleRule
+from openpyxl.styles import Alignment, Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+class RadarReportWriter:
+    """
+    审计雷达报告导出
+    1. Top-N 工作表：openpyxl write_only 模式逐行落盘，内存与行数无关；
+       评分列加色阶条件格式 (白 -> 红)，表头冻结 + 自动筛选。
+    2. 全量结果：CSV (utf-8-sig，Excel 可直接打开) 或 Parquet (需安装 pyarrow / fastparquet，没有则回退 CSV)，
+       不截断任何一行。
+    排序只算一次下标 (稳定排序，同分保持原顺序)，不整表重排 DataFrame。
+    """
+    SHEET_NAME = "异常分录Top"
+    SCORE_COL = "异常评分"
+    FULL_FORMATS = ("csv", "parquet")
+    # Excel 单表行数上限 (含表头)
+    EXCEL_MAX_ROWS = 1048576
+
+    def __init__(self, top_n=100000, full_format="csv"):
+        if full_format not in self.FULL_FORMATS + (None,):
+            raise ValueError(f"不支持的全量导出格式: {full_format}")
+        self.top_n = min(top_n, self.EXCEL_MAX_ROWS - 1)
+        self.full_format = full_format
+
+    @staticmethod
+    def parquet_available():
+        return any(importlib.util.find_spec(m) is not None for m in ("pyarrow", "fastparquet"))
+
+    def export(self, df, base_path, log=print, order_by=None):
+        """
+        df: 已含 异常评分 / 异常主要原因 列的序时账 (不会被修改)
+        base_path: 不含扩展名的输出路径，如 "data_审计雷达报告"
+        order_by: 可选排序依据 (与 df 等长的数组，如未取整的原始评分)，默认按 异常评分 列；
+                  展示用的评分取整后会出现并列，用原始评分排序才能保持 Top-N 的真实先后
+        返回写出的文件路径列表 (第一个为 Top-N 工作簿)
+        """
+        scores = df[self.SCORE_COL] if order_by is None else order_by
+        order = np.argsort(-np.asarray(scores, dtype=np.float64), kind="stable")
+        written = []
+
+        xlsx_path = f"{base_path}.xlsx"
+        top = df.iloc[order[:self.top_n]]
+        self._write_top_sheet(top, xlsx_path)
+        written.append(xlsx_path)
+        if len(df) > self.top_n:
+            log(f"  Top 工作表: 评分最高的 {len(top)} / {len(df)} 行 (全量见下方文件)")
+        else:
+            log(f"  Top 工作表: 全部 {len(top)} 行")
+
+        if self.full_format:
+            full_format = self.full_format
+            if full_format == "parquet" and not self.parquet_available():
+                log("  未安装 pyarrow，全量结果改为 CSV")
+                full_format = "csv"
+            full = df.iloc[order]
+            if full_format == "parquet":
+                full_path = f"{base_path}_全量.parquet"
+                # 列名统一为字符串，混合类型的对象列转成字符串 (Parquet 要求单列同类型)
+                full = full.rename(columns=str)
+                obj_cols = full.select_dtypes(include="object").columns
+                full = full.astype({c: "string" for c in obj_cols})
+                full.to_parquet(full_path, index=False)
+            else:
+                full_path = f"{base_path}_全量.csv"
+                full.to_csv(full_path, index=False, encoding="utf-8-sig", chunksize=100000)
+            written.append(full_path)
+            log(f"  全量结果: {len(full)} 行 -> {os.path.basename(full_path)}")
+        return written
+
+    def _write_top_sheet(self, top, path):
+        wb = Workbook(write_only=True)
+        ws = wb.create_sheet(self.SHEET_NAME)
+        columns = [str(c) for c in top.columns]
+        # 列宽必须在写入第一行之前设置
+        for i, name in enumerate(columns, 1):
+            ws.column_dimensions[get_column_letter(i)].width = min(40, max(10, len(name) * 2 + 2))
+        ws.freeze_panes = "A2"
+
+        font_header = Font(bold=True, color="FFFFFF")
+        fill_header = PatternFill(start_color="D63031", end_color="D63031", fill_type="solid")
+        align_header = Alignment(horizontal="center", vertical="center")
+        header = []
+        for name in columns:
+            cell = WriteOnlyCell(ws, value=name)
+            cell.font, cell.fill, cell.alignment = font_header, fill_header, align_header
+            header.append(cell)
+        ws.append(header)
+
+        # 空值写成空单元格 (openpyxl 会把 NaN 原样写入，Excel 打开时报错)
+        values = top.astype(object).where(top.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            ws.append(row)
+
+        last_row = len(top) + 1
+        last_col = get_column_letter(len(columns))
+        if len(columns): ws.auto_filter.ref = f"A1:{last_col}{last_row}"
+        if self.SCORE_COL in columns and len(top):
+            col = get_column_letter(columns.index(self.SCORE_COL) + 1)
+            ws.conditional_formatting.add(f"{col}2:{col}{last_row}", ColorScaleRule(
+                start_type="num", start_value=0, start_color="FFFFFF",
+                mid_type="percentile", mid_value=90, mid_color="FAB1A0",
+                end_type="max", end_color="D63031"))
+        wb.save(path)
@@ -0,0 +1,85 @@
+import re
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+class SummaryFilter:
+    """
+    摘要关键词过滤引擎 (结果与逐行 difflib 比对完全一致)
+    1. 去重：只对不同的摘要文本计算一次，再按编码广播回每一行；判定结果按文本缓存，可跨次复用。
+    2. 精确包含：所有关键词编译成一个正则 (关键词转义后用 | 连接)，一次扫描完成。
+    3. 相似度 (严格度 < 0.9 时)：只处理未命中的文本，逐级用上界剪枝：
+       长度上界 (向量化，等价 real_quick_ratio) -> quick_ratio -> ratio。
+       SequenceMatcher 的 seq2 固定为摘要文本，其索引只建一次，各关键词只替换 seq1。
+    """
+    # 严格度达到该值时只做精确包含匹配 (与原界面逻辑一致)
+    EXACT_ONLY_THRESHOLD = 0.9
+
+    def __init__(self, keywords, sim_threshold):
+        self.keywords = [kw.lower() for kw in keywords if kw]
+        self.sim_threshold = sim_threshold
+        self.exact_only = sim_threshold >= self.EXACT_ONLY_THRESHOLD
+        # 长关键词优先，避免被短关键词的前缀抢先匹配 (只影响效率，不影响结果)
+        ordered = sorted(set(self.keywords), key=len, reverse=True)
+        self.pattern = re.compile("|".join(re.escape(kw) for kw in ordered)) if ordered else None
+        self._cache = {}  # {摘要文本: 是否命中}
+
+    def match(self, texts, active=None):
+        """
+        texts:  摘要列 (Series)，按原逻辑 astype(str).lower().fillna("") 后比对
+        active: 可选布尔数组，只判定为 True 的行 (如评分非 0 的行)
+        返回布尔数组：命中过滤规则的行
+        """
+        n_rows = len(texts)
+        if not self.keywords or n_rows == 0: return np.zeros(n_rows, dtype=bool)
+
+        lowered = texts.astype(str).str.lower().fillna("")
+        codes, uniques = pd.factorize(lowered)
+        if active is not None:
+            needed = np.zeros(len(uniques), dtype=bool)
+            needed[codes[np.asarray(active, dtype=bool)]] = True
+        else:
+            needed = np.ones(len(uniques), dtype=bool)
+
+        unique_hit = np.zeros(len(uniques), dtype=bool)
+        todo = []
+        for i in np.flatnonzero(needed):
+            cached = self._cache.get(uniques[i])
+            if cached is None: todo.append(i)
+            else: unique_hit[i] = cached
+
+        if todo:
+            todo = np.array(todo)
+            hits = self._match_unique(pd.Series(uniques[todo], dtype=object))
+            unique_hit[todo] = hits
+            self._cache.update(zip(uniques[todo], hits.tolist()))
+
+        matched = unique_hit[codes]
+        if active is not None: matched &= np.asarray(active, dtype=bool)
+        return matched
+
+    def _match_unique(self, texts):
+        """对去重后的文本判定是否命中 (返回布尔数组)"""
+        hits = texts.str.contains(self.pattern, regex=True).to_numpy(dtype=bool, copy=True)
+        if self.exact_only: return hits
+
+        rest = np.flatnonzero(~hits)
+        if len(rest) == 0: return hits
+        lengths = texts.iloc[rest].str.len().to_numpy()
+
+        sim = self.sim_threshold
+        kw_lengths = np.array([len(kw) for kw in self.keywords])
+        # 长度上界：ratio <= 2*min(k, L)/(k+L)，达不到阈值的 (文本, 关键词) 组合直接跳过
+        bound = 2.0 * np.minimum(kw_lengths, lengths[:, None]) / np.maximum(kw_lengths + lengths[:, None], 1)
+        candidates = bound >= sim
+        matcher = SequenceMatcher(None)
+        for j in np.flatnonzero(candidates.any(axis=1)):
+            # seq2 (摘要文本) 每条只设一次，其索引供所有关键词复用；关键词只替换 seq1
+            matcher.set_seq2(texts.iat[rest[j]])
+            for k in np.flatnonzero(candidates[j]):
+                matcher.set_seq1(self.keywords[k])
+                if matcher.quick_ratio() >= sim and matcher.ratio() >= sim:
+                    hits[rest[j]] = True
+                    break
+        return hits
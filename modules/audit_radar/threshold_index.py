@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+class AmountThresholdIndex:
+    """
+    重要性水平测算索引 (只扫描一次数据)
+    建立：每行 "各金额列绝对值的最大值" 升序排列，并按同一顺序对每个金额列的原值做前缀和。
+    查询：阈值 t 下被忽略的行 = 最大金额 < t 的行，二分查找得到行数 k，
+          各列被忽略总额 = 前缀和[k]；任意多个阈值 (阈值曲线) 一次 searchsorted 完成。
+    """
+    def __init__(self, df, amt_cols):
+        self.amt_cols = list(amt_cols)
+        values = df[self.amt_cols].apply(pd.to_numeric, errors='coerce')
+        max_abs = values.abs().max(axis=1).fillna(0).to_numpy(dtype=np.float64)
+        order = np.argsort(max_abs, kind='stable')
+        self.sorted_max = max_abs[order]
+        self.total_rows = len(max_abs)
+        # 前缀和前面补 0：cumsums[col][k] 即最小的 k 行之和
+        self.cumsums = {}
+        for col in self.amt_cols:
+            col_values = values[col].fillna(0).to_numpy(dtype=np.float64)[order]
+            self.cumsums[col] = np.concatenate(([0.0], np.cumsum(col_values)))
+
+    def matches(self, amt_cols):
+        """金额列勾选变化后索引失效"""
+        return list(amt_cols) == self.amt_cols
+
+    def count_below(self, thresholds):
+        """最大金额 < 阈值 的行数 (阈值可为数组)"""
+        return np.searchsorted(self.sorted_max, thresholds, side='left')
+
+    def query(self, threshold):
+        """返回 (被忽略行数, {金额列: 被忽略总额})"""
+        k = int(self.count_below(threshold))
+        return k, {col: float(cs[k]) for col, cs in self.cumsums.items()}
+
+    def curve(self, thresholds=None, points=9):
+        """
+        阈值曲线：各阈值下被忽略的 行数 / 占比。
+        未指定阈值时取覆盖数据主体 (5% ~ 95% 分位) 的整数档位 1/2/5 x 10^n，最多 points 个。
+        返回 DataFrame [阈值, 忽略行数, 忽略占比%]
+        """
+        if thresholds is None: thresholds = self.nice_thresholds(points)
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        counts = self.count_below(thresholds)
+        ratio = counts / self.total_rows * 100 if self.total_rows else np.zeros(len(thresholds))
+        return pd.DataFrame({"阈值": thresholds, "忽略行数": counts, "忽略占比%": np.round(ratio, 1)})
+
+    def nice_thresholds(self, points=9):
+        positive = self.sorted_max[self.sorted_max > 0]
+        if len(positive) == 0: return np.array([])
+        low, high = np.quantile(positive, [0.05, 0.95])
+        exponents = np.arange(np.floor(np.log10(max(low, 1e-2))), np.ceil(np.log10(max(high, 1e-2))) + 1)
+        candidates = (np.array([1, 2, 5]) * 10.0 ** exponents[:, None]).ravel()
+        candidates = candidates[(candidates >= low) & (candidates <= high)]
+        if len(candidates) > points:
+            candidates = candidates[np.linspace(0, len(candidates) - 1, points).round().astype(int)]
+        return candidates
@@ -3,11 +3,14 @@ from tkinter import filedialog, messagebox
 import pandas as pd
 import threading
 import os
-import torch
-import difflib
 
-from modules.audit_radar.data_processor import AuditDataProcessor
-from modules.audit_radar.engine import AuditEngine
+from modules.audit_radar.text_filter import SummaryFilter
+from modules.audit_radar.report import RadarReportWriter
+from modules.audit_radar.baseline import BaselineScorer
+from modules.audit_radar.threshold_index import AmountThresholdIndex
+from modules.path_manager import get_user_data_dir
+# torch 及审计雷达引擎 (AuditEngine / AuditDataProcessor) 体积大、导入慢，
+# 不在这里导入：首次打开本页面时后台预热 (warm_up)，真正用到的函数里再导入
 
 # --- 风格配置 ---
 THEME_COLOR = "#007AFF"
@@ -21,6 +24,13 @@ FONT_BODY = ("Microsoft YaHei", 12)
 FONT_BOLD = ("Microsoft YaHei", 12, "bold")
 FONT_LOG = ("Microsoft YaHei", 13) 
 
+# CPU 推理精度 (界面文字 -> AuditEngine.optimize_for_cpu 参数)
+CPU_PRECISIONS = {"FP32 (标准)": "fp32", "BF16 (混合精度)": "bf16", "INT8 (动态量化)": "int8"}
+# 全量结果导出格式 (界面文字 -> RadarReportWriter 参数)
+FULL_EXPORT_FORMATS = {"全量 CSV": "csv", "全量 Parquet": "parquet", "不导出全量": None}
+# 检测方法 (统计基线免训练，可单独使用或与自编码器融合)
+DETECTORS = {"自编码器": "ae", "统计基线 (免训练)": "baseline", "自编码器 + 统计基线": "blend"}
+
 class AuditRadarModule:
     def __init__(self):
         self.name = "会计分录测试"
@@ -29,9 +39,22 @@ class AuditRadarModule:
         self.chk_vars_amt = {}
         self.chk_vars_cat = {}
         self.filter_keywords = [] 
+        self.engine = None          # 最近一次训练/载入的模型 (可保存)
+        self.use_saved_model = False  # True: 直接用载入的模型评分，不再训练
+        self._amount_index = None     # 测算重要性水平用的金额索引 (加载新文件 / 金额列变化时重建)
+
+    @staticmethod
+    def warm_up():
+        """后台预加载 torch 及审计雷达引擎 (只导入模块，不做计算)"""
+        try:
+            import torch
+            import modules.audit_radar.engine
+        except ImportError:
+            pass
 
     def render(self, parent_frame):
         for w in parent_frame.winfo_children(): w.destroy()
+        threading.Thread(target=self.warm_up, daemon=True).start()
         
         self.main_scroll = ctk.CTkScrollableFrame(
             parent_frame, 
@@ -100,12 +123,44 @@ class AuditRadarModule:
         
         # === 【新增】测算按钮 ===
         ctk.CTkButton(r1, text="🔍 测算过滤量", command=self.calculate_threshold_stats, width=90, height=28, fg_color="#F0F5FA", text_color=THEME_COLOR, hover_color="#E1EBF5").pack(side="left", padx=5)
+        # 测算过一次后，修改阈值即时显示预计忽略行数 (二分查找，无需重新扫描数据)
+        self.lbl_threshold_hint = ctk.CTkLabel(r1, text="", text_color="gray", font=FONT_BODY); self.lbl_threshold_hint.pack(side="left", padx=5)
+        self.entry_threshold.bind("<KeyRelease>", lambda e: self.update_threshold_hint())
 
         # 训练轮数
         ctk.CTkLabel(r1, text="训练轮数:", text_color="#333", width=70, anchor="w", font=FONT_BODY).pack(side="left", padx=(20, 0))
         self.slider_epoch = ctk.CTkSlider(r1, from_=50, to=300, number_of_steps=5, width=120, command=self.update_epoch_label); self.slider_epoch.set(150); self.slider_epoch.pack(side="left", padx=5)
         self.lbl_epoch = ctk.CTkLabel(r1, text="150 轮", text_color=THEME_COLOR, font=FONT_BOLD, width=50); self.lbl_epoch.pack(side="left", padx=5)
 
+        # --- 检测方法 ---
+        r_det = ctk.CTkFrame(parent, fg_color="transparent"); r_det.pack(fill="x", pady=5)
+        ctk.CTkLabel(r_det, text="检测方法:", text_color="#333", width=80, anchor="w", font=FONT_BODY).pack(side="left")
+        self.opt_detector = ctk.CTkOptionMenu(r_det, values=list(DETECTORS.keys()), width=170, fg_color="#F0F5FA", text_color="#333", button_color="#DDD", button_hover_color="#CCC"); self.opt_detector.set("自编码器"); self.opt_detector.pack(side="left", padx=5)
+        ctk.CTkLabel(r_det, text="统计基线：科目稳健Z / 罕见组合 / 本福特，秒级完成", text_color="gray").pack(side="left", padx=5)
+
+        # --- CPU 性能模式 (无显卡时生效) ---
+        r_cpu = ctk.CTkFrame(parent, fg_color="transparent"); r_cpu.pack(fill="x", pady=5)
+        ctk.CTkLabel(r_cpu, text="CPU 推理:", text_color="#333", width=80, anchor="w", font=FONT_BODY).pack(side="left")
+        self.opt_precision = ctk.CTkOptionMenu(r_cpu, values=list(CPU_PRECISIONS.keys()), width=130, fg_color="#F0F5FA", text_color="#333", button_color="#DDD", button_hover_color="#CCC", command=self.on_precision_change); self.opt_precision.set("FP32 (标准)"); self.opt_precision.pack(side="left", padx=5)
+        self.var_script = ctk.BooleanVar(value=False)
+        self.chk_script = ctk.CTkCheckBox(r_cpu, text="TorchScript 编译", variable=self.var_script, text_color="#333", font=FONT_BODY); self.chk_script.pack(side="left", padx=(15, 0))
+
+        # --- 大账套抽样训练 (评分仍覆盖全部行) ---
+        r_sample = ctk.CTkFrame(parent, fg_color="transparent"); r_sample.pack(fill="x", pady=5)
+        self.var_sample = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(r_sample, text="抽样训练", variable=self.var_sample, text_color="#333", font=FONT_BODY, width=80).pack(side="left")
+        ctk.CTkLabel(r_sample, text="样本上限:", text_color="#333", font=FONT_BODY).pack(side="left", padx=(10, 0))
+        self.entry_sample = ctk.CTkEntry(r_sample, width=90, border_color="#CCC"); self.entry_sample.insert(0, "200000"); self.entry_sample.pack(side="left", padx=5)
+        ctk.CTkLabel(r_sample, text="行 (按科目×月份分层抽样，评分仍覆盖全部行)", text_color="gray").pack(side="left")
+
+        # --- 报告导出 ---
+        r_report = ctk.CTkFrame(parent, fg_color="transparent"); r_report.pack(fill="x", pady=5)
+        ctk.CTkLabel(r_report, text="报告导出:", text_color="#333", width=80, anchor="w", font=FONT_BODY).pack(side="left")
+        ctk.CTkLabel(r_report, text="Excel 前", text_color="#333", font=FONT_BODY).pack(side="left")
+        self.entry_top_n = ctk.CTkEntry(r_report, width=90, border_color="#CCC"); self.entry_top_n.insert(0, "100000"); self.entry_top_n.pack(side="left", padx=5)
+        ctk.CTkLabel(r_report, text="行 +", text_color="#333", font=FONT_BODY).pack(side="left")
+        self.opt_full_export = ctk.CTkOptionMenu(r_report, values=list(FULL_EXPORT_FORMATS.keys()), width=120, fg_color="#F0F5FA", text_color="#333", button_color="#DDD", button_hover_color="#CCC"); self.opt_full_export.set("全量 CSV"); self.opt_full_export.pack(side="left", padx=5)
+
         ctk.CTkFrame(parent, height=2, fg_color="#F0F0F0").pack(fill="x", pady=10)
         ctk.CTkLabel(parent, text="🧹 摘要关键词过滤 (排除无意义分录，如结转损益)", font=FONT_BOLD, text_color="#333").pack(anchor="w", pady=(0, 5))
         r2 = ctk.CTkFrame(parent, fg_color="transparent"); r2.pack(fill="x")
@@ -121,7 +176,13 @@ class AuditRadarModule:
 
     def render_step4(self, parent):
         self.btn_run = ctk.CTkButton(parent, text="🚀 启动雷达扫描", command=self.run_analysis, height=45, font=("Microsoft YaHei", 16, "bold"), fg_color=WARN_COLOR)
-        self.btn_run.pack(fill="x", pady=(5, 15))
+        self.btn_run.pack(fill="x", pady=(5, 5))
+        # 模型复用：去年全年训练一次，之后每月直接评分
+        r_model = ctk.CTkFrame(parent, fg_color="transparent"); r_model.pack(fill="x", pady=(0, 10))
+        self.btn_save_model = ctk.CTkButton(r_model, text="💾 保存模型", command=self.save_model, width=100, height=28, fg_color="#F0F5FA", text_color=THEME_COLOR, hover_color="#E1EBF5", state="disabled"); self.btn_save_model.pack(side="left")
+        ctk.CTkButton(r_model, text="📂 载入模型", command=self.load_model, width=100, height=28, fg_color="#F0F5FA", text_color=THEME_COLOR, hover_color="#E1EBF5").pack(side="left", padx=5)
+        ctk.CTkButton(r_model, text="重新训练", command=self.unload_model, width=70, height=28, fg_color="transparent", text_color="gray", hover_color="#EEE").pack(side="left")
+        self.lbl_model = ctk.CTkLabel(r_model, text="每次扫描重新训练", text_color="gray", font=FONT_BODY); self.lbl_model.pack(side="left", padx=10)
         header = ctk.CTkFrame(parent, fg_color="#F0F0F0", height=28, corner_radius=4)
         header.pack(fill="x")
         ctk.CTkLabel(header, text="  运行日志 (Console)", font=("Arial", 11, "bold"), text_color="#666").place(rely=0.5, anchor="w")
@@ -131,6 +192,11 @@ class AuditRadarModule:
     # ... (辅助函数保持不变) ...
     def update_epoch_label(self, val): self.lbl_epoch.configure(text=f"{int(val)} 轮")
     def update_sim_label(self, val): self.lbl_sim.configure(text=f"{val:.1f}")
+    def on_precision_change(self, choice):
+        # bf16 不支持 TorchScript (见 AuditEngine.UNSUPPORTED_MODES)，选中时禁用编译选项
+        if CPU_PRECISIONS[choice] == "bf16":
+            self.var_script.set(False); self.chk_script.configure(state="disabled")
+        else: self.chk_script.configure(state="normal")
     def log(self, msg): self.log_box.insert("end", msg + "\n"); self.log_box.see("end")
     def add_filter_keyword(self, val=None):
         kw = val if val else self.entry_filter.get().strip()
@@ -162,6 +228,7 @@ class AuditRadarModule:
         threading.Thread(target=_read, daemon=True).start()
     def on_file_loaded(self, path, df):
         self.df = df; self.file_path = path
+        self._amount_index = None
         self.lbl_file.configure(text=os.path.basename(path), text_color="#333")
         self.btn_load.configure(state="normal", text="📂 重新选择")
         self.progress.stop(); self.progress.pack_forget()
@@ -186,12 +253,60 @@ class AuditRadarModule:
             var = ctk.BooleanVar(value=is_default_cat(col))
             ctk.CTkCheckBox(self.scroll_cat, text=str(col), variable=var, text_color="#333", font=FONT_BODY).pack(anchor="w", pady=2, padx=5)
             self.chk_vars_cat[col] = var
+    def _model_dir(self):
+        path = os.path.join(get_user_data_dir(), "radar_models")
+        os.makedirs(path, exist_ok=True)
+        return path
+    def save_model(self):
+        if self.engine is None: return messagebox.showwarning("提示", "请先完成一次扫描")
+        from modules.audit_radar.engine import AuditEngine
+        base = os.path.splitext(os.path.basename(self.file_path))[0] if self.file_path else "审计雷达"
+        p = filedialog.asksaveasfilename(defaultextension=AuditEngine.MODEL_EXT, initialdir=self._model_dir(), initialfile=f"{base}{AuditEngine.MODEL_EXT}", filetypes=[("审计雷达模型", f"*{AuditEngine.MODEL_EXT}")])
+        if not p: return
+        try:
+            self.engine.save_model(p); self.log(f"模型已保存: {os.path.basename(p)}")
+        except Exception as e: messagebox.showerror("保存失败", str(e))
+    def load_model(self):
+        import torch
+        from modules.audit_radar.engine import AuditEngine
+        p = filedialog.askopenfilename(initialdir=self._model_dir(), filetypes=[("审计雷达模型", f"*{AuditEngine.MODEL_EXT}")])
+        if not p: return
+        try:
+            device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+            self.engine = AuditEngine.load_model(p, device); self.use_saved_model = True
+        except Exception as e: return messagebox.showerror("载入失败", str(e))
+        proc = self.engine.processor
+        self.lbl_model.configure(text=f"使用模型: {os.path.basename(p)} (不再训练)", text_color=THEME_COLOR)
+        self.btn_save_model.configure(state="normal")
+        self.log(f"已载入模型: {os.path.basename(p)} | 金额列: {proc.cont_cols} | 特征列: {proc.cat_cols}")
+    def unload_model(self):
+        self.use_saved_model = False
+        self.lbl_model.configure(text="每次扫描重新训练", text_color="gray")
     def get_selected_cols(self):
         amt = [c for c, v in self.chk_vars_amt.items() if v.get()]
         cat = [c for c, v in self.chk_vars_cat.items() if v.get()]
         return amt, cat
 
     # === 【新增】测算按钮逻辑 ===
+    def _threshold_index(self, amt_cols):
+        """测算用的金额索引：首次测算时建立，加载新文件或金额列勾选变化后重建"""
+        if self._amount_index is None or not self._amount_index.matches(amt_cols):
+            self._amount_index = AmountThresholdIndex(self.df, amt_cols)
+        return self._amount_index
+
+    def update_threshold_hint(self):
+        """输入阈值时即时刷新预计忽略行数 (只用已建立的索引，不触发扫描)"""
+        amt_cols, _ = self.get_selected_cols()
+        if self._amount_index is None or not self._amount_index.matches(amt_cols):
+            return self.lbl_threshold_hint.configure(text="")
+        try:
+            threshold = float(self.entry_threshold.get())
+        except ValueError: return self.lbl_threshold_hint.configure(text="")
+        count_ignored, _ = self._amount_index.query(threshold)
+        total_count = self._amount_index.total_rows
+        ratio = count_ignored / total_count * 100 if total_count else 0.0
+        self.lbl_threshold_hint.configure(text=f"预计忽略 {count_ignored} 行 ({ratio:.1f}%)")
+
     def calculate_threshold_stats(self):
         if self.df is None: return messagebox.showwarning("提示", "请先加载文件")
         amt_cols, _ = self.get_selected_cols()
@@ -204,16 +319,11 @@ class AuditRadarModule:
         # 计算逻辑
         self.log(f"--- 测算: 阈值 {threshold} ---")
         
-        # 填充0，取绝对值，计算每行的最大值
-        max_abs = self.df[amt_cols].abs().max(axis=1).fillna(0)
-        
-        # 找出小于阈值的行
-        mask_ignored = max_abs < threshold
-        count_ignored = mask_ignored.sum()
-        total_count = len(self.df)
-        ratio = (count_ignored / total_count) * 100
-        
-        ignored_df = self.df[mask_ignored]
+        # 每行最大绝对金额已排好序，阈值查询只需二分查找
+        index = self._threshold_index(amt_cols)
+        count_ignored, ignored_sums = index.query(threshold)
+        total_count = index.total_rows
+        ratio = count_ignored / total_count * 100 if total_count else 0.0
         
         self.log(f"📉 预计过滤统计:")
         self.log(f"   总行数: {total_count}")
@@ -222,20 +332,49 @@ class AuditRadarModule:
         
         # 尝试统计金额
         for col in amt_cols:
-            col_sum = ignored_df[col].sum()
-            self.log(f"   [{col}] 被忽略总额: {col_sum:,.2f}")
+            self.log(f"   [{col}] 被忽略总额: {ignored_sums[col]:,.2f}")
+
+        # 阈值曲线：常用档位下的忽略比例，便于挑选重要性水平
+        curve = index.curve()
+        if len(curve):
+            self.log(f"📈 阈值曲线:")
+            for t, n, pct in curve.itertuples(index=False, name=None):
+                self.log(f"   < {t:,g} 元: 忽略 {n} 行 ({pct:.1f}%)")
         
         self.log("-" * 20)
+        self.update_threshold_hint()
+
+    def _score_baseline(self, amt_cols, cat_cols, threshold):
+        """统计基线评分 (免训练)，返回 (scores, reasons, scorer)"""
+        subject_col, counterparty_col, date_col = BaselineScorer.guess_columns(self.df, cat_cols)
+        self.log(f"统计基线评分... (科目: {subject_col} | 对方单位: {counterparty_col or '无'} | 日期: {date_col or '无'})")
+        baseline = BaselineScorer()
+        scores, reasons = baseline.score(self.df, amt_cols, subject_col, counterparty_col, date_col, threshold=threshold)
+        worst = sorted(baseline.benford_mad.items(), key=lambda x: -x[1])[:3]
+        worst = [(name, mad) for name, mad in worst if mad > BaselineScorer.BENFORD_MAD_THRESHOLD]
+        if worst: self.log("  本福特不符合科目: " + " | ".join(f"{name} (MAD {mad:.3f})" for name, mad in worst))
+        return scores, reasons, baseline
 
     # === 执行逻辑 ===
     def run_analysis(self):
         if self.df is None: return messagebox.showwarning("提示", "请加载文件")
         amt_cols, cat_cols = self.get_selected_cols()
-        if not amt_cols or not cat_cols: return messagebox.showwarning("提示", "请至少选择一列金额和一列特征")
+        if self.use_saved_model:
+            # 载入的模型决定使用哪些列
+            amt_cols, cat_cols = list(self.engine.processor.cont_cols), self.engine.processor.source_cat_cols()
+        elif not amt_cols or not cat_cols: return messagebox.showwarning("提示", "请至少选择一列金额和一列特征")
         try:
             threshold = float(self.entry_threshold.get())
             epochs = int(self.slider_epoch.get())
             sim_threshold = self.slider_sim.get()
+            precision = CPU_PRECISIONS[self.opt_precision.get()]
+            compile_mode = "script" if self.var_script.get() else None
+            sample_rows = int(self.entry_sample.get()) if self.var_sample.get() else None
+            if sample_rows is not None and sample_rows <= 0: raise ValueError
+            top_n = int(self.entry_top_n.get())
+            if top_n <= 0: raise ValueError
+            full_format = FULL_EXPORT_FORMATS[self.opt_full_export.get()]
+            detector = DETECTORS[self.opt_detector.get()]
         except: return messagebox.showwarning("提示", "参数格式错误")
 
         stop_event = None
@@ -245,70 +384,105 @@ class AuditRadarModule:
         
         def task():
             try:
-                self.log(f"特征列: {cat_cols}")
-                self.log(f"阈值: {threshold} | 轮数: {epochs}")
-                if self.filter_keywords: self.log(f"启用摘要过滤: {self.filter_keywords} (严格度: {sim_threshold:.1f})")
-                
-                processor = AuditDataProcessor()
-                self.log("数据清洗与预处理...")
-                processed_df = processor.preprocess(self.df, amt_cols, cat_cols)
-                
-                device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-                cat_t, cont_t = processor.get_tensors(processed_df, device)
-                
-                engine = AuditEngine(processor, device)
-                self.log("开始训练自编码器...")
-                success, final_loss = engine.train_model(cat_t, cont_t, epochs=epochs, log_callback=self.log, stop_event=stop_event)
-                if not success: return
+                import torch
+                from modules.audit_radar.data_processor import AuditDataProcessor
+                from modules.audit_radar.engine import AuditEngine
+                engine = None
+                if detector != "baseline":
+                    if not torch.cuda.is_available():
+                        self.log(f"CPU 模式: {AuditEngine.configure_cpu()} 线程")
+                    if self.use_saved_model:
+                        # 已保存的模型：只按训练时的参数转换数据，直接评分
+                        engine = self.engine
+                        processor = engine.processor
+                        self.log(f"使用已保存模型评分 (特征列: {processor.cat_cols})")
+                        self.log(f"阈值: {threshold}")
+                        if self.filter_keywords: self.log(f"启用摘要过滤: {self.filter_keywords} (严格度: {sim_threshold:.1f})")
+                        processed_df = processor.transform(self.df)
+                        for col, n in processor.unknown_counts.items():
+                            self.log(f"  [{col}] {n} 行为训练时未出现的取值，已归入 Unknown")
+                        cat_t, cont_t = processor.get_tensors(processed_df, engine.device)
+                    else:
+                        self.log(f"特征列: {cat_cols}")
+                        self.log(f"阈值: {threshold} | 轮数: {epochs}")
+                        if self.filter_keywords: self.log(f"启用摘要过滤: {self.filter_keywords} (严格度: {sim_threshold:.1f})")
+                    
+                        processor = AuditDataProcessor()
+                        self.log("数据清洗与预处理...")
+                        processed_df = processor.preprocess(self.df, amt_cols, cat_cols)
+                    
+                        device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+                        cat_t, cont_t = processor.get_tensors(processed_df, device)
+                    
+                        train_cat, train_cont = cat_t, cont_t
+                        if sample_rows:
+                            positions, stats = processor.stratified_sample(processed_df, sample_rows)
+                            self.log(f"分层抽样: 依据 {stats['strata_cols']} 共 {stats['strata']} 层 "
+                                     f"(最小 {stats['min_stratum']} 行 / 最大 {stats['max_stratum']} 行)")
+                            self.log(f"  -> 训练样本 {stats['sampled']} / {stats['rows']} 行，评分覆盖全部 {stats['rows']} 行")
+                            if stats['sampled'] < stats['rows']:
+                                idx = torch.as_tensor(positions, device=device)
+                                train_cat, train_cont = cat_t[idx], cont_t[idx]
 
-                # 诊断
-                self.log("-" * 30)
-                self.log(f"📢 模型诊断报告 (Final Loss: {final_loss:.4f})")
-                if final_loss > 1.0: self.log("🔴 状态：欠拟合 (模型没学会)\n💡 建议：增加训练轮数 (>200)")
-                elif final_loss < 0.1: self.log("🔵 状态：过拟合 (模型死记硬背)\n💡 建议：减少训练轮数")
-                else: self.log("🟢 状态：黄金区间 (最佳状态)\n💡 说明：模型已掌握核心规律，且保持了对异常的敏感度")
-                self.log("-" * 30)
+                        engine = AuditEngine(processor, device)
+                        self.log("开始训练自编码器...")
+                        success, final_loss = engine.train_model(train_cat, train_cont, epochs=epochs, log_callback=self.log, stop_event=stop_event)
+                        if not success: return
+                        self.engine = engine
+                        self.btn_save_model.configure(state="normal")
+
+                        # 诊断
+                        self.log("-" * 30)
+                        self.log(f"📢 模型诊断报告 (Final Loss: {final_loss:.4f})")
+                        if final_loss > 1.0: self.log("🔴 状态：欠拟合 (模型没学会)\n💡 建议：增加训练轮数 (>200)")
+                        elif final_loss < 0.1: self.log("🔵 状态：过拟合 (模型死记硬背)\n💡 建议：减少训练轮数")
+                        else: self.log("🟢 状态：黄金区间 (最佳状态)\n💡 说明：模型已掌握核心规律，且保持了对异常的敏感度")
+                        self.log("-" * 30)
 
-                self.log("正在评分与归因分析...")
-                scores, reasons = engine.predict_with_reason(cat_t, cont_t, raw_df=self.df, amt_cols=amt_cols, threshold=threshold)
+                    if engine.device.type == 'cpu':
+                        self.log(f"推理模式: {engine.optimize_for_cpu(cat_t[:256], cont_t[:256], precision, compile_mode)}")
+                    self.log("正在评分与归因分析...")
+                    scores, reasons = engine.predict_with_reason(cat_t, cont_t, raw_df=self.df, amt_cols=amt_cols, threshold=threshold)
+
+                if detector != "ae":
+                    base_scores, base_reasons, baseline = self._score_baseline(amt_cols, cat_cols, threshold)
+                    if engine is None:
+                        scores, reasons = base_scores, base_reasons
+                    else:
+                        self.log(f"融合自编码器与统计基线 (基线权重 {BaselineScorer.BLEND_WEIGHT:.0%})")
+                        scores = BaselineScorer.blend(scores, base_scores)
                 
                 # 摘要过滤
                 if self.filter_keywords and '摘要' in self.df.columns:
                     self.log("正在执行摘要过滤...")
-                    filtered_count = 0
-                    abstracts = self.df['摘要'].astype(str).str.lower().fillna("")
-                    for idx, txt in enumerate(abstracts):
-                        if scores[idx] == 0: continue
-                        is_match = False
-                        for kw in self.filter_keywords:
-                            kw_clean = kw.lower()
-                            if sim_threshold >= 0.9:
-                                if kw_clean in txt: is_match = True; break
-                            else:
-                                if kw_clean in txt: is_match = True; break
-                                ratio = difflib.SequenceMatcher(None, kw_clean, txt).ratio()
-                                if ratio >= sim_threshold: is_match = True; break
-                        if is_match:
-                            scores[idx] = 0.0; reasons[idx] = "忽略(摘要过滤)"; filtered_count += 1
+                    matched = SummaryFilter(self.filter_keywords, sim_threshold).match(self.df['摘要'], active=scores != 0)
+                    scores[matched] = 0.0; reasons[matched] = "忽略(摘要过滤)"
+                    filtered_count = int(matched.sum())
                     self.log(f"  -> 已根据摘要过滤掉 {filtered_count} 条记录")
 
-                self.df["异常评分"] = scores
-                if scores.max() > scores.min(): self.df["异常评分"] = (scores - scores.min()) / (scores.max() - scores.min()) * 100
+                # 展示用评分 (0~100，保留 2 位)；导出排序仍用未取整的 scores，避免取整后并列打乱 Top-N
+                if scores.max() > scores.min(): self.df["异常评分"] = ((scores - scores.min()) / (scores.max() - scores.min()) * 100).round(2)
                 else: self.df["异常评分"] = 0
-                
-                self.df["异常评分"] = self.df["异常评分"].apply(lambda x: round(x, 2))
                 self.df["异常主要原因"] = reasons
-                self.df = self.df.sort_values("异常评分", ascending=False)
+                # 清掉上一次扫描 (可能是另一种检测方法) 留下的明细列
+                self.df = self.df.drop(columns=["主要贡献特征", *BaselineScorer.REPORT_COLUMNS], errors="ignore")
+                # 逐特征归因 (评分时已一并算出)：被过滤/忽略的行留空
+                contributions = engine.describe_attribution() if engine is not None else None
+                if contributions is not None:
+                    contributions[scores == 0] = ""
+                    self.df["主要贡献特征"] = contributions
+                if detector != "ae":
+                    for col, values in baseline.component_frame().items(): self.df[col] = values.to_numpy()
                 
                 # === 【修改点】文件名优化 (去除原扩展名，覆盖旧文件) ===
-                # 原文件名: data.xlsx -> 新文件名: data_审计雷达报告.xlsx
+                # 原文件名: data.xlsx -> 新文件名: data_审计雷达报告.xlsx (+ data_审计雷达报告_全量.csv)
                 base_name = os.path.splitext(self.file_path)[0]
-                out_path = f"{base_name}_审计雷达报告.xlsx"
-                
-                self.df.head(100000).to_excel(out_path, index=False)
+                self.log("正在导出报告...")
+                written = RadarReportWriter(top_n, full_format).export(self.df, f"{base_name}_审计雷达报告", log=self.log, order_by=scores)
+                out_path = written[0]
                 
                 self.log("-" * 30)
-                self.log(f"分析完成！结果已保存: {os.path.basename(out_path)}")
+                self.log(f"分析完成！结果已保存: {', '.join(os.path.basename(p) for p in written)}")
                 messagebox.showinfo("完成", "扫描结束")
                 os.startfile(os.path.dirname(out_path))
 
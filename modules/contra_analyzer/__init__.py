@@ -1,10 +1,10 @@
-from .ui import ContraAnalyzerUI
-
 # 为了适配 main.py 的加载逻辑，我们需要把 UI 类包装成符合要求的 Module 类
 # 你的 main.py 期望的是: module.name, module.render(parent), module.app (注入)
+# 注意：这里不在包级别导入 .ui (customtkinter)，命令行批处理 (batch.py) 只依赖 core/memory
 
 class ContraAnalyzerModule:
     def __init__(self):
+        from .ui import ContraAnalyzerUI
         self.ui = ContraAnalyzerUI()
         self.name = self.ui.name
         # self.kb = KnowledgeBase() <--- 这行删掉！UI 里已经有了，这里不需要。
@@ -1,26 +1,36 @@
 import itertools
-import hashlib
 import time
+import bisect
 from collections import defaultdict
+from functools import lru_cache
+from .keys import KEYS
+from .occams_razor import OccamsRazor
 
 class ExhaustiveSolver:
     """
-    穷举算法 v9.4 (严格结构保留版)
+    穷举算法 v9.5 (驻留 Key 版)
     修复：
-    1. 聚合时严格保留 Key 的后缀 (__Pos__D / __Neg__D)，防止正负行逻辑丢失。
+    1. 聚合时严格保留 Key 的正负/借贷信息 (Pos/Neg, D/C)，防止正负行逻辑丢失。
     2. 仅对完全相同的 Key 进行金额合并。
     3. 浮点数强制清洗。
+    4. Key 为 KeyTable 驻留的整数 (兼容旧的字符串 Key)，去重签名直接用元组，不再 md5。
     """
     
     # 定义敏感科目关键词
     SENSITIVE_KEYWORDS = ["银行", "现金", "Bank", "Cash", "支付宝", "微信"]
 
     @staticmethod
-    def is_sensitive(key_name):
-        return any(kw in key_name for kw in ExhaustiveSolver.SENSITIVE_KEYWORDS)
+    def is_sensitive(key):
+        return ExhaustiveSolver._is_sensitive_subject(KEYS.subject(key))
 
     @staticmethod
-    def calculate_combinations(debit_ledger, credit_ledger, max_solutions=200, timeout=5.0):
+    @lru_cache(maxsize=None)
+    def _is_sensitive_subject(subject):
+        return any(kw in subject for kw in ExhaustiveSolver.SENSITIVE_KEYWORDS)
+
+    @staticmethod
+    def calculate_combinations(debit_ledger, credit_ledger, max_solutions=200, timeout=5.0, stats=None):
+        """stats: 可选 dict，累加写入 {'nodes': 搜索节点数}，供运行剖析使用"""
         start_time = time.time()
         
         # 1. 预处理 (双重保险：再次强制 round 2)
@@ -42,14 +52,14 @@ class ExhaustiveSolver:
 
         # === 3. 双轨计算 ===
         results_b, timeout_b = ExhaustiveSolver._core_solve(
-            drivers, buckets, max_solutions, timeout * 0.7, start_time, use_perfect_lock=False
+            drivers, buckets, max_solutions, timeout * 0.7, start_time, use_perfect_lock=False, stats=stats
         )
         
         remaining_time = timeout - (time.time() - start_time)
         results_a = []
         if remaining_time > 0.1:
             results_a, _ = ExhaustiveSolver._core_solve(
-                drivers, buckets, max_solutions, remaining_time, time.time(), use_perfect_lock=True
+                drivers, buckets, max_solutions, remaining_time, time.time(), use_perfect_lock=True, stats=stats
             )
 
         raw_results = results_b + results_a
@@ -60,80 +70,10 @@ class ExhaustiveSolver:
         seen_hashes = set()
 
         for result in raw_results:
-            # 4.1 基础还原 (处理转置)
-            temp_res = {}
-            for d_key in debits.keys(): temp_res[d_key] = {}
-
-            if is_transposed:
-                for c_key, d_map in result.items():
-                    for d_key, amount in d_map.items():
-                        if abs(amount) > 0.001:
-                            # 还原时金额不取绝对值，保持原始符号逻辑
-                            # (实际上这里的 amount 是由原始数据算出来的，自带符号)
-                            temp_res[d_key][c_key] = amount
-            else:
-                for d_key, c_map in result.items():
-                    for c_key, amount in c_map.items():
-                        if abs(amount) > 0.001:
-                            temp_res[d_key][c_key] = amount
-            
-            # 4.2 核心优化：基于完整 Key 的聚合 (Fix)
-            # 之前错误地 split 了后缀，导致 Pos 和 Neg 混淆
-            # 现在我们保留 full key
-            final_res = defaultdict(lambda: defaultdict(float))
-            
-            for d_key, c_map in temp_res.items():
-                for c_key, amt in c_map.items():
-                    # 聚合：只有当 d_key 和 c_key 完全一致时才合并金额
-                    # 这能消除 DFS 过程中产生的路径差异，但保留正负差异
-                    final_res[d_key][c_key] += amt
-            
-            # 4.3 转换回普通字典并过滤微小值
-            cleaned_res = {}
-            for d_key, c_map in final_res.items():
-                cleaned_c_map = {}
-                for c_key, amt in c_map.items():
-                    if abs(amt) > 0.001:
-                        cleaned_c_map[c_key] = round(amt, 2) # 强制2位小数
-                
-                if cleaned_c_map:
-                    cleaned_res[d_key] = cleaned_c_map
+            cleaned_res = ExhaustiveSolver._restore_result(result, debits, credits, is_transposed)
+            if cleaned_res is None: continue
 
-            # 4.4 后置校验：确保金额守恒 (针对原始借贷总额)
-            is_valid_accounting = True
-            
-            # 校验借方
-            for d_key, original_amt in debits.items():
-                if d_key in cleaned_res:
-                    split_sum = sum(cleaned_res[d_key].values())
-                else:
-                    split_sum = 0
-                
-                if abs(round(split_sum, 2) - round(original_amt, 2)) > 0.01:
-                    is_valid_accounting = False; break
-            if not is_valid_accounting: continue
-
-            # 校验贷方
-            c_received = defaultdict(float)
-            for d_key, c_map in cleaned_res.items():
-                for c_key, amt in c_map.items():
-                    c_received[c_key] += amt
-            
-            for c_key, original_amt in credits.items():
-                if abs(round(c_received[c_key], 2) - round(original_amt, 2)) > 0.01:
-                    is_valid_accounting = False; break
-            if not is_valid_accounting: continue
-
-            # 4.5 签名去重
-            temp_sig = []
-            for d in sorted(cleaned_res.keys()):
-                for c in sorted(cleaned_res[d].keys()):
-                    amt = cleaned_res[d][c]
-                    temp_sig.append(f"{d}:{c}:{amt}")
-            
-            sig_str = "|".join(temp_sig)
-            res_hash = hashlib.md5(sig_str.encode()).hexdigest()
-            
+            res_hash = ExhaustiveSolver._signature(cleaned_res)
             if res_hash not in seen_hashes:
                 seen_hashes.add(res_hash)
                 deduped_results.append(cleaned_res)
@@ -143,7 +83,181 @@ class ExhaustiveSolver:
         return deduped_results, is_timeout
 
     @staticmethod
-    def _core_solve(drivers_dict, buckets_dict, max_sol, timeout, start_time, use_perfect_lock=True):
+    def iter_combinations(debit_ledger, credit_ledger, max_solutions=200, timeout=5.0, status=None):
+        """
+        流式版本：边搜索边产出 (已还原、已校验、已去重) 的方案。
+        status: 可选 dict，结束时写入 {'is_timeout': bool, 'nodes': 搜索节点数}。
+        调用方可以随时停止迭代，剩余的搜索不会再执行。
+        """
+        start_time = time.time()
+        if status is None: status = {}
+        status['is_timeout'] = False
+        status['nodes'] = 0
+
+        debits = {k: round(v, 2) for k, v in debit_ledger.items() if abs(v) > 0.001}
+        credits = {k: round(v, 2) for k, v in credit_ledger.items() if abs(v) > 0.001}
+
+        is_transposed = len(credits) > len(debits)
+        drivers, buckets = (credits, debits) if is_transposed else (debits, credits)
+
+        seen_hashes = set()
+        produced = 0
+
+        # 与 calculate_combinations 相同的双轨顺序：先自由搜索 (70% 时间)，再完美锁定 (剩余时间)
+        for use_lock in (False, True):
+            if use_lock:
+                pass_start = time.time()
+                pass_timeout = timeout - (pass_start - start_time)
+                if pass_timeout <= 0.1: break
+            else:
+                pass_start = start_time
+                pass_timeout = timeout * 0.7
+
+            pass_status = {}
+            try:
+                for result in ExhaustiveSolver._iter_core_solve(
+                    drivers, buckets, max_solutions, pass_timeout, pass_start, use_lock, pass_status
+                ):
+                    cleaned_res = ExhaustiveSolver._restore_result(result, debits, credits, is_transposed)
+                    if cleaned_res is None: continue
+
+                    res_hash = ExhaustiveSolver._signature(cleaned_res)
+                    if res_hash in seen_hashes: continue
+                    seen_hashes.add(res_hash)
+
+                    produced += 1
+                    yield cleaned_res
+                    if produced >= max_solutions: return
+            finally:
+                # 调用方提前停止迭代时也要记上已搜索的节点
+                status['nodes'] += pass_status.get('nodes', 0)
+
+            if not use_lock and pass_status.get('is_timeout'):
+                status['is_timeout'] = True
+
+    @staticmethod
+    def calculate_combinations_anytime(debit_ledger, credit_ledger, max_solutions=200, timeout=5.0,
+                                       stop_after=None, score_threshold=None, on_solution=None, stats=None):
+        """
+        随时可停 (Anytime) 模式：方案一经找到就按奥卡姆得分插入有序结果。
+        提前结束条件：
+        - 仅 stop_after: 找到 N 个方案即停止
+        - 仅 score_threshold: 最优得分达到阈值即停止
+        - 两者同时给出: 得分达到阈值的方案累计 N 个即停止
+        on_solution(solution, score, best_score, found_count): 每找到一个方案回调一次，供界面实时刷新。
+        stats: 可选 dict，累加写入 {'nodes': 搜索节点数} (与 calculate_combinations 一致)。
+        返回: (按得分降序的方案列表, 对应得分列表, 是否超时)
+        """
+        status = {}
+        ranked = []   # [(-score, 序号, solution)]
+        good_count = 0
+
+        for seq, sol in enumerate(ExhaustiveSolver.iter_combinations(
+                debit_ledger, credit_ledger, max_solutions, timeout, status)):
+            score = OccamsRazor.score_solution(sol)
+            bisect.insort(ranked, (-score, seq, sol)) # seq 唯一，不会比较到 dict
+            best_score = -ranked[0][0]
+
+            if on_solution: on_solution(sol, score, best_score, len(ranked))
+
+            if score_threshold is not None and score >= score_threshold: good_count += 1
+            if stop_after is not None:
+                if score_threshold is None:
+                    if len(ranked) >= stop_after: break
+                elif good_count >= stop_after: break
+            elif score_threshold is not None and best_score >= score_threshold:
+                break
+
+        if stats is not None: stats['nodes'] = stats.get('nodes', 0) + status.get('nodes', 0)
+        return [x[2] for x in ranked], [-x[0] for x in ranked], status.get('is_timeout', False)
+
+    @staticmethod
+    def _restore_result(result, debits, credits, is_transposed):
+        """还原转置、按完整 Key 聚合并做金额守恒校验；不合法返回 None"""
+        # 4.1 基础还原 (处理转置)
+        temp_res = {}
+        for d_key in debits.keys(): temp_res[d_key] = {}
+
+        if is_transposed:
+            for c_key, d_map in result.items():
+                for d_key, amount in d_map.items():
+                    if abs(amount) > 0.001:
+                        # 还原时金额不取绝对值，保持原始符号逻辑
+                        # (实际上这里的 amount 是由原始数据算出来的，自带符号)
+                        temp_res[d_key][c_key] = amount
+        else:
+            for d_key, c_map in result.items():
+                for c_key, amount in c_map.items():
+                    if abs(amount) > 0.001:
+                        temp_res[d_key][c_key] = amount
+        
+        # 4.2 核心优化：基于完整 Key 的聚合 (Fix)
+        # 之前错误地 split 了后缀，导致 Pos 和 Neg 混淆
+        # 现在我们保留 full key
+        final_res = defaultdict(lambda: defaultdict(float))
+        
+        for d_key, c_map in temp_res.items():
+            for c_key, amt in c_map.items():
+                # 聚合：只有当 d_key 和 c_key 完全一致时才合并金额
+                # 这能消除 DFS 过程中产生的路径差异，但保留正负差异
+                final_res[d_key][c_key] += amt
+        
+        # 4.3 转换回普通字典并过滤微小值
+        cleaned_res = {}
+        for d_key, c_map in final_res.items():
+            cleaned_c_map = {}
+            for c_key, amt in c_map.items():
+                if abs(amt) > 0.001:
+                    cleaned_c_map[c_key] = round(amt, 2) # 强制2位小数
+            
+            if cleaned_c_map:
+                cleaned_res[d_key] = cleaned_c_map
+
+        # 4.4 后置校验：确保金额守恒 (针对原始借贷总额)
+        # 校验借方
+        for d_key, original_amt in debits.items():
+            if d_key in cleaned_res:
+                split_sum = sum(cleaned_res[d_key].values())
+            else:
+                split_sum = 0
+            
+            if abs(round(split_sum, 2) - round(original_amt, 2)) > 0.01:
+                return None
+
+        # 校验贷方
+        c_received = defaultdict(float)
+        for d_key, c_map in cleaned_res.items():
+            for c_key, amt in c_map.items():
+                c_received[c_key] += amt
+        
+        for c_key, original_amt in credits.items():
+            if abs(round(c_received[c_key], 2) - round(original_amt, 2)) > 0.01:
+                return None
+
+        return cleaned_res
+
+    @staticmethod
+    def _signature(cleaned_res):
+        """4.5 签名去重：(借方Key, 贷方Key, 金额) 三元组排序后的元组，可直接放进 set"""
+        return tuple(sorted(
+            (d, c, amt) for d, c_map in cleaned_res.items() for c, amt in c_map.items()
+        ))
+
+    @staticmethod
+    def _core_solve(drivers_dict, buckets_dict, max_sol, timeout, start_time, use_perfect_lock=True, stats=None):
+        status = {}
+        results = list(ExhaustiveSolver._iter_core_solve(
+            drivers_dict, buckets_dict, max_sol, timeout, start_time, use_perfect_lock, status
+        ))
+        if stats is not None: stats['nodes'] = stats.get('nodes', 0) + status['nodes']
+        return results, status['is_timeout']
+
+    @staticmethod
+    def _iter_core_solve(drivers_dict, buckets_dict, max_sol, timeout, start_time, use_perfect_lock=True, status=None):
+        """DFS 生成器：每得到一个原始方案立即 yield；status 中写入超时标记 'is_timeout' 与搜索节点数 'nodes'"""
+        if status is None: status = {}
+        status['is_timeout'] = False
+        status['nodes'] = 0
         # 排序：从小到大 (含负数)
         driver_items = sorted(drivers_dict.items(), key=lambda x: x[1], reverse=False)
         bucket_items = sorted(list(buckets_dict.items()), key=lambda x: x[1], reverse=False)
@@ -165,7 +279,7 @@ class ExhaustiveSolver:
                         if (is_d_sens or is_b_sens) and (d_val * b_val < 0): continue 
                         found_b = b_key
                         break
-                if found_b:
+                if found_b is not None:
                     locked_allocations[d_key] = {found_b: d_val}
                     del temp_drivers[d_key]
                     del temp_buckets[found_b]
@@ -173,18 +287,23 @@ class ExhaustiveSolver:
             driver_items = sorted(temp_drivers.items(), key=lambda x: x[1], reverse=False)
             bucket_items = sorted(list(temp_buckets.items()), key=lambda x: x[1], reverse=False)
         
-        results = []
-        is_timeout = [False]
+        found = [0]
+        # 子集枚举量随 Bucket 数指数增长 (n=20 时单次上千万)，每枚举这么多个子集检查一次时限
+        check_every = 4096
 
         def generate_combinations(driver_name, target_amt, available_buckets):
             valid_splits = []
             n = len(available_buckets)
             seen = set()
             is_driver_sensitive = ExhaustiveSolver.is_sensitive(driver_name)
+            steps = 0
             
             # A. 全匹配
             for r in range(1, n + 1):
                 for indices in itertools.combinations(range(n), r):
+                    steps += 1
+                    if steps % check_every == 0 and time.time() - start_time > timeout:
+                        status['is_timeout'] = True; return valid_splits
                     subset_sum = round(sum(available_buckets[i][1] for i in indices), 4)
                     if abs(subset_sum - target_amt) < 0.001:
                         if is_driver_sensitive:
@@ -213,6 +332,9 @@ class ExhaustiveSolver:
                 
                 for r in range(n_others + 1):
                     for sub_indices in itertools.combinations(others_indices, r):
+                        steps += 1
+                        if steps % check_every == 0 and time.time() - start_time > timeout:
+                            status['is_timeout'] = True; return valid_splits
                         current_sum = round(sum(available_buckets[k][1] for k in sub_indices), 4)
                         needed = round(target_amt - current_sum, 4)
                         
@@ -248,9 +370,10 @@ class ExhaustiveSolver:
             return valid_splits
 
         def dfs(d_idx, current_allocations, current_buckets):
-            if len(results) >= max_sol * 2: return 
+            if found[0] >= max_sol * 2: return 
+            status['nodes'] += 1
             if time.time() - start_time > timeout:
-                is_timeout[0] = True; return
+                status['is_timeout'] = True; return
 
             if d_idx == len(driver_items):
                 remain = round(sum(amt for _, amt in current_buckets), 4)
@@ -258,7 +381,8 @@ class ExhaustiveSolver:
                     final_comb = current_allocations.copy()
                     if use_perfect_lock and locked_allocations:
                         final_comb.update(locked_allocations)
-                    results.append(final_comb)
+                    found[0] += 1
+                    yield final_comb
                 return
 
             driver_name, driver_amt = driver_items[d_idx]
@@ -267,7 +391,9 @@ class ExhaustiveSolver:
             if not possible_splits: return
 
             for split in possible_splits:
-                if len(results) >= max_sol * 2: return
+                if found[0] >= max_sol * 2: return
+                if time.time() - start_time > timeout:
+                    status['is_timeout'] = True; return
                 
                 next_alloc = current_allocations.copy()
                 next_alloc[driver_name] = split
@@ -279,11 +405,9 @@ class ExhaustiveSolver:
                     if abs(remain) > 0.001:
                         next_buckets.append((b_name, remain))
                 
-                dfs(d_idx + 1, next_alloc, next_buckets)
+                yield from dfs(d_idx + 1, next_alloc, next_buckets)
 
         if not driver_items:
-            if locked_allocations: results.append(locked_allocations)
+            if locked_allocations: yield locked_allocations
         else:
-            dfs(0, {}, bucket_items)
-            
-        return results, is_timeout[0]
\ No newline at end of file
+            yield from dfs(0, {}, bucket_items)
\ No newline at end of file
@@ -0,0 +1,125 @@
+"""
+对方科目分析 - 命令行批处理入口 (不依赖 customtkinter，可在服务器上无界面运行)
+
+流程：读取序时账 + 列映射 -> process_all 分层 -> 按记忆库自动选择排名第一的方案 -> 输出【对方科目】报告
+
+用法：
+    python -m modules.contra_analyzer.batch 序时账.xlsx --mapping mapping.json
+    python -m modules.contra_analyzer.batch 账套A.xlsx 账套B.xlsx ... --mapping mapping.json --jobs 4
+    python -m modules.contra_analyzer.batch 序时账.xlsx --mapping mapping.json --profile   (另存 profile.json/csv + .prof)
+
+mapping.json 与界面上的列映射一致：
+    {"date": "制单日期", "voucher_id": "凭证号", "subject": "一级科目",
+     "debit": "借方金额", "credit": "贷方金额", "summary": "摘要"}
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .core import ContraProcessor
+from .flow_solver import FlowSolver
+from .memory import KnowledgeBase
+from .profiler import RunProfiler
+
+MAPPING_KEYS = ['date', 'voucher_id', 'subject', 'debit', 'credit', 'summary']
+
+def load_mapping(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        mapping = json.load(f)
+    missing = [k for k in MAPPING_KEYS if not mapping.get(k)]
+    if missing:
+        raise ValueError(f"列映射缺少: {', '.join(missing)}")
+    return mapping
+
+def default_output_path(ledger_path, output_dir=None):
+    base = os.path.splitext(os.path.basename(ledger_path))[0]
+    folder = output_dir or os.path.dirname(os.path.abspath(ledger_path))
+    return os.path.join(folder, f"{base}_对方科目分析表.xlsx")
+
+def run_ledger(ledger_path, mapping, output_path=None, memory_path=None, log=print, profile=False):
+    """处理单个序时账，返回输出文件路径；profile=True 时在输出文件旁导出剖析结果与 cProfile"""
+    started = time.time()
+    output_path = output_path or default_output_path(ledger_path)
+
+    processor = ContraProcessor()
+    kb = KnowledgeBase(memory_path)
+    profiler = RunProfiler(RunProfiler.profile_paths(output_path)[2] if profile else None)
+    processor.profiler = profiler
+    profiler.start()
+
+    try:
+        log("开始数据清洗与分层...")
+        processor.load_data(ledger_path, mapping)
+        stats = processor.process_all()
+        log(f"凭证 {stats['processed']} | 自动匹配 {stats['simple_solved']} | 复杂模式 {stats['complex_groups']}")
+
+        # 复杂凭证在 finalize_report 中按 (奥卡姆得分 x 记忆得分) 自动取第一名
+        log("正在应用规则并生成全量数据...")
+        final_df = processor.finalize_report(kb, log)
+        with profiler.stage("写入Excel"):
+            final_df.to_excel(output_path, index=False)
+    finally:
+        profiler.stop()
+
+    if profile:
+        for line in profiler.report_lines(): log(line)
+        log("剖析文件: " + ", ".join(profiler.save(output_path)))
+    log(f"最终报告生成完毕: {output_path} ({time.time() - started:.1f}s)")
+    return output_path
+
+def _run_job(ledger_path, mapping, output_path, memory_path, profile=False):
+    """子进程入口：日志带上文件名前缀"""
+    name = os.path.basename(ledger_path)
+    # 每个进程单线程求解，可以安全地屏蔽 HiGHS 直接写 stdout 的调试信息
+    FlowSolver.QUIET_NATIVE_STDOUT = True
+    return run_ledger(ledger_path, mapping, output_path, memory_path,
+                      log=lambda msg: print(f"[{name}] {msg}", flush=True), profile=profile)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="对方科目分析 (命令行批处理)")
+    parser.add_argument("ledgers", nargs="+", help="序时账 Excel 文件，可传多个")
+    parser.add_argument("--mapping", required=True, help="列映射 JSON 文件")
+    parser.add_argument("--output", "-o", help="输出文件 (仅单个序时账时可用)")
+    parser.add_argument("--output-dir", help="输出目录 (默认与序时账同目录)")
+    parser.add_argument("--memory", help="记忆库文件 (默认 user_data/contra_memory_ema.json)")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="并行处理的序时账数量")
+    parser.add_argument("--profile", action="store_true", help="输出各阶段耗时，并在输出文件旁保存 .profile.json/.profile.csv/.prof")
+    args = parser.parse_args(argv)
+
+    if args.output and len(args.ledgers) > 1:
+        parser.error("--output 只能用于单个序时账，多个文件请使用 --output-dir")
+
+    try:
+        mapping = load_mapping(args.mapping)
+    except (OSError, ValueError) as e:
+        parser.error(f"无法读取列映射: {e}")
+
+    if args.output_dir: os.makedirs(args.output_dir, exist_ok=True)
+    jobs = [(p, args.output or default_output_path(p, args.output_dir)) for p in args.ledgers]
+
+    failed = 0
+    if args.jobs <= 1:
+        for ledger_path, output_path in jobs:
+            try:
+                _run_job(ledger_path, mapping, output_path, args.memory, args.profile)
+            except Exception as e:
+                failed += 1
+                print(f"[{os.path.basename(ledger_path)}] 处理失败: {e}", file=sys.stderr)
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = {pool.submit(_run_job, p, mapping, o, args.memory, args.profile): p for p, o in jobs}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"[{os.path.basename(futures[future])}] 处理失败: {e}", file=sys.stderr)
+
+    print(f"完成: {len(jobs) - failed}/{len(jobs)}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+"""
+对方科目分析 - 求解器基准测试与回归比对 (ContraProcessor.solve_pattern + OccamsRazor)
+
+语料：
+    1. 内置合成凭证：2x2 ~ 12x12 分级难度，每个规模两组 (普通 / 含红冲负数行 + 银行现金敏感科目)，
+       固定随机种子生成，每次运行完全一致；另加超大凭证 (默认 20x20，--large 调整)，覆盖直接走整数规划的路径。
+    2. 脱敏的真实凭证：用 --ledger 从序时账提取复杂模式，科目名替换为代号 (保留敏感关键词)，
+       用 --save-corpus 存成 JSON，之后用 --corpus 加入语料。
+
+每个用例走与生成报告相同的求解入口 (穷举，大凭证超时后整数规划兜底，超大凭证直接整数规划)，
+记录：求解路径、求解耗时、是否超时、不同方案数、奥卡姆排名第一的方案；可与保存的基线比对。
+
+参考结果 (benchmark_reference.json，随代码提交)：
+    由 v9.4 穷举求解器 (字符串 Key 版本) 在 2x2 ~ 12x12 合成语料上以宽松时限跑出的完整方案集，
+    每例记录方案数和方案集摘要。--reference 用当前穷举后端重跑并逐例比对，方案集必须完全一致，
+    不受机器速度影响 (基线里的耗时 / 超时才和机器有关)。
+
+用法：
+    python -m modules.contra_analyzer.benchmark --reference
+    python -m modules.contra_analyzer.benchmark --save baseline.json
+    python -m modules.contra_analyzer.benchmark --baseline baseline.json
+    python -m modules.contra_analyzer.benchmark --ledger 序时账.xlsx --mapping mapping.json --save-corpus corpus.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+
+from .algorithm import ExhaustiveSolver
+from .core import ContraProcessor
+from .occams_razor import OccamsRazor
+from .keys import KEYS
+
+VERSION = 2
+REFERENCE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_reference.json")
+
+# 合成语料的科目池 (借方 / 贷方各取所需)
+DEBIT_SUBJECTS = ["应收账款", "管理费用", "销售费用", "原材料", "固定资产", "预付账款",
+                  "其他应收款", "财务费用", "制造费用", "研发支出", "库存商品", "在建工程",
+                  "无形资产", "应收票据", "主营业务成本", "税金及附加", "营业外支出", "长期待摊费用",
+                  "其他业务成本", "长期股权投资"]
+SENSITIVE_SUBJECTS = ["银行存款", "库存现金"]
+CREDIT_SUBJECTS = ["主营业务收入", "应交税费", "应付账款", "其他应付款", "应付职工薪酬", "预收账款",
+                   "其他业务收入", "短期借款", "累计折旧", "资本公积", "实收资本", "营业外收入",
+                   "应付票据", "应付利息", "长期借款", "递延收益", "盈余公积", "应付股利",
+                   "合同负债", "其他综合收益"]
+# 超大凭证 (穷举必然超时，直接走整数规划)，用独立的随机种子生成，不影响上面的分级语料
+LARGE_SIZES = (20,)
+
+def _make_case(rng, name, n_debits, n_credits, with_negative):
+    """
+    先随机生成一张 "真实流向" 表 (每个借方连 1~2 个贷方，每个贷方至少被连一次)，
+    再按科目汇总成借贷两侧，保证借贷平衡。
+    with_negative: 借方换入银行/现金科目，并在贷方追加一条红冲负数行。
+        敏感科目不允许反向分配，红冲行只能由普通借方科目承接，所以借方至少保留一个普通科目 (保证有解)。
+    """
+    n_sensitive = min(len(SENSITIVE_SUBJECTS), n_debits - 1) if with_negative else 0
+    d_subjs = SENSITIVE_SUBJECTS[:n_sensitive] + DEBIT_SUBJECTS[:n_debits - n_sensitive]
+    c_subjs = CREDIT_SUBJECTS[:n_credits]
+
+    flows = []
+    for j in range(n_credits):
+        flows.append((rng.randrange(n_debits), j))
+    for i in range(n_debits):
+        if not any(f[0] == i for f in flows):
+            flows.append((i, rng.randrange(n_credits)))
+        elif rng.random() < 0.3:
+            flows.append((i, rng.randrange(n_credits)))
+
+    debits, credits = {}, {}
+    for i, j in flows:
+        amt = rng.randrange(100, 5000000) / 100.0
+        d_key = KEYS.intern(d_subjs[i], False, False)
+        c_key = KEYS.intern(c_subjs[j], False, True)
+        debits[d_key] = round(debits.get(d_key, 0.0) + amt, 2)
+        credits[c_key] = round(credits.get(c_key, 0.0) + amt, 2)
+
+    if with_negative:
+        # 红冲：贷方某科目先多记 R，再用负数行冲回 R，借贷依然平衡
+        reversal = rng.randrange(100, 500000) / 100.0
+        target = rng.choice(list(credits))
+        credits[target] = round(credits[target] + reversal, 2)
+        credits[KEYS.intern(KEYS.subject(target), True, True)] = -reversal
+
+    return {"name": name, "debits": debits, "credits": credits}
+
+def build_corpus(seed=20240101, min_size=2, max_size=12, large_sizes=LARGE_SIZES):
+    rng = random.Random(seed)
+    cases = []
+    for n in range(min_size, max_size + 1):
+        cases.append(_make_case(rng, f"syn_{n}x{n}", n, n, with_negative=False))
+        cases.append(_make_case(rng, f"syn_{n}x{n}_neg_bank", n, n, with_negative=True))
+    for n in large_sizes:
+        cases.append(_make_case(random.Random(seed + n), f"syn_{n}x{n}", n, n, with_negative=False))
+    return cases
+
+def _ledger_to_labels(ledger):
+    return {KEYS.label(k): v for k, v in ledger.items()}
+
+def _ledger_from_labels(ledger):
+    return {KEYS.parse(k): v for k, v in ledger.items()}
+
+def save_corpus(cases, path):
+    data = [{"name": c["name"], "debits": _ledger_to_labels(c["debits"]), "credits": _ledger_to_labels(c["credits"])}
+            for c in cases]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"version": VERSION, "cases": data}, f, ensure_ascii=False, indent=1)
+
+def load_corpus(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    return [{"name": c["name"], "debits": _ledger_from_labels(c["debits"]), "credits": _ledger_from_labels(c["credits"])}
+            for c in data.get("cases", [])]
+
+def cases_from_processor(processor, limit=None):
+    """
+    从 process_all 之后的 cluster_samples 提取复杂凭证并脱敏：
+    科目名替换为 "科目N"，敏感科目保留关键词 (如 "银行_3")，确保敏感科目规则仍然生效。
+    """
+    aliases = {}
+    def alias(subject):
+        if subject not in aliases:
+            kw = next((k for k in ExhaustiveSolver.SENSITIVE_KEYWORDS if k in subject), "科目")
+            aliases[subject] = f"{kw}_{len(aliases) + 1}"
+        return aliases[subject]
+
+    def anonymize(ledger):
+        return {KEYS.intern(alias(KEYS.subject(k)), KEYS.is_negative(k), KEYS.is_credit(k)): v
+                for k, v in ledger.items()}
+
+    samples = sorted(processor.cluster_samples.values(), key=lambda s: -s['count'])
+    if limit: samples = samples[:limit]
+    return [{"name": f"ledger_{i + 1}_{len(s['debits'])}x{len(s['credits'])}",
+             "debits": anonymize(s['debits']), "credits": anonymize(s['credits'])}
+            for i, s in enumerate(samples)]
+
+def run_case(case, timeout=2.0, max_solutions=200):
+    processor = ContraProcessor()
+    started = time.perf_counter()
+    solutions, is_timeout = processor.solve_pattern(case["debits"], case["credits"], max_solutions, timeout, pattern_name=case["name"])
+    elapsed = time.perf_counter() - started
+
+    ranked, scores = OccamsRazor.rank_solutions(solutions)
+    top = None
+    if ranked:
+        top = [[KEYS.label(d), KEYS.label(c), amt] for d, c, amt in ExhaustiveSolver._signature(ranked[0])]
+    return {
+        "size": f"{len(case['debits'])}x{len(case['credits'])}",
+        "solver": processor.profiler.patterns[case["name"]]["solver"],
+        "seconds": round(elapsed, 4),
+        "timeout": bool(is_timeout),
+        "solutions": len(solutions),
+        "top_score": scores[0] if scores else None,
+        "top": top,
+    }
+
+def run_benchmark(cases, timeout=2.0, max_solutions=200, log=print):
+    results = {}
+    for case in cases:
+        res = run_case(case, timeout, max_solutions)
+        results[case["name"]] = res
+        flag = " [超时]" if res["timeout"] else ""
+        log(f"{case['name']:<28} {res['size']:>6} {res['solver']:<16} {res['seconds']:>8.3f}s 方案 {res['solutions']:>4}{flag}")
+
+    total = len(results)
+    timeouts = sum(1 for r in results.values() if r["timeout"])
+    summary = {
+        "cases": total,
+        "total_seconds": round(sum(r["seconds"] for r in results.values()), 3),
+        "timeout_rate": round(timeouts / total, 4) if total else 0.0,
+    }
+    log(f"共 {total} 例 | 总耗时 {summary['total_seconds']:.2f}s | 超时率 {summary['timeout_rate']:.0%}")
+    return {"version": VERSION, "timeout": timeout, "max_solutions": max_solutions, "summary": summary, "cases": results}
+
+def compare(current, baseline, time_ratio=1.5, min_delta=0.05):
+    """
+    与基线比对，返回问题列表 (空列表 = 通过)
+    - 方案数 / 第一名方案变化：只在两次都未超时时判定 (超时的方案集本身依赖机器速度)
+    - 求解路径变化 (如穷举超时后改由整数规划兜底)
+    - 新增超时
+    - 耗时回退：超过基线 time_ratio 倍且绝对差值超过 min_delta 秒
+    """
+    issues = []
+    for name, base in baseline.get("cases", {}).items():
+        # 只比对本次实际运行的用例 (例如 --max-size 缩小了语料)
+        cur = current["cases"].get(name)
+        if cur is None: continue
+        if base.get("solver") and cur["solver"] != base["solver"]:
+            issues.append(f"{name}: 求解路径 {base['solver']} -> {cur['solver']}")
+        if cur["timeout"] and not base["timeout"]:
+            issues.append(f"{name}: 新增超时 ({base['seconds']:.3f}s -> {cur['seconds']:.3f}s)")
+        if not cur["timeout"] and not base["timeout"]:
+            if cur["solutions"] != base["solutions"]:
+                issues.append(f"{name}: 方案数 {base['solutions']} -> {cur['solutions']}")
+            if cur["top"] != base["top"]:
+                issues.append(f"{name}: 第一名方案变化 (得分 {base['top_score']} -> {cur['top_score']})")
+        if cur["seconds"] > base["seconds"] * time_ratio and cur["seconds"] - base["seconds"] > min_delta:
+            issues.append(f"{name}: 耗时 {base['seconds']:.3f}s -> {cur['seconds']:.3f}s")
+    return issues
+
+def solution_digest(solutions):
+    """
+    方案集摘要：每个方案转成排序后的 (借方标签, 贷方标签, 金额) 列表，整体排序后取 sha1。
+    只依赖标签和金额，字符串 Key (v9.4) 和整数 Key 的方案算出的摘要相同，与方案顺序无关。
+    """
+    rows = sorted(
+        json.dumps(sorted([KEYS.label(d), KEYS.label(c), round(amt, 2)] for d, c_map in sol.items() for c, amt in c_map.items()),
+                   ensure_ascii=False)
+        for sol in solutions
+    )
+    return hashlib.sha1("\n".join(rows).encode("utf-8")).hexdigest()
+
+def load_reference(path=REFERENCE_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def check_reference(reference, timeout=None, log=print):
+    """
+    用当前穷举后端重跑参考语料，与参考方案集逐例比对，返回问题列表 (空列表 = 通过)
+    参考结果没有超时用例，这里超时同样记为问题 (方案集不完整，无法比对)。
+    """
+    timeout = timeout or reference.get("timeout", 30.0)
+    max_solutions = reference.get("max_solutions", 200)
+    names = set(reference.get("cases", {}))
+    cases = [c for c in build_corpus(seed=reference.get("seed", 20240101), max_size=reference.get("max_size", 12), large_sizes=())
+             if c["name"] in names]
+    issues = []
+    for case in cases:
+        ref = reference["cases"][case["name"]]
+        started = time.perf_counter()
+        solutions, is_timeout = ExhaustiveSolver.calculate_combinations(case["debits"], case["credits"], max_solutions, timeout)
+        elapsed = time.perf_counter() - started
+        ok = not is_timeout and len(solutions) == ref["solutions"] and solution_digest(solutions) == ref["digest"]
+        log(f"{case['name']:<28} {elapsed:>8.3f}s 方案 {len(solutions):>4} / 参考 {ref['solutions']:>4} {'一致' if ok else '不一致'}")
+        if is_timeout:
+            issues.append(f"{case['name']}: 超时 ({timeout}s)，方案集不完整")
+        elif len(solutions) != ref["solutions"]:
+            issues.append(f"{case['name']}: 方案数 {ref['solutions']} -> {len(solutions)}")
+        elif not ok:
+            issues.append(f"{case['name']}: 方案集与参考不一致")
+    missing = names - {c["name"] for c in cases}
+    for name in sorted(missing):
+        issues.append(f"{name}: 当前语料中没有此用例 (合成语料生成规则变化?)")
+    return issues
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="对方科目求解器基准测试")
+    parser.add_argument("--timeout", type=float, default=2.0, help="每个用例的求解时限 (秒)")
+    parser.add_argument("--max-solutions", type=int, default=200)
+    parser.add_argument("--max-size", type=int, default=12, help="合成语料的最大规模 (NxN)")
+    parser.add_argument("--large", type=int, nargs="*", default=list(LARGE_SIZES), help="额外的超大凭证规模 (NxN)，只写 --large 不带数值则不生成")
+    parser.add_argument("--corpus", action="append", default=[], help="额外语料 JSON (可多次指定)")
+    parser.add_argument("--save", help="把本次结果保存为基线")
+    parser.add_argument("--baseline", help="与已保存的基线比对，有回退时返回码为 1")
+    parser.add_argument("--reference", nargs="?", const=REFERENCE_PATH,
+                        help="与 v9.4 求解器的参考方案集逐例比对 (默认随代码提交的 benchmark_reference.json)，不一致时返回码为 1")
+    parser.add_argument("--time-ratio", type=float, default=1.5, help="耗时超过基线多少倍视为回退")
+    parser.add_argument("--ledger", help="从序时账提取复杂凭证作为脱敏语料 (需配合 --mapping 和 --save-corpus)")
+    parser.add_argument("--mapping", help="列映射 JSON 文件")
+    parser.add_argument("--save-corpus", help="脱敏语料的输出路径")
+    args = parser.parse_args(argv)
+
+    if args.ledger:
+        if not (args.mapping and args.save_corpus):
+            parser.error("--ledger 需要同时指定 --mapping 和 --save-corpus")
+        from .batch import load_mapping
+        processor = ContraProcessor()
+        processor.load_data(args.ledger, load_mapping(args.mapping))
+        processor.process_all()
+        cases = cases_from_processor(processor)
+        save_corpus(cases, args.save_corpus)
+        print(f"已导出 {len(cases)} 个脱敏用例: {args.save_corpus}")
+        return 0
+
+    if args.reference:
+        issues = check_reference(load_reference(args.reference))
+        if issues:
+            print(f"发现 {len(issues)} 处与参考结果不一致:")
+            for issue in issues: print("  " + issue)
+            return 1
+        print("与 v9.4 参考方案集一致")
+        return 0
+
+    cases = build_corpus(max_size=args.max_size, large_sizes=args.large)
+    for path in args.corpus:
+        cases.extend(load_corpus(path))
+
+    result = run_benchmark(cases, args.timeout, args.max_solutions)
+
+    if args.save:
+        folder = os.path.dirname(os.path.abspath(args.save))
+        os.makedirs(folder, exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+        print(f"基线已保存: {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        issues = compare(result, baseline, time_ratio=args.time_ratio)
+        if issues:
+            print(f"发现 {len(issues)} 处回退:")
+            for issue in issues: print("  " + issue)
+            return 1
+        print("与基线一致")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,14 @@
 import pandas as pd
+import numpy as np
 import hashlib
+import time
 from collections import defaultdict
 from .algorithm import ExhaustiveSolver
+from .flow_solver import FlowSolver
+from .keys import KEYS
+from .solution_cache import SolutionCache
+from .scheduler import SolveBudget
+from .profiler import RunProfiler
 
 class ContraProcessor:
     def __init__(self):
@@ -9,18 +16,30 @@ class ContraProcessor:
         self.mapping = {} 
         self.complex_data_cache = {}
         self.meta_cache = {} 
+        self.solution_cache = SolutionCache()
+        # 阶段计时/计数 (界面或批处理每次运行前可替换为新的 RunProfiler)
+        self.profiler = RunProfiler()
 
     def load_data(self, file_path, mapping):
+        with self.profiler.stage("读取序时账"):
+            self._load_data(file_path, mapping)
+        self.profiler.count("序时账行数", len(self.df))
+
+    def _load_data(self, file_path, mapping):
         self.mapping = mapping
-        # 1. 读取原始数据
-        self.df = pd.read_excel(file_path, dtype=str)
-        
+        self.meta_cache = {}
         date_col = mapping['date']
         voucher_col = mapping['voucher_id']
         summ_col = mapping['summary']
+
+        # 1. 读取原始数据：金额列按数值读取，其余列保持文本 (凭证号/编码的前导零不丢)
+        with self.profiler.stage("读取Excel"):
+            header = pd.read_excel(file_path, nrows=0).columns
+            amount_cols = {mapping['debit'], mapping['credit']}
+            self.df = pd.read_excel(file_path, dtype={c: str for c in header if c not in amount_cols})
         
-        # 2. 生成唯一标识符
-        self.df['_uid'] = self.df[date_col].astype(str) + "_" + self.df[voucher_col].astype(str)
+        # 2. 生成唯一标识符：(日期, 凭证号) 因子化为整数编码，不再拼接字符串
+        self.df['_uid'] = self.df.groupby([date_col, voucher_col], sort=True, dropna=False).ngroup()
 
         # 3. 只保留2位小数
         self.df['_calc_debit'] = pd.to_numeric(self.df[mapping['debit']], errors='coerce').fillna(0).round(2)
@@ -30,21 +49,37 @@ class ContraProcessor:
         subj_col = mapping['subject']
         self.df['_calc_subj'] = self.df[subj_col].astype(str).str.strip()
 
-        # 5. 缓存元数据
-        for uid, group in self.df.groupby('_uid'):
-            first_row = group.iloc[0]
-            unique_summs = group[summ_col].dropna().unique()
-            combined_summ = " | ".join([str(s) for s in unique_summs if str(s).strip()])
+        # 5. 缓存元数据 (向量化：首行取日期/凭证号，摘要去重后按出现顺序拼接)
+        first_rows = self.df.drop_duplicates('_uid')
+
+        summs = self.df[['_uid', summ_col]].dropna(subset=[summ_col])
+        summs = summs.assign(**{summ_col: summs[summ_col].astype(str)})
+        summs = summs[summs[summ_col].str.strip() != ''].drop_duplicates()
+        joined = summs.groupby('_uid', sort=False)[summ_col].agg(" | ".join)
+
+        for uid, date, voucher, summary in zip(
+            first_rows['_uid'], first_rows[date_col], first_rows[voucher_col],
+            joined.reindex(first_rows['_uid'], fill_value='')
+        ):
             self.meta_cache[uid] = {
-                'date': first_row[date_col],
-                'voucher_id': first_row[voucher_col],
-                'summary': combined_summ
+                'date': date,
+                'voucher_id': voucher,
+                'summary': summary
             }
 
     def process_all(self, stop_event=None):
+        with self.profiler.stage("分层聚类"):
+            stats = self._process_all(stop_event)
+        self.profiler.count("凭证数", stats['processed'])
+        self.profiler.count("复杂凭证", len(self.complex_data_cache))
+        self.profiler.count("复杂模式", stats['complex_groups'])
+        return stats
+
+    def _process_all(self, stop_event=None):
         self.complex_clusters = defaultdict(list)
         self.cluster_samples = {}
         self.complex_data_cache = {}
+        self.solution_cache = SolutionCache()
         
         grouped = self.df.groupby('_uid')
         processed_count = 0
@@ -118,15 +153,14 @@ class ContraProcessor:
         
         self.complex_clusters[key_hash].append(uid)
         
+        # Key 为驻留整数 (科目, 正负, 借贷)，导出时再用 KEYS.label() 还原字符串
         d_dict = defaultdict(float)
         for subj, amt in zip(debits['_calc_subj'], debits['_calc_debit']):
-            suffix = "Pos" if amt >= 0 else "Neg"
-            d_dict[f"{subj}__{suffix}__D"] += amt
+            d_dict[KEYS.intern(subj, amt < 0, False)] += amt
             
         c_dict = defaultdict(float)
         for subj, amt in zip(credits['_calc_subj'], credits['_calc_credit']):
-            suffix = "Pos" if amt >= 0 else "Neg"
-            c_dict[f"{subj}__{suffix}__C"] += amt
+            c_dict[KEYS.intern(subj, amt < 0, True)] += amt
         
         # === 核心修复：聚合后再次 round，防止浮点累积误差 ===
         clean_d_dict = {k: round(v, 2) for k, v in d_dict.items()}
@@ -136,7 +170,8 @@ class ContraProcessor:
         self.complex_data_cache[uid] = {
             "debits": dict(clean_d_dict), 
             "credits": dict(clean_c_dict),
-            "pattern_name": key_str
+            "pattern_name": key_str,
+            "pattern_hash": key_hash
         }
 
         if key_hash not in self.cluster_samples:
@@ -147,9 +182,59 @@ class ContraProcessor:
         else:
             self.cluster_samples[key_hash]["count"] += 1
 
+    def solve_pattern(self, debits, credits, max_solutions=200, timeout=2.0, pattern_name="",
+                      stop_after=None, score_threshold=None, on_solution=None):
+        """
+        统一求解入口 (路径见 FlowSolver.route)：
+        - 普通凭证：穷举；
+        - 大凭证 (任一方 Key 数 >= FlowSolver.LARGE_SIDE)：先给穷举 FlowSolver.EXHAUSTIVE_SHARE 的时间，
+          穷举超时才用剩余时间跑整数规划兜底，两边方案合并去重；
+        - 超大凭证 (任一方 Key 数 >= FlowSolver.DIRECT_SIDE)：直接整数规划。
+        stop_after / score_threshold / on_solution: 给出任一项时穷举改用随时可停模式
+        (ExhaustiveSolver.calculate_combinations_anytime)，边找边回调，满足条件即提前结束。
+        返回 (solutions, is_timeout)。
+        每次求解的耗时/节点数/超时按 pattern_name 记入 self.profiler。
+        """
+        stats = {}
+        started = time.perf_counter()
+        with self.profiler.stage("求解"):
+            route = FlowSolver.route(debits, credits)
+            if route == "direct":
+                solver = "flow"
+                solutions, is_timeout = FlowSolver.calculate_combinations(debits, credits, max_solutions=max_solutions, timeout=timeout, stats=stats)
+            else:
+                solver = "exhaustive"
+                first_timeout = timeout * FlowSolver.EXHAUSTIVE_SHARE if route == "fallback" else timeout
+                if stop_after is None and score_threshold is None and on_solution is None:
+                    solutions, is_timeout = ExhaustiveSolver.calculate_combinations(debits, credits, max_solutions=max_solutions, timeout=first_timeout, stats=stats)
+                else:
+                    solver = "anytime"
+                    solutions, _, is_timeout = ExhaustiveSolver.calculate_combinations_anytime(
+                        debits, credits, max_solutions=max_solutions, timeout=first_timeout, stop_after=stop_after,
+                        score_threshold=score_threshold, on_solution=on_solution, stats=stats)
+                remaining = timeout - (time.perf_counter() - started)
+                if route == "fallback" and is_timeout and remaining > 0:
+                    solver += "+flow"
+                    flow_solutions, is_timeout = FlowSolver.calculate_combinations(debits, credits, max_solutions=max_solutions, timeout=remaining, stats=stats)
+                    seen = {ExhaustiveSolver._signature(sol) for sol in solutions}
+                    for sol in flow_solutions:
+                        if len(solutions) >= max_solutions: break
+                        signature = ExhaustiveSolver._signature(sol)
+                        if signature not in seen:
+                            seen.add(signature)
+                            solutions.append(sol)
+        self.profiler.record_pattern(pattern_name, time.perf_counter() - started, len(solutions),
+                                     stats.get('nodes', 0), is_timeout, solver)
+        return solutions, is_timeout
+
     def finalize_report(self, kb, log_callback):
-        solver = ExhaustiveSolver()
+        with self.profiler.stage("生成报告"):
+            return self._finalize_report(kb, log_callback)
+
+    def _finalize_report(self, kb, log_callback):
         final_rows = []
+        # 复杂凭证的求解时间按金额分配，并限制总耗时
+        budget = SolveBudget.for_vouchers(self.complex_data_cache)
         
         grouped = self.df.groupby('_uid', sort=False)
         total_groups = len(grouped)
@@ -193,8 +278,9 @@ class ContraProcessor:
                     self._append_1vN_rows_reconstruct(final_rows, uid, original_cols, debits, credits, d_types==1)
             else:
                 # 传入 clean_group (这是关键，否则负数搬家后的行找不到)
-                self._append_complex_rows(final_rows, clean_group, original_cols, uid, kb, solver)
+                self._append_complex_rows(final_rows, clean_group, original_cols, uid, kb, budget)
 
+        log_callback(budget.summary())
         df_final = pd.DataFrame(final_rows)
         
         # === 核心修改：列重排 (对方科目移到贷方金额后面) ===
@@ -281,52 +367,44 @@ class ContraProcessor:
                 row_single = self._create_virtual_row(uid, cols, single_side_subj, None, amount, row['_calc_subj'])
             final_rows.append(row_single)
 
-    def _append_complex_rows(self, final_rows, group, cols, uid, kb, solver):
+    def _append_complex_rows(self, final_rows, group, cols, uid, kb, budget):
         data = self.complex_data_cache.get(uid)
         if not data:
             self._append_original_rows(final_rows, group, cols, "缓存丢失")
             return
 
-        solutions, _ = solver.calculate_combinations(data['debits'], data['credits'], max_solutions=200, timeout=1.5)
+        # 与导出时的样本金额完全一致的凭证，直接复用已求出的方案集
+        # 修复：直接从缓存取 pattern_name，无需重建
+        pattern_name = data.get('pattern_name', '')
+
+        cached = self.solution_cache.get(data.get('pattern_hash'), data)
+        if cached:
+            solutions = cached[0]
+            self.profiler.count("方案缓存命中")
+            budget.consume(uid, 0.0)
+        elif budget.expired:
+            # 求解预算用尽 / 墙钟到期：不再求解，原样输出待人工分析
+            budget.skip(uid)
+            self._append_original_rows(final_rows, group, cols, "需人工分析(预算用尽)")
+            return
+        else:
+            started = time.time()
+            solutions, _ = self.solve_pattern(data['debits'], data['credits'], max_solutions=200, timeout=budget.timeout_for(uid), pattern_name=pattern_name)
+            budget.consume(uid, time.time() - started)
         if not solutions:
             self._append_original_rows(final_rows, group, cols, "需人工分析(无解)")
             return
 
-        # 修复：直接从缓存取 pattern_name，无需重建
-        pattern_name = data.get('pattern_name', '')
-        
-        ranked = kb.rank_solutions(solutions, pattern_name)
+        with self.profiler.stage("排序"):
+            ranked = kb.rank_solutions(solutions, pattern_name)
         best_sol = ranked[0] 
         
-        # 借方重构 (遍历 clean_group)
+        # 一次扫描建立 (科目, 正负, 借贷) -> 行 的索引，不再对每个 Key 重扫 group
+        row_index = self._index_group_rows(group, cols)
+
+        # 借方重构
         for d_key, c_map in best_sol.items():
-            d_subj = d_key.split('__')[0]
-            target_sign = 1 if "Pos" in d_key else -1
-            
-            d_rows = []
-            for _, row in group.iterrows():
-                if row['_calc_subj'] == d_subj:
-                    amt = row['_calc_debit']
-                    if abs(amt) > 0.001:
-                        if (amt >= 0 and target_sign == 1) or (amt < 0 and target_sign == -1):
-                            d_rows.append(row)
-            
-            total_alloc = sum(c_map.values())
-            for row in d_rows:
-                row_amt = row['_calc_debit']
-                if abs(total_alloc) < 0.001: continue
-                
-                for c_key, target_amt in c_map.items():
-                    c_subj = c_key.split('__')[0]
-                    if abs(target_amt) > 0.001:
-                        ratio = target_amt / total_alloc
-                        split_amt = row_amt * ratio
-                        
-                        new_row = self._copy_row_data(row, cols)
-                        new_row[self.mapping['debit']] = split_amt
-                        new_row[self.mapping['credit']] = 0
-                        new_row["对方科目"] = c_subj
-                        final_rows.append(new_row)
+            self._append_split_rows(final_rows, row_index.get(d_key, []), c_map, cols, is_credit=False)
 
         # 贷方重构
         c_side_map = defaultdict(dict)
@@ -335,33 +413,45 @@ class ContraProcessor:
                 if abs(amt) > 0.001: c_side_map[c_key][d_key] = amt
         
         for c_key, d_map in c_side_map.items():
-            c_subj = c_key.split('__')[0]
-            target_sign = 1 if "Pos" in c_key else -1
-            
-            c_rows = []
-            for _, row in group.iterrows():
-                if row['_calc_subj'] == c_subj:
-                    amt = row['_calc_credit']
-                    if abs(amt) > 0.001:
-                        if (amt >= 0 and target_sign == 1) or (amt < 0 and target_sign == -1):
-                            c_rows.append(row)
-            
-            total_alloc = sum(d_map.values())
-            for row in c_rows:
-                row_amt = row['_calc_credit']
-                if abs(total_alloc) < 0.001: continue
-                
-                for d_key, alloc_amt in d_map.items():
-                    d_subj = d_key.split('__')[0]
-                    if abs(alloc_amt) > 0.001:
-                        ratio = alloc_amt / total_alloc
-                        split_amt = row_amt * ratio
-                        
-                        new_row = self._copy_row_data(row, cols)
-                        new_row[self.mapping['credit']] = split_amt
-                        new_row[self.mapping['debit']] = 0
-                        new_row["对方科目"] = d_subj
-                        final_rows.append(new_row)
+            self._append_split_rows(final_rows, row_index.get(c_key, []), d_map, cols, is_credit=True)
+
+    def _index_group_rows(self, group, cols):
+        """按驻留 Key (科目, 正负, 借贷) 给凭证行建索引，保持原行顺序"""
+        row_index = defaultdict(list)
+        records = group[cols + ['_calc_subj', '_calc_debit', '_calc_credit']].to_dict('records')
+        for rec in records:
+            for calc_col, is_credit in (('_calc_debit', False), ('_calc_credit', True)):
+                amt = rec[calc_col]
+                if abs(amt) > 0.001:
+                    row_index[KEYS.intern(rec['_calc_subj'], amt < 0, is_credit)].append(rec)
+        return row_index
+
+    def _append_split_rows(self, final_rows, recs, alloc_map, cols, is_credit):
+        """
+        按方案比例拆分同一 Key 下的所有行：
+        拆分金额矩阵 = 行金额向量 (外积) 分配比例向量
+        """
+        total_alloc = sum(alloc_map.values())
+        if not recs or abs(total_alloc) < 0.001: return
+
+        targets = [(KEYS.subject(k), amt) for k, amt in alloc_map.items() if abs(amt) > 0.001]
+        if not targets: return
+
+        calc_col = '_calc_credit' if is_credit else '_calc_debit'
+        amt_col, zero_col = (self.mapping['credit'], self.mapping['debit']) if is_credit else (self.mapping['debit'], self.mapping['credit'])
+
+        row_amts = np.array([rec[calc_col] for rec in recs])
+        ratios = np.array([amt for _, amt in targets]) / total_alloc
+        splits = np.outer(row_amts, ratios).tolist()
+
+        for rec, row_splits in zip(recs, splits):
+            base_row = self._copy_row_data(rec, cols)
+            for (contra, _), split_amt in zip(targets, row_splits):
+                new_row = dict(base_row)
+                new_row[amt_col] = split_amt
+                new_row[zero_col] = 0
+                new_row["对方科目"] = contra
+                final_rows.append(new_row)
 
     def _is_exchange_gain_loss_entry(self, unique_subjs):
             """
@@ -0,0 +1,214 @@
+import os
+import sys
+import time
+from contextlib import contextmanager
+from .algorithm import ExhaustiveSolver
+from .occams_razor import OccamsRazor
+
+class FlowSolver:
+    """
+    整数规划求解器 v1.1 (大凭证兜底)
+    思路：把 借方->贷方 的分配写成一个小型 MILP，由 scipy (HiGHS) 在本地求解。
+    - x_ij: 借方 i 分给贷方 j 的金额 (以"分"为单位的整数变量，保证金额严格守恒)
+    - y_ij: 是否存在连接 (0/1)
+    目标函数与 OccamsRazor 完全一致：
+        扣分 = Σ y_ij * (行数惩罚 + Driver 分拆惩罚 * 系数_i + Bucket 分拆惩罚 * 系数_j) - 常数
+    只有 HiGHS 证明最优 (status 0) 时，所得方案才是奥卡姆得分最高的方案；
+    到时限仍未证明时返回目前找到的可行解，并标记为超时。之后通过"禁止相同连接结构"的约束逐个求次优解。
+    注意：全部同号的凭证只允许同向分配 (不会出现 "费用->收入 -30" 这类反向冲抵的连接)。
+    实测在常见的大凭证上穷举反而更快、方案更多，所以本求解器只在穷举超时后兜底；
+    超大凭证 (任一方 Key 数 >= DIRECT_SIDE) 穷举必然超时，直接用本求解器 (见 ContraProcessor.solve_pattern)。
+    """
+
+    # 任意一方 Key 数达到该值，且穷举超时，才启用本求解器
+    LARGE_SIDE = 10
+    # 大凭证先给穷举的时间比例，超时后剩余时间留给本求解器
+    EXHAUSTIVE_SHARE = 0.7
+    # 任意一方 Key 数达到该值，跳过穷举直接使用本求解器 (14x14 起穷举在数秒内基本拿不到方案)
+    DIRECT_SIDE = 14
+    # HiGHS 的部分调试信息直接 printf 到进程 stdout，disp=False 关不掉。
+    # 置为 True 时求解期间把 fd 1 指向空设备；会吞掉同进程其他线程的输出，只能由单线程的命令行入口开启 (见 batch.py)
+    QUIET_NATIVE_STDOUT = False
+    # 每个凭证最多求几个备选结构 (每个备选都要重新求解一次)
+    MAX_ALTERNATIVES = 10
+
+    @staticmethod
+    def is_available():
+        try:
+            from scipy.optimize import milp  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    @staticmethod
+    def route(debit_ledger, credit_ledger):
+        """
+        求解路径："exhaustive" (只穷举) / "fallback" (穷举超时后本求解器兜底) / "direct" (直接用本求解器)
+        """
+        n_d = sum(1 for v in debit_ledger.values() if abs(v) > 0.001)
+        n_c = sum(1 for v in credit_ledger.values() if abs(v) > 0.001)
+        side = max(n_d, n_c)
+        if side < FlowSolver.LARGE_SIDE or not FlowSolver.is_available(): return "exhaustive"
+        return "direct" if side >= FlowSolver.DIRECT_SIDE else "fallback"
+
+    @staticmethod
+    def calculate_combinations(debit_ledger, credit_ledger, max_solutions=200, timeout=5.0, stats=None):
+        """
+        与 ExhaustiveSolver.calculate_combinations 相同的输入输出：
+        返回 ([{借方Key: {贷方Key: 金额}}, ...], 是否超时)，按奥卡姆得分从高到低。
+        任何一次求解未被证明最优 (status != 0) 都视为超时。
+        stats: 可选 dict，累加写入 {'nodes': 分支定界节点数}。
+        """
+        import numpy as np
+        from scipy.optimize import milp, LinearConstraint, Bounds
+        from scipy.sparse import lil_matrix
+
+        start_time = time.time()
+
+        debits = {k: round(v, 2) for k, v in debit_ledger.items() if abs(v) > 0.001}
+        credits = {k: round(v, 2) for k, v in credit_ledger.items() if abs(v) > 0.001}
+        if not debits or not credits: return [], False
+
+        d_keys, c_keys = list(debits.keys()), list(credits.keys())
+        d_cents = [int(round(debits[k] * 100)) for k in d_keys]
+        c_cents = [int(round(credits[k] * 100)) for k in c_keys]
+        if sum(d_cents) != sum(c_cents): return [], False
+
+        # 1. 枚举允许的连接 (敏感科目不允许反向分配，与穷举算法规则一致)
+        # 全部同号的凭证 (最常见) 可以把每条连接的上限收紧到 min(|借|, |贷|)，求解快得多
+        big_m = sum(abs(v) for v in d_cents) + sum(abs(v) for v in c_cents)
+        all_values = d_cents + c_cents
+        same_sign = 1 if all(v > 0 for v in all_values) else (-1 if all(v < 0 for v in all_values) else 0)
+
+        pairs = []  # (i, j, x 下界, x 上界)
+        for i, d_key in enumerate(d_keys):
+            d_sens = ExhaustiveSolver.is_sensitive(d_key)
+            for j, c_key in enumerate(c_keys):
+                if same_sign:
+                    cap = min(abs(d_cents[i]), abs(c_cents[j]))
+                    pairs.append((i, j, 0, cap) if same_sign > 0 else (i, j, -cap, 0))
+                    continue
+                lo, hi = -big_m, big_m
+                if d_sens:
+                    if d_cents[i] > 0: lo = 0
+                    else: hi = 0
+                if ExhaustiveSolver.is_sensitive(c_key):
+                    if c_cents[j] > 0: lo = max(lo, 0)
+                    else: hi = min(hi, 0)
+                if lo >= hi: continue
+                pairs.append((i, j, lo, hi))
+
+        n_pairs = len(pairs)
+        if n_pairs == 0: return [], False
+
+        # 2. 目标函数：只对 y 计价 (与 OccamsRazor 扣分项逐项对应)
+        debit_is_driver = len(d_keys) >= len(c_keys)
+        d_weight = OccamsRazor.DRIVER_PENALTY if debit_is_driver else OccamsRazor.BUCKET_PENALTY
+        c_weight = OccamsRazor.BUCKET_PENALTY if debit_is_driver else OccamsRazor.DRIVER_PENALTY
+        d_mult = [OccamsRazor._get_bone_multiplier(k) for k in d_keys]
+        c_mult = [OccamsRazor._get_bone_multiplier(k) for k in c_keys]
+
+        # 变量排列: [x_0..x_{p-1}, y_0..y_{p-1}]
+        cost = np.zeros(2 * n_pairs)
+        for p, (i, j, _, _) in enumerate(pairs):
+            cost[n_pairs + p] = OccamsRazor.LINE_PENALTY + d_weight * d_mult[i] + c_weight * c_mult[j]
+
+        lower = np.array([lo for _, _, lo, _ in pairs] + [0] * n_pairs, dtype=float)
+        upper = np.array([hi for _, _, _, hi in pairs] + [1] * n_pairs, dtype=float)
+        # x 以"分"为单位取整数，y 为 0/1
+        integrality = np.ones(2 * n_pairs)
+
+        # 3. 约束：借方守恒 / 贷方守恒 / x 与 y 联动 (|x| <= M*y)
+        n_rows = len(d_keys) + len(c_keys) + 2 * n_pairs
+        A = lil_matrix((n_rows, 2 * n_pairs))
+        row_lo = np.zeros(n_rows)
+        row_hi = np.zeros(n_rows)
+
+        for p, (i, j, _, _) in enumerate(pairs):
+            A[i, p] = 1
+            A[len(d_keys) + j, p] = 1
+        row_lo[:len(d_keys)] = row_hi[:len(d_keys)] = d_cents
+        row_lo[len(d_keys):len(d_keys) + len(c_keys)] = c_cents
+        row_hi[len(d_keys):len(d_keys) + len(c_keys)] = c_cents
+
+        base = len(d_keys) + len(c_keys)
+        for p, (_, _, lo, hi) in enumerate(pairs):
+            link_m = max(abs(lo), abs(hi))
+            A[base + 2 * p, p] = 1;  A[base + 2 * p, n_pairs + p] = -link_m
+            A[base + 2 * p + 1, p] = -1; A[base + 2 * p + 1, n_pairs + p] = -link_m
+        row_lo[base:] = -np.inf
+        row_hi[base:] = 0
+
+        # 每个 Key 至少一条连接 (隐含约束，显式写出可明显收紧松弛)
+        cover = lil_matrix((base, 2 * n_pairs))
+        for p, (i, j, _, _) in enumerate(pairs):
+            cover[i, n_pairs + p] = 1
+            cover[len(d_keys) + j, n_pairs + p] = 1
+
+        constraints = [LinearConstraint(A.tocsr(), row_lo, row_hi),
+                       LinearConstraint(cover.tocsr(), np.ones(base), np.inf)]
+
+        # 4. 逐个求解：每得到一个结构，就加一条"不许再选完全相同的连接集合"的约束
+        solutions = []
+        is_timeout = False
+        limit = min(max_solutions, FlowSolver.MAX_ALTERNATIVES)
+
+        while len(solutions) < limit:
+            remaining = timeout - (time.time() - start_time)
+            if remaining <= 0.05:
+                is_timeout = True; break
+
+            with _quiet_native_stdout(FlowSolver.QUIET_NATIVE_STDOUT):
+                res = milp(cost, integrality=integrality, bounds=Bounds(lower, upper),
+                           constraints=constraints, options={"time_limit": remaining, "disp": False})
+            if stats is not None: stats['nodes'] = stats.get('nodes', 0) + int(getattr(res, 'mip_node_count', 0) or 0)
+            if res.x is None:
+                # status 1 = 时间/迭代上限且无可行解；status 2 = 不可行 (结构已枚举完)
+                if res.status == 1: is_timeout = True
+                break
+            # 有解但未证明最优 (时限内的可行解)，不能当作最优方案
+            if res.status != 0: is_timeout = True
+
+            x = np.round(res.x[:n_pairs]).astype(np.int64)
+            y = np.round(res.x[n_pairs:]).astype(np.int64)
+
+            sol = {}
+            for p, (i, j, _, _) in enumerate(pairs):
+                if x[p] != 0:
+                    sol.setdefault(d_keys[i], {})[c_keys[j]] = x[p] / 100.0
+
+            cleaned = ExhaustiveSolver._restore_result(sol, debits, credits, False)
+            if cleaned is not None: solutions.append(cleaned)
+
+            # 禁止相同的连接结构: Σ_{y=1} y - Σ_{y=0} y <= |S| - 1
+            active = y > 0
+            cut = np.zeros(2 * n_pairs)
+            cut[n_pairs:] = np.where(active, 1.0, -1.0)
+            constraints.append(LinearConstraint(cut, -np.inf, int(active.sum()) - 1))
+
+            if is_timeout: break
+
+        solutions.sort(key=OccamsRazor.score_solution, reverse=True)
+        return solutions, is_timeout
+
+@contextmanager
+def _quiet_native_stdout(enabled):
+    """enabled 时临时把 fd 1 指向空设备 (屏蔽 C++ 层直接写 stdout 的输出)；没有可用 stdout 时跳过"""
+    saved = None
+    if enabled:
+        try:
+            if sys.stdout is not None: sys.stdout.flush()
+            saved = os.dup(1)
+        except (OSError, ValueError, AttributeError):
+            saved = None
+    if saved is None:
+        yield
+        return
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, 1)
+        yield
+    finally:
+        os.dup2(saved, 1)
+        os.close(saved)
+        os.close(devnull)
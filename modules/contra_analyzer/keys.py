@@ -0,0 +1,69 @@
+import threading
+
+class KeyTable:
+    """
+    科目 Key 驻留表
+    求解链路内部不再使用 "应收账款__Pos__D" 这样的字符串，而是一个小整数：
+        key_id = 科目序号 * 4 + 负数位 * 2 + 贷方位
+    科目名只存一份，符号/方向用位运算取出，无需 split('__') 或 "Pos" in key。
+    只有在导出 (Excel / 缓存文件) 时才通过 label() 还原为字符串。
+    """
+    NEG_BIT = 2
+    CREDIT_BIT = 1
+
+    def __init__(self):
+        self._subjects = []
+        self._index = {}
+        self._lock = threading.Lock()
+
+    def intern(self, subject, is_negative, is_credit):
+        subject = str(subject)
+        idx = self._index.get(subject)
+        if idx is None:
+            with self._lock:
+                idx = self._index.get(subject)
+                if idx is None:
+                    idx = len(self._subjects)
+                    self._subjects.append(subject)
+                    self._index[subject] = idx
+        return (idx << 2) | (KeyTable.NEG_BIT if is_negative else 0) | (KeyTable.CREDIT_BIT if is_credit else 0)
+
+    def subject(self, key):
+        """兼容旧格式：字符串 Key 直接去掉后缀"""
+        if isinstance(key, int):
+            return self._subjects[key >> 2]
+        return str(key).split('__')[0]
+
+    def subject_id(self, key):
+        """科目序号 (仅驻留 Key)；旧字符串 Key 原样返回清洗后的科目名"""
+        if isinstance(key, int):
+            return key >> 2
+        return self.subject(key)
+
+    def is_negative(self, key):
+        if isinstance(key, int):
+            return bool(key & KeyTable.NEG_BIT)
+        return "__Neg__" in str(key)
+
+    def is_credit(self, key):
+        if isinstance(key, int):
+            return bool(key & KeyTable.CREDIT_BIT)
+        return str(key).endswith("__C")
+
+    def label(self, key):
+        """还原为旧的字符串格式 (仅导出时使用)"""
+        if not isinstance(key, int): return str(key)
+        sign = "Neg" if key & KeyTable.NEG_BIT else "Pos"
+        side = "C" if key & KeyTable.CREDIT_BIT else "D"
+        return f"{self._subjects[key >> 2]}__{sign}__{side}"
+
+    def parse(self, label):
+        """label() 的逆过程"""
+        parts = str(label).split('__')
+        subject = parts[0]
+        is_negative = len(parts) > 1 and parts[1] == "Neg"
+        is_credit = len(parts) > 2 and parts[2] == "C"
+        return self.intern(subject, is_negative, is_credit)
+
+# 进程级共享的驻留表 (与 sys.intern 同理，Key 只增不减)
+KEYS = KeyTable()
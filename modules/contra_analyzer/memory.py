@@ -1,62 +1,172 @@
 import os
 import json
+from contextlib import contextmanager
 from modules.path_manager import get_user_data_dir
 from .occams_razor import OccamsRazor
+from .keys import KEYS
+from .algorithm import ExhaustiveSolver
 
 class KnowledgeBase:
     """
-    记忆库 v9.1 (指纹排序修复版)
+    记忆库 v9.3 (日志持久化版)
     核心修复：指纹生成时，先提取所有连接对，清洗后再统一排序。
-    确保 [Solver生成的带后缀数据] 和 [Excel导入的不带后缀数据] 能生成完全一致的指纹。
+    确保 [Solver生成的驻留 Key] 和 [Excel导入的不带后缀数据] 能生成完全一致的指纹。
+    v9.2：先用科目序号元组组成的结构签名查缓存，同一结构只拼接一次指纹字符串。
+    v9.3：存储 = 快照 (contra_memory_ema.json) + 追加日志 (contra_memory_ema.journal)。
+          每次更新只往日志追加变化的条目；日志过长时原子地重写快照 (检查点) 并清空日志。
+          批量导入时用 `with kb.batch():` 包裹，整批只落盘一次。
+          内存中的 self.memory ({模式: {指纹: 分数}}) 就是 get_memory_score 的索引。
+    v9.4：本次运行内按方案签名缓存 (指纹, 奥卡姆得分)，同一方案无论被排序多少次只计算一次。
     """
-    def __init__(self):
-        self.file_path = os.path.join(get_user_data_dir(), "contra_memory_ema.json")
+    # 日志累计超过该条数就压缩为新快照
+    COMPACT_EVERY = 5000
+
+    def __init__(self, file_path=None):
+        # file_path 可指定其他记忆库文件 (如批处理时使用共享的只读记忆库)
+        self.file_path = file_path or os.path.join(get_user_data_dir(), "contra_memory_ema.json")
+        self.journal_path = os.path.splitext(self.file_path)[0] + ".journal"
         self.learning_rate = 0.6  
         self.beta_factor = 0.5    
+        self._pending = {}        # {(模式, 指纹): 分数}，尚未写入日志的变化
+        self._batch_depth = 0
+        self._journal_lines = 0
         self.memory = self._load()
+        # 结构签名 -> 指纹字符串 (同一结构只拼接一次字符串)
+        self._fp_by_structure = {}
+        # 方案签名 -> (指纹, 奥卡姆得分)
+        self._solution_cache = {}
+
+    def reset_cache(self):
+        """新一轮分析开始时调用 (缓存只在一次运行内有效)"""
+        self._fp_by_structure = {}
+        self._solution_cache = {}
+
+    def _analyze(self, solution):
+        """返回 (指纹, 奥卡姆得分)，按方案签名缓存"""
+        sig = ExhaustiveSolver._signature(solution)
+        cached = self._solution_cache.get(sig)
+        if cached is None:
+            cached = (self._generate_fingerprint(solution), OccamsRazor.score_solution(solution))
+            self._solution_cache[sig] = cached
+        return cached
 
     def _load(self):
+        memory = {}
         if os.path.exists(self.file_path):
             try:
                 with open(self.file_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                    memory = json.load(f)
             except: pass
-        return {}
+
+        # 回放日志 (最后一行可能因异常退出而不完整，直接忽略)
+        if os.path.exists(self.journal_path):
+            try:
+                with open(self.journal_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        try:
+                            pattern_name, fp, value = json.loads(line)
+                        except ValueError:
+                            continue
+                        memory.setdefault(pattern_name, {})[fp] = value
+                        self._journal_lines += 1
+            except OSError: pass
+        return memory
 
     def save(self):
-        with open(self.file_path, 'w', encoding='utf-8') as f:
-            json.dump(self.memory, f, ensure_ascii=False, indent=2)
+        """检查点：原子地写出完整快照，然后清空日志"""
+        self._pending = {}
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.memory, f, ensure_ascii=False, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.file_path)
+
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journal_lines = 0
+
+    def flush(self):
+        """把待写入的变化追加到日志；日志过长时压缩为快照"""
+        if not self._pending: return
+        if self._journal_lines + len(self._pending) > self.COMPACT_EVERY:
+            self.save()
+            return
+
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            for (pattern_name, fp), value in self._pending.items():
+                f.write(json.dumps([pattern_name, fp, value], ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_lines += len(self._pending)
+        self._pending = {}
+
+    @contextmanager
+    def batch(self):
+        """批量更新：期间所有 update_* 只改内存，退出时统一落盘一次"""
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self.flush()
+
+    def _set_score(self, pattern_name, fp, value):
+        self.memory[pattern_name][fp] = value
+        self._pending[(pattern_name, fp)] = value
+
+    def _commit(self):
+        if self._batch_depth == 0:
+            self.flush()
 
     def clear_memory(self):
         self.memory = {}
-        if os.path.exists(self.file_path):
-            os.remove(self.file_path)
+        self._pending = {}
+        self._journal_lines = 0
+        for path in (self.file_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
 
     def _generate_fingerprint(self, solution):
         """
         生成【规范化结构指纹】。
-        1. 遍历 solution，提取所有非零连接 (d, c)。
-        2. 清洗 d 和 c (去除后缀)。
-        3. 将所有 (clean_d, clean_c) 放入列表。
-        4. 对列表进行【统一排序】。
-        5. 拼接字符串。
-        【新增】使用 set 去重！确保 "A->B|A->B" 变成 "A->B"。这能解决多行同名科目导致的指纹不一致问题。
+        1. 遍历 solution，提取所有非零连接 (d, c)，驻留 Key 只取科目序号 (整数元组，便宜)。
+        2. 以连接集合 (frozenset，自动去重) 作为结构签名查缓存。
+        3. 未命中时才清洗科目名 (去除后缀)、统一排序并拼接字符串。
+        确保 [Solver生成的驻留 Key] 和 [Excel导入的纯科目名] 能生成完全一致的指纹。
         """
-        connections =  set() # <--- 改用 set
+        structure = frozenset(
+            (KEYS.subject_id(d), KEYS.subject_id(c))
+            for d, c_map in solution.items()
+            for c, amt in c_map.items() if abs(amt) > 0.001
+        )
+        fp = self._fp_by_structure.get(structure)
+        if fp is None:
+            fp = self._render_fingerprint(solution)
+            self._fp_by_structure[structure] = fp
+        return fp
+
+    def _render_fingerprint(self, solution):
+        """
+        把结构渲染为 "借->贷|借->贷" 字符串 (记忆库文件里的 Key)。
+        使用 set 去重！确保 "A->B|A->B" 变成 "A->B"。这能解决多行同名科目导致的指纹不一致问题。
+        """
+        connections =  set()
         
         for d, c_map in solution.items():
             for c, amt in c_map.items():
                 if abs(amt) > 0.001:
                     # 清洗 Key
-                    clean_d = str(d).split('__')[0].strip()
-                    clean_c = str(c).split('__')[0].strip()
+                    clean_d = KEYS.subject(d).strip()
+                    clean_c = KEYS.subject(c).strip()
                     
                     # 过滤无效数据
                     if not clean_d or not clean_c: continue
                     if clean_d.lower() == 'nan' or clean_c.lower() == 'nan': continue
                     
                     # 添加连接对
-                    connections.add(f"{clean_d}->{clean_c}") # <--- add
+                    connections.add(f"{clean_d}->{clean_c}")
         
         # === 核心：统一排序 ===
         # 无论输入字典的 Key 顺序如何，这里强制按字符串内容排序
@@ -64,7 +174,7 @@ class KnowledgeBase:
         return "|".join(sorted_conns)
         
     def get_memory_score(self, pattern_name, solution):
-        fp = self._generate_fingerprint(solution)
+        fp = self._analyze(solution)[0]
         if pattern_name in self.memory:
             return self.memory[pattern_name].get(fp, 0.5)
         return 0.5
@@ -77,13 +187,13 @@ class KnowledgeBase:
             self.memory[pattern_name] = {}
         
         # 生成标准指纹
-        target_fp = self._generate_fingerprint(selected_solution)
+        target_fp = self._analyze(selected_solution)[0]
         
         # 记录本次出现的所有指纹
         seen_fps = set()
         
         for sol in all_solutions:
-            fp = self._generate_fingerprint(sol)
+            fp = self._analyze(sol)[0]
             if not fp: continue 
             seen_fps.add(fp)
             
@@ -96,9 +206,9 @@ class KnowledgeBase:
                 reward = 0.0
             
             m_new = m_old * (1 - self.learning_rate) + reward * self.learning_rate
-            self.memory[pattern_name][fp] = round(m_new, 4)
+            self._set_score(pattern_name, fp, round(m_new, 4))
             
-        self.save()
+        self._commit()
 
     def update_memory_by_fingerprint(self, pattern_name, all_solutions, target_fingerprint):
         """
@@ -108,7 +218,7 @@ class KnowledgeBase:
             self.memory[pattern_name] = {}
             
         for sol in all_solutions:
-            fp = self._generate_fingerprint(sol)
+            fp = self._analyze(sol)[0]
             if not fp: continue
             
             m_old = self.memory[pattern_name].get(fp, 0.5)
@@ -116,22 +226,28 @@ class KnowledgeBase:
             reward = 1.0 if fp == target_fingerprint else 0.0
             
             m_new = m_old * (1 - self.learning_rate) + reward * self.learning_rate
-            self.memory[pattern_name][fp] = round(m_new, 4)
+            self._set_score(pattern_name, fp, round(m_new, 4))
             
-        self.save()
+        self._commit()
 
     def calculate_total_score(self, razor_score, memory_score):
         return round(razor_score * (1 + self.beta_factor * memory_score), 2)
 
-    def rank_solutions(self, solutions, pattern_name=""):
-        if not solutions: return []
-        
+    def score_solutions(self, solutions, pattern_name=""):
+        """
+        批量打分：返回按合计得分降序的 [{"sol", "fp", "razor", "mem", "total"}]。
+        指纹和奥卡姆得分走缓存，记忆得分每次实时读取 (导入后会变化)。
+        """
+        pattern_memory = self.memory.get(pattern_name, {}) if pattern_name else {}
         scored = []
         for sol in solutions:
-            r = OccamsRazor.score_solution(sol)
-            m = self.get_memory_score(pattern_name, sol) if pattern_name else 0.5
-            total = self.calculate_total_score(r, m)
-            scored.append((total, sol))
-            
-        scored.sort(key=lambda x: x[0], reverse=True)
-        return [x[1] for x in scored]
\ No newline at end of file
+            fp, r = self._analyze(sol)
+            m = pattern_memory.get(fp, 0.5)
+            scored.append({"sol": sol, "fp": fp, "razor": r, "mem": m, "total": self.calculate_total_score(r, m)})
+
+        scored.sort(key=lambda x: x["total"], reverse=True)
+        return scored
+
+    def rank_solutions(self, solutions, pattern_name=""):
+        if not solutions: return []
+        return [x["sol"] for x in self.score_solutions(solutions, pattern_name)]
\ No newline at end of file
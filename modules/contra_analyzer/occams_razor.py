@@ -1,3 +1,5 @@
+from .keys import KEYS
+
 class OccamsRazor:
     """
     奥卡姆剃刀剪枝器 v4.0 (硬骨头权重版)
@@ -8,14 +10,19 @@ class OccamsRazor:
     # 这些科目通常业务逻辑简单，不应被随意拆分
     HARD_BONES = ["应交税费"] 
 
+    # === 扣分权重 (FlowSolver 的目标函数与此保持一致) ===
+    LINE_PENALTY = 1.0      # 每条连接线
+    DRIVER_PENALTY = 5.0    # Driver 方每多拆一次
+    BUCKET_PENALTY = 1.0    # Bucket 方每多拆一次
+
     @staticmethod
     def _get_bone_multiplier(subject_raw):
         """
         判断是否为硬骨头，返回惩罚倍率
-        subject_raw: 可能带后缀，如 "应交税费__Pos__D"
+        subject_raw: 驻留 Key (int)，或带后缀的旧字符串，如 "应交税费__Pos__D"
         """
         # 清洗科目名
-        clean_name = str(subject_raw).split('__')[0]
+        clean_name = KEYS.subject(subject_raw)
         
         for bone in OccamsRazor.HARD_BONES:
             if bone in clean_name:
@@ -52,15 +59,15 @@ class OccamsRazor:
         m = len(all_c)
         
         # === 扣分项 1: 行数惩罚 (固定扣1分) ===
-        score -= total_lines * 1.0
+        score -= total_lines * OccamsRazor.LINE_PENALTY
         
         # === 扣分项 2: 分拆惩罚 (含硬骨头加成) ===
         # 规则：数量多的一方做 Driver (遍历方)，数量少的是 Bucket
         
         debit_is_driver = (n >= m)
         
-        base_driver_penalty = 5.0
-        base_bucket_penalty = 1.0
+        base_driver_penalty = OccamsRazor.DRIVER_PENALTY
+        base_bucket_penalty = OccamsRazor.BUCKET_PENALTY
         
         if debit_is_driver:
             # --- 借方是 Driver (重罚) ---
@@ -92,6 +99,18 @@ class OccamsRazor:
         
         return round(score, 2)
 
+    @staticmethod
+    def best_possible_score(debit_ledger, credit_ledger):
+        """
+        该凭证结构理论上能达到的最高得分 (上界)：
+        Key 多的一方做 Driver，每个 Driver 恰好一条连接 (不分拆)，Bucket 共被多拆 (多 - 少) 次，硬骨头系数按 1 计。
+        方案得分达到该值即可断定奥卡姆意义下已最优，供随时可停模式提前结束。
+        """
+        n_d = sum(1 for v in debit_ledger.values() if abs(v) > 0.001)
+        n_c = sum(1 for v in credit_ledger.values() if abs(v) > 0.001)
+        many, few = max(n_d, n_c), min(n_d, n_c)
+        return round(100.0 - many * OccamsRazor.LINE_PENALTY - (many - few) * OccamsRazor.BUCKET_PENALTY, 2)
+
     @staticmethod
     def rank_solutions(solutions):
         """仅按奥卡姆得分排序"""
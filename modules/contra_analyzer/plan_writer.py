@@ -0,0 +1,70 @@
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
+
+class PlanWorkbookWriter:
+    """
+    "方案选择" 工作簿流式写入器
+    基于 openpyxl 的 write_only 模式：每一行写出即落到临时文件，样式随单元格一起写入，
+    不再先拼 DataFrame、再整表 iter_rows 回头刷格式。内存占用与模式数量无关。
+    用法：
+        with PlanWorkbookWriter(path) as writer:
+            writer.write_option(...)
+            writer.write_detail(...)
+    """
+    SHEET_NAME = "方案选择"
+    COLUMNS = ["模式特征", "方案ID", "请在此列打x", "奥卡姆得分", "记忆得分", "合计得分", "会计科目", "借方金额", "对方科目", "拆分金额", "说明"]
+    WIDTHS = {'A': 40, 'D': 8, 'E': 8, 'F': 8, 'G': 25, 'I': 25}
+
+    def __init__(self, path):
+        self.path = path
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet(self.SHEET_NAME)
+        # 列宽必须在写入第一行之前设置
+        for col, width in self.WIDTHS.items():
+            self.ws.column_dimensions[col].width = width
+
+        self.fill_yellow = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+        self.border = Border(bottom=Side(style='thin', color="EEEEEE"))
+        self.font_bold = Font(bold=True, color="007AFF")
+        self.font_header = Font(bold=True)
+        self.align_header = Alignment(horizontal="center", vertical="top")
+        self.rows_written = 0
+
+        self.ws.append([self._cell(c, font=self.font_header, alignment=self.align_header) for c in self.COLUMNS])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 出错时不保存，避免留下半截文件
+        if exc_type is None: self.close()
+        return False
+
+    def _cell(self, value, fill=None, font=None, border=None, alignment=None, as_text=False):
+        cell = WriteOnlyCell(self.ws, value=value)
+        # "=== 方案 ===" 以等号开头，不强制为文本会被当成公式写入
+        if as_text: cell.data_type = 's'
+        if fill: cell.fill = fill
+        if font: cell.font = font
+        if border: cell.border = border
+        if alignment: cell.alignment = alignment
+        return cell
+
+    def write_option(self, pattern_name, option_id, check_mark, razor, mem, total, desc):
+        """方案标题行：打勾列标黄，科目列蓝色加粗 (未勾选写空单元格，导入时按 notna 判断)"""
+        self.ws.append([
+            pattern_name, option_id,
+            self._cell(check_mark or None, fill=self.fill_yellow, border=self.border),
+            razor, mem, total,
+            self._cell(f"=== 方案 {option_id} ===", font=self.font_bold, as_text=True),
+            None, None, None, desc
+        ])
+        self.rows_written += 1
+
+    def write_detail(self, pattern_name, option_id, check_mark, d_name, c_name, amt):
+        self.ws.append([pattern_name, option_id, check_mark or None, None, None, None, d_name, amt, c_name, amt, "明细"])
+        self.rows_written += 1
+
+    def close(self):
+        self.wb.save(self.path)
@@ -0,0 +1,135 @@
+import cProfile
+import csv
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+class RunProfiler:
+    """
+    运行剖析器 (对方科目分析)
+    回答 "慢在哪"：读取序时账 / 分层聚类 / 求解 / 排序 / 写 Excel 各占多少。
+    1. 阶段计时：with profiler.stage("求解"): ...  嵌套阶段记为 "生成报告/求解"，时间为含子阶段的总时长。
+    2. 计数器：profiler.count("复杂凭证")。
+    3. 模式级统计：每次求解的耗时、搜索节点数、是否超时、方案数，按模式名汇总。
+    4. 输出：report_lines() 给界面日志；save() 导出 JSON + CSV；
+       可选 cProfile (cprofile_path 不为空时，start/stop 之间的调用栈写入 .prof 文件)。
+    计时只在阶段边界取 perf_counter，默认常开，开销可忽略。
+    """
+    def __init__(self, cprofile_path=None):
+        self.stages = {}                    # {"生成报告/求解": [次数, 秒]}，按首次出现排序
+        self.counters = defaultdict(int)
+        self.patterns = {}                  # {模式名: {calls, seconds, max_seconds, nodes, timeouts, solutions, solver}}
+        self.cprofile_path = cprofile_path
+        self._stack = []
+        self._cprofile = None
+        self._started = time.perf_counter()
+        self._stopped = None
+
+    # ---------- 采集 ----------
+    @contextmanager
+    def stage(self, name):
+        path = "/".join(self._stack + [name])
+        # 进入时登记，保证父阶段排在子阶段前面
+        entry = self.stages.setdefault(path, [0, 0.0])
+        self._stack.append(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            entry[0] += 1
+            entry[1] += time.perf_counter() - started
+            self._stack.pop()
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def record_pattern(self, pattern_name, seconds, solutions, nodes=0, is_timeout=False, solver=""):
+        p = self.patterns.get(pattern_name)
+        if p is None:
+            p = self.patterns[pattern_name] = {"calls": 0, "seconds": 0.0, "max_seconds": 0.0, "nodes": 0,
+                                               "timeouts": 0, "solutions": 0, "solver": solver}
+        p["calls"] += 1
+        p["seconds"] += seconds
+        p["max_seconds"] = max(p["max_seconds"], seconds)
+        p["nodes"] += nodes
+        p["timeouts"] += 1 if is_timeout else 0
+        p["solutions"] = max(p["solutions"], solutions)
+        p["solver"] = solver or p["solver"]
+
+        self.count("求解次数")
+        self.count("搜索节点", nodes)
+        if is_timeout: self.count("求解超时")
+
+    def start(self):
+        if self.cprofile_path and self._cprofile is None:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def stop(self):
+        self._stopped = time.perf_counter()
+        if self._cprofile is not None:
+            self._cprofile.disable()
+            self._cprofile.dump_stats(self.cprofile_path)
+            self._cprofile = None
+
+    @property
+    def total_seconds(self):
+        return (self._stopped or time.perf_counter()) - self._started
+
+    # ---------- 输出 ----------
+    def report_lines(self, top=5):
+        total = self.total_seconds
+        lines = [f"性能剖析 (总耗时 {total:.2f}s):"]
+        for path, (calls, seconds) in self.stages.items():
+            depth = path.count("/")
+            name = path.rsplit("/", 1)[-1]
+            pct = seconds / total * 100 if total > 0 else 0.0
+            lines.append(f"{'  ' * (depth + 1)}{name}: {seconds:.2f}s ({pct:.0f}%) x{calls}")
+        if self.counters:
+            lines.append("  计数: " + " | ".join(f"{k} {v}" for k, v in self.counters.items()))
+
+        slowest = sorted(self.patterns.items(), key=lambda x: x[1]["seconds"], reverse=True)[:top]
+        if slowest:
+            lines.append(f"  最慢的 {len(slowest)} 个模式:")
+            for name, p in slowest:
+                label = name if len(name) <= 30 else name[:30] + "..."
+                lines.append(f"    {label} | {p['calls']}次 {p['seconds']:.2f}s | 节点 {p['nodes']} | 超时 {p['timeouts']}")
+        return lines
+
+    def to_dict(self):
+        return {
+            "total_seconds": round(self.total_seconds, 4),
+            "stages": {k: {"calls": c, "seconds": round(s, 4)} for k, (c, s) in self.stages.items()},
+            "counters": dict(self.counters),
+            "patterns": {k: dict(v, seconds=round(v["seconds"], 4), max_seconds=round(v["max_seconds"], 4))
+                         for k, v in self.patterns.items()},
+        }
+
+    @staticmethod
+    def profile_paths(base_path):
+        """<base>.profile.json / <base>.profile.csv / <base>.prof"""
+        base = os.path.splitext(base_path)[0]
+        return base + ".profile.json", base + ".profile.csv", base + ".prof"
+
+    def save(self, base_path):
+        """导出 JSON (完整结构) 和 CSV (阶段 + 模式两类行，便于 Excel 透视)；返回写出的文件列表"""
+        json_path, csv_path, _ = self.profile_paths(base_path)
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=1)
+
+        with open(csv_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["类型", "名称", "次数", "耗时(秒)", "最长单次(秒)", "搜索节点", "超时次数", "方案数", "求解器"])
+            for path, (calls, seconds) in self.stages.items():
+                writer.writerow(["阶段", path, calls, round(seconds, 4), "", "", "", "", ""])
+            for name, value in self.counters.items():
+                writer.writerow(["计数", name, value, "", "", "", "", "", ""])
+            for name, p in sorted(self.patterns.items(), key=lambda x: x[1]["seconds"], reverse=True):
+                writer.writerow(["模式", name, p["calls"], round(p["seconds"], 4), round(p["max_seconds"], 4),
+                                 p["nodes"], p["timeouts"], p["solutions"], p["solver"]])
+
+        written = [json_path, csv_path]
+        if self.cprofile_path and os.path.exists(self.cprofile_path): written.append(self.cprofile_path)
+        return written
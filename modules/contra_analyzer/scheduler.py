@@ -0,0 +1,106 @@
+import math
+import time
+
+class SolveBudget:
+    """
+    求解时间预算调度器
+    替代 "每个模式固定 2 秒 / 每张凭证固定 1.5 秒"：
+    1. 给整轮运行一个总预算，只计求解器实际耗时 (由调用方 consume 登记)，读表/写报告的时间不占预算；
+       另设墙钟硬上限 (预算 x WALL_FACTOR + WALL_GRACE)。预算用尽或墙钟到期后 expired 为真，
+       调用方不再求解 (记为需人工分析)，整轮耗时有确定上界。
+    2. 按权重分配：出现次数多、金额大的模式拿更多时间。
+    3. 简单结构 (如 2x2) 走快速通道，固定给 TWO_PASS_TIMEOUT (通常几毫秒就结束，时限只是上限)。
+    4. 动态回收：求解器提前结束省下的时间立即回到公共池，分给后面的任务。
+    """
+    # 借贷 Key 数乘积不超过该值视为简单结构
+    TRIVIAL_SIZE = 4
+    # 墙钟硬上限 = 总预算 x WALL_FACTOR + WALL_GRACE 秒 (留出排序、写表等非求解开销)
+    WALL_FACTOR = 2.0
+    WALL_GRACE = 60.0
+    # 穷举的两轮都能执行的最短时限：自由搜索占 70%，剩余超过 0.1 秒才会跑完美锁定
+    TWO_PASS_TIMEOUT = 0.4
+
+    def __init__(self, total_seconds, min_timeout=0.2, max_timeout=10.0):
+        self.total_seconds = total_seconds
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.spent = 0.0
+        self.skipped = 0
+        self.deadline = time.time() + total_seconds * self.WALL_FACTOR + self.WALL_GRACE
+        self._weights = {}
+        self._trivial = set()
+        self._remaining_weight = 0.0
+
+    @staticmethod
+    def ledger_weight(debits, credits, count=1):
+        """权重 = 出现次数 * 金额量级 (log10)"""
+        amount = sum(abs(v) for v in debits.values())
+        return count * (1.0 + math.log10(1.0 + amount))
+
+    @classmethod
+    def is_trivial(cls, debits, credits):
+        return len(debits) * len(credits) <= cls.TRIVIAL_SIZE
+
+    @classmethod
+    def for_patterns(cls, cluster_samples, seconds_per_pattern=2.0, max_total=1800.0):
+        """导出方案：总预算默认与原来 "每模式 2 秒" 持平，但不超过 max_total"""
+        budget = cls(min(seconds_per_pattern * len(cluster_samples), max_total))
+        for key_hash, sample in cluster_samples.items():
+            budget.add(key_hash, cls.ledger_weight(sample['debits'], sample['credits'], sample['count']),
+                       trivial=cls.is_trivial(sample['debits'], sample['credits']))
+        return budget
+
+    @classmethod
+    def for_vouchers(cls, complex_data_cache, seconds_per_voucher=1.5, max_total=1800.0):
+        """生成报告：按凭证金额分配，总预算默认与原来 "每张 1.5 秒" 持平"""
+        budget = cls(min(seconds_per_voucher * len(complex_data_cache), max_total), min_timeout=cls.TWO_PASS_TIMEOUT, max_timeout=5.0)
+        for uid, data in complex_data_cache.items():
+            budget.add(uid, cls.ledger_weight(data['debits'], data['credits']),
+                       trivial=cls.is_trivial(data['debits'], data['credits']))
+        return budget
+
+    def add(self, key, weight, trivial=False):
+        if trivial:
+            self._trivial.add(key)
+            return
+        self._weights[key] = weight
+        self._remaining_weight += weight
+
+    @property
+    def remaining(self):
+        return max(0.0, self.total_seconds - self.spent)
+
+    @property
+    def expired(self):
+        """求解预算用尽或墙钟到期：之后的任务不再求解 (命中缓存的除外)"""
+        return self.remaining <= 0 or time.time() >= self.deadline
+
+    def timeout_for(self, key):
+        """调用前应先检查 expired；返回的时限不会越过墙钟上限"""
+        wall_left = max(0.0, self.deadline - time.time())
+        # 简单结构固定给两轮都能执行的时限 (实际只用几毫秒)
+        if key in self._trivial: return min(self.TWO_PASS_TIMEOUT, wall_left)
+        remaining = min(self.remaining, wall_left)
+
+        weight = self._weights.get(key, 0.0)
+        share = remaining * weight / self._remaining_weight if self._remaining_weight > 0 else remaining
+        timeout = max(self.min_timeout, min(self.max_timeout, share))
+        return min(timeout, remaining)
+
+    def skip(self, key):
+        """预算到期未求解的任务：计数，并退出分配池"""
+        self.skipped += 1
+        self.consume(key, 0.0)
+
+    def consume(self, key, elapsed):
+        """登记求解器实际耗时 (命中缓存时登记 0)；该任务的权重退出分配池"""
+        self.spent += elapsed
+        weight = self._weights.pop(key, None)
+        if weight is not None:
+            self._remaining_weight = max(0.0, self._remaining_weight - weight)
+        self._trivial.discard(key)
+
+    def summary(self):
+        text = f"求解预算 {self.total_seconds:.0f}s，实际用时 {self.spent:.1f}s"
+        if self.skipped: text += f"，预算用尽跳过 {self.skipped} 个 (需人工分析)"
+        return text
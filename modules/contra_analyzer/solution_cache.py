@@ -0,0 +1,94 @@
+import os
+import json
+from .keys import KEYS
+
+class SolutionCache:
+    """
+    方案集缓存 (导出 -> 导入 复用)
+    导出 "方案选择.xlsx" 时，把每个模式 (按 pattern hash) 求出的全部方案写到旁边的
+    "方案选择.solutions.json"。导入决策时直接读取，不再为 EMA 更新重新跑一遍穷举，
+    也避免两次求解因超时而得到不同的方案集。
+    每条记录同时保存求解时的借贷金额，只有与当前数据完全一致时才会被复用。
+    """
+    VERSION = 1
+
+    def __init__(self):
+        self.patterns = {}  # {key_hash: {"debits", "credits", "solutions", "is_timeout"}}
+
+    @staticmethod
+    def sidecar_path(xlsx_path):
+        return os.path.splitext(xlsx_path)[0] + ".solutions.json"
+
+    @staticmethod
+    def _ledger_labels(ledger):
+        return {KEYS.label(k): round(v, 2) for k, v in ledger.items()}
+
+    def put(self, key_hash, sample, solutions, is_timeout=False):
+        self.patterns[key_hash] = {
+            "debits": self._ledger_labels(sample['debits']),
+            "credits": self._ledger_labels(sample['credits']),
+            "solutions": solutions,
+            "is_timeout": is_timeout,
+        }
+
+    def get(self, key_hash, sample):
+        """返回 (solutions, is_timeout)；没有缓存或金额不一致时返回 None"""
+        entry = self.patterns.get(key_hash)
+        if not entry: return None
+        if entry["debits"] != self._ledger_labels(sample['debits']): return None
+        if entry["credits"] != self._ledger_labels(sample['credits']): return None
+        return entry["solutions"], entry["is_timeout"]
+
+    def update(self, other):
+        """合并另一个缓存 (已有的条目优先)"""
+        for key_hash, entry in other.patterns.items():
+            self.patterns.setdefault(key_hash, entry)
+
+    def save(self, xlsx_path):
+        data = {"version": self.VERSION, "patterns": {}}
+        for key_hash, entry in self.patterns.items():
+            data["patterns"][key_hash] = {
+                "debits": entry["debits"],
+                "credits": entry["credits"],
+                "is_timeout": entry["is_timeout"],
+                # 方案只在这里还原为字符串: [[借方Key, 贷方Key, 金额], ...]
+                "solutions": [
+                    [[KEYS.label(d), KEYS.label(c), amt] for d, c_map in sol.items() for c, amt in c_map.items()]
+                    for sol in entry["solutions"]
+                ],
+            }
+
+        path = self.sidecar_path(xlsx_path)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, xlsx_path):
+        """读取 xlsx 旁边的缓存文件；不存在或版本不符时返回空缓存"""
+        cache = cls()
+        path = cls.sidecar_path(xlsx_path)
+        if not os.path.exists(path): return cache
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cache
+        if data.get("version") != cls.VERSION: return cache
+
+        for key_hash, entry in data.get("patterns", {}).items():
+            solutions = []
+            for links in entry["solutions"]:
+                sol = {}
+                for d_label, c_label, amt in links:
+                    sol.setdefault(KEYS.parse(d_label), {})[KEYS.parse(c_label)] = amt
+                solutions.append(sol)
+            cache.patterns[key_hash] = {
+                "debits": entry["debits"],
+                "credits": entry["credits"],
+                "solutions": solutions,
+                "is_timeout": entry.get("is_timeout", False),
+            }
+        return cache
@@ -4,13 +4,15 @@ import pandas as pd
 import threading
 import os
 import time
-import openpyxl
-from openpyxl.styles import PatternFill, Font, Alignment, Border, Side
 
 from .core import ContraProcessor
-from .algorithm import ExhaustiveSolver
 from .memory import KnowledgeBase
+from .keys import KEYS
 from .occams_razor import OccamsRazor
+from .solution_cache import SolutionCache
+from .plan_writer import PlanWorkbookWriter
+from .scheduler import SolveBudget
+from .profiler import RunProfiler
 
 class ContraAnalyzerUI:
     def __init__(self):
@@ -22,6 +24,8 @@ class ContraAnalyzerUI:
         self.combo_vars = {}
         self.log_box = None
         self.var_ai_pruning = None
+        self.var_fast_export = None
+        self.var_profile = None
 
     def render(self, parent):
         for w in parent.winfo_children(): w.destroy()
@@ -45,6 +49,22 @@ class ContraAnalyzerUI:
             self.log_box.insert("end", f"> {msg}\n")
             self.log_box.see("end")
 
+    def _begin_profile(self, base_path):
+        """每次运行换一个新的剖析器 (须在工作线程内调用)；勾选 "性能剖析" 时同时开启 cProfile"""
+        enabled = self.var_profile is not None and self.var_profile.get()
+        profiler = RunProfiler(RunProfiler.profile_paths(base_path)[2] if enabled else None)
+        self.processor.profiler = profiler
+        profiler.start()
+        return profiler
+
+    def _end_profile(self, profiler, base_path):
+        """阶段耗时总是写入日志；勾选 "性能剖析" 时再导出 JSON/CSV/.prof"""
+        profiler.stop()
+        for line in profiler.report_lines(): self.log(line)
+        if profiler.cprofile_path:
+            saved = profiler.save(base_path)
+            self.log("剖析文件: " + ", ".join(os.path.basename(p) for p in saved))
+
     # ================= 1. 数据装载区 =================
     def create_load_section(self, parent):
         f = self._frame(parent)
@@ -53,6 +73,8 @@ class ContraAnalyzerUI:
         self.btn_load = ctk.CTkButton(row1, text="导入 Excel...", command=self.load_excel, width=120, fg_color="#F0F5FF", text_color="#007AFF", border_width=1, border_color="#007AFF"); self.btn_load.pack(side="left")
         self.lbl_file = ctk.CTkLabel(row1, text="未选择文件", text_color="#999"); self.lbl_file.pack(side="left", padx=10)
         btn_box_r = ctk.CTkFrame(row1, fg_color="transparent"); btn_box_r.pack(side="right")
+        self.var_profile = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(btn_box_r, text="性能剖析", variable=self.var_profile, text_color="#666", font=("Microsoft YaHei", 12), width=80).pack(side="left", padx=5)
         ctk.CTkButton(btn_box_r, text="清空记忆", command=self.clear_memory, fg_color="#FF9800", width=80, height=28).pack(side="left", padx=5)
         ctk.CTkButton(btn_box_r, text="重置", command=self.reset_all, fg_color="#FF4757", width=60, height=28).pack(side="left")
         self.progress_bar = ctk.CTkProgressBar(f, height=4); self.progress_bar.set(0); self.progress_bar.pack(fill="x", padx=15, pady=(15, 0))
@@ -90,6 +112,9 @@ class ContraAnalyzerUI:
         btn_row = ctk.CTkFrame(f, fg_color="transparent"); btn_row.pack(fill="x", padx=15, pady=15)
         self.var_ai_pruning = ctk.BooleanVar(value=True)
         self.chk_pruning = ctk.CTkCheckBox(btn_row, text="启用奥卡姆剃刀", variable=self.var_ai_pruning, text_color="#333", font=("Microsoft YaHei", 12, "bold")); self.chk_pruning.pack(side="left", padx=(0, 20))
+        # 随时可停：某模式找到理论满分方案 (OccamsRazor.best_possible_score) 即停止搜索，不再耗满时间预算
+        self.var_fast_export = ctk.BooleanVar(value=False)
+        ctk.CTkCheckBox(btn_row, text="满分即停", variable=self.var_fast_export, text_color="#333", font=("Microsoft YaHei", 12)).pack(side="left", padx=(0, 20))
         center_btns = ctk.CTkFrame(btn_row, fg_color="transparent"); center_btns.pack(side="left", expand=True)
         self.btn_export = ctk.CTkButton(center_btns, text="📥 导出方案到 Excel", command=self.export_all_to_excel, width=200, height=36, fg_color="#007AFF", state="disabled"); self.btn_export.pack(side="left", padx=10)
         self.btn_import = ctk.CTkButton(center_btns, text="📤 导入并生成结果", command=self.import_decisions, width=200, height=36, fg_color="#00C853", state="disabled"); self.btn_import.pack(side="left", padx=10)
@@ -125,12 +150,14 @@ class ContraAnalyzerUI:
         stop_event = None
         if hasattr(self, 'app'): stop_event = self.app.register_task(self.module_index)
         def t():
+            profiler = self._begin_profile(self.loaded_file_path)
             try:
-                self.log("开始数据清洗与分层..."); self.processor.load_data(self.loaded_file_path, mapping); stats = self.processor.process_all(stop_event)
+                self.log("开始数据清洗与分层..."); self.kb.reset_cache(); self.processor.load_data(self.loaded_file_path, mapping); stats = self.processor.process_all(stop_event)
                 if stop_event and stop_event.is_set(): self.log("分析终止")
                 else: self.update_ui_after_analysis(stats)
             except Exception as e: self.log(f"分析出错: {e}")
             finally:
+                self._end_profile(profiler, self.loaded_file_path)
                 if hasattr(self, 'app'): self.app.finish_task(self.module_index)
                 self.progress_bar.stop(); self.progress_bar.configure(mode="determinate"); self.progress_bar.set(1); self.btn_analyze.configure(state="normal", text="重新分析")
         threading.Thread(target=t, daemon=True).start()
@@ -152,114 +179,88 @@ class ContraAnalyzerUI:
         if not path: return
         
         use_razor = self.var_ai_pruning.get()
+        fast_export = self.var_fast_export.get()
         self.btn_export.configure(state="disabled", text="计算中...")
         self.progress_bar.configure(mode="indeterminate"); self.progress_bar.start()
         
         def t():
+            profiler = self._begin_profile(path)
             try:
-                solver = ExhaustiveSolver()
-                all_rows = []
                 total_patterns = len(self.processor.cluster_samples)
                 processed = 0
                 
                 sorted_samples = sorted(self.processor.cluster_samples.items(), key=lambda x: x[1]['count'], reverse=True)
+                # 按出现次数/金额分配求解时间，并限制总耗时
+                budget = SolveBudget.for_patterns(self.processor.cluster_samples)
                 
-                for pattern_idx, (key_hash, sample) in enumerate(sorted_samples, 1):
-                    pattern_name = sample['name']
-                    
-                    time.sleep(0.01)
-                    solutions, is_timeout = solver.calculate_combinations(
-                        sample['debits'], sample['credits'], max_solutions=200, timeout=2.0
-                    )
-                    
-                    if not solutions: continue
+                # 流式写入：每个方案算完立即写行 (样式随行写入)，不在内存里攒整表
+                with profiler.stage("导出方案"), PlanWorkbookWriter(path) as writer:
+                    for pattern_idx, (key_hash, sample) in enumerate(sorted_samples, 1):
+                        pattern_name = sample['name']
+                        
+                        if budget.expired:
+                            # 求解预算用尽 / 墙钟到期：写一行占位说明，不再求解 (生成报告时这些凭证标为需人工分析)
+                            budget.skip(key_hash)
+                            writer.write_option(pattern_name, f"{pattern_idx}-0", "", None, None, None, "预算用尽未求解，需人工分析")
+                            processed += 1
+                            self.progress_bar.set(processed / total_patterns)
+                            continue
 
-                    # === 排序 ===
-                    annotated_solutions = []
-                    for sol in solutions:
-                        r = OccamsRazor.score_solution(sol)
-                        m = self.kb.get_memory_score(pattern_name, sol)
-                        tot = self.kb.calculate_total_score(r, m)
-                        annotated_solutions.append({"sol": sol, "razor": r, "mem": m, "total": tot})
-                    
-                    # 排序: Total Desc
-                    annotated_solutions.sort(key=lambda x: x['total'], reverse=True)
+                        # 模式内进度：每找到一个方案推进进度条 (按 200 个方案封顶折算)
+                        def on_solution(sol, score, best_score, found_count, base=processed):
+                            self.progress_bar.set((base + min(found_count, 200) / 200) / total_patterns)
 
-                    # === 生成 Excel ===
-                    for sol_idx, item in enumerate(annotated_solutions, 1):
-                        sol = item['sol']
-                        option_id = f"{pattern_idx}-{sol_idx}"
-                        if is_timeout: option_id += "(超时)"
+                        started = time.time()
+                        solutions, is_timeout = self.processor.solve_pattern(
+                            sample['debits'], sample['credits'], max_solutions=200, timeout=budget.timeout_for(key_hash),
+                            pattern_name=pattern_name, on_solution=on_solution,
+                            stop_after=1 if fast_export else None,
+                            score_threshold=OccamsRazor.best_possible_score(sample['debits'], sample['credits']) if fast_export else None
+                        )
+                        budget.consume(key_hash, time.time() - started)
                         
-                        # Top 1 自动打勾
-                        check_mark = "x" if sol_idx == 1 and use_razor else ""
-                        
-                        desc = f"O:{item['razor']} | M:{item['mem']:.4f}"
-                        if item['mem'] > 0.6: desc += " (记忆命中)"
+                        if not solutions: continue
+                        self.processor.solution_cache.put(key_hash, sample, solutions, is_timeout)
 
-                        all_rows.append({
-                            "模式特征": pattern_name,
-                            "方案ID": option_id,
-                            "请在此列打x": check_mark,
-                            "奥卡姆得分": item['razor'],
-                            "记忆得分": item['mem'],
-                            "合计得分": item['total'],
-                            "会计科目": f"=== 方案 {option_id} ===",
-                            "借方金额": None, "对方科目": None, "拆分金额": None, "说明": desc
-                        })
-                        
-                        for d_subj_raw, c_map in sol.items():
-                            d_name = d_subj_raw.split('__')[0]
-                            valid_splits = {c: amt for c, amt in c_map.items() if abs(amt) > 0.001}
-                            for c_subj_raw, amt in valid_splits.items():
-                                c_name = c_subj_raw.split('__')[0]
-                                all_rows.append({
-                                    "模式特征": pattern_name,
-                                    "方案ID": option_id,
-                                    "请在此列打x": check_mark,
-                                    "奥卡姆得分": None, "记忆得分": None, "合计得分": None,
-                                    "会计科目": d_name,
-                                    "借方金额": amt, 
-                                    "对方科目": c_name,
-                                    "拆分金额": amt,
-                                    "说明": "明细"
-                                })
-                    processed += 1
-                    self.progress_bar.set(processed / total_patterns)
+                        # === 排序 (批量，Total Desc；指纹/奥卡姆得分走缓存) ===
+                        with profiler.stage("排序"):
+                            annotated_solutions = self.kb.score_solutions(solutions, pattern_name)
+
+                        # === 生成 Excel ===
+                        for sol_idx, item in enumerate(annotated_solutions, 1):
+                            sol = item['sol']
+                            option_id = f"{pattern_idx}-{sol_idx}"
+                            if is_timeout: option_id += "(超时)"
+                            
+                            # Top 1 自动打勾
+                            check_mark = "x" if sol_idx == 1 and use_razor else ""
+                            
+                            desc = f"O:{item['razor']} | M:{item['mem']:.4f}"
+                            if item['mem'] > 0.6: desc += " (记忆命中)"
 
-                self.log("写入 Excel...")
-                df_out = pd.DataFrame(all_rows)
-                cols = ["模式特征", "方案ID", "请在此列打x", "奥卡姆得分", "记忆得分", "合计得分", "会计科目", "借方金额", "对方科目", "拆分金额", "说明"]
-                for c in cols: 
-                    if c not in df_out.columns: df_out[c] = ""
-                df_out = df_out[cols]
+                            writer.write_option(pattern_name, option_id, check_mark, item['razor'], item['mem'], item['total'], desc)
+                            
+                            for d_subj_raw, c_map in sol.items():
+                                d_name = KEYS.subject(d_subj_raw)
+                                for c_subj_raw, amt in c_map.items():
+                                    if abs(amt) > 0.001:
+                                        writer.write_detail(pattern_name, option_id, check_mark, d_name, KEYS.subject(c_subj_raw), amt)
+                        processed += 1
+                        self.progress_bar.set(processed / total_patterns)
 
-                with pd.ExcelWriter(path, engine="openpyxl") as writer:
-                    df_out.to_excel(writer, index=False, sheet_name="方案选择")
-                    ws = writer.sheets["方案选择"]
-                    fill_yellow = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
-                    border = Border(bottom=Side(style='thin', color="EEEEEE"))
-                    font_bold = Font(bold=True, color="007AFF")
-                    for row in ws.iter_rows(min_row=2):
-                        if row[2].value and str(row[2].value).lower() == 'x': pass
-                        if row[6].value and str(row[6].value).startswith("==="):
-                            row[2].fill = fill_yellow 
-                            row[2].border = border
-                            row[6].font = font_bold
-                    ws.column_dimensions['A'].width = 40
-                    ws.column_dimensions['D'].width = 8
-                    ws.column_dimensions['E'].width = 8
-                    ws.column_dimensions['F'].width = 8
-                    ws.column_dimensions['G'].width = 25
-                    ws.column_dimensions['I'].width = 25
+                    self.log(budget.summary())
+                    self.log(f"写入 Excel... ({writer.rows_written} 行)")
 
+                sidecar = self.processor.solution_cache.save(path)
                 self.log(f"导出成功: {path}")
+                self.log(f"方案集缓存: {os.path.basename(sidecar)} (导入时复用，请与 Excel 放在同一目录)")
                 os.startfile(os.path.dirname(path))
             except Exception as e:
                 self.log(f"导出错误: {e}")
                 import traceback
                 print(traceback.format_exc())
             finally:
+                self._end_profile(profiler, path)
                 self.progress_bar.stop(); self.progress_bar.set(0)
                 self.btn_export.configure(state="normal", text="📥 导出方案到 Excel")
 
@@ -278,6 +279,7 @@ class ContraAnalyzerUI:
         self.progress_bar.configure(mode="indeterminate"); self.progress_bar.start()
 
         def t():
+            profiler = self._begin_profile(save_path)
             try:
                 # 1. 解析 Excel
                 df = pd.read_excel(p, dtype={'方案ID': str})
@@ -291,62 +293,72 @@ class ContraAnalyzerUI:
                     return
 
                 learn_count = 0
-                solver = ExhaustiveSolver()
+                reused_count = 0
+                # 导出时保存的方案集 (与本次会话内存中的缓存合并)
+                self.processor.solution_cache.update(SolutionCache.load(p))
 
                 # 2. 遍历打钩的方案
-                for _, row in selected_headers.iterrows():
-                    pattern_name = row.get("模式特征")
-                    opt_id = str(row.get("方案ID")).strip()
-                    if not opt_id or opt_id.lower() == 'nan': continue
+                # 整批只落盘一次 (见 KnowledgeBase.batch)
+                with profiler.stage("导入决策"), self.kb.batch():
+                    for _, row in selected_headers.iterrows():
+                        pattern_name = row.get("模式特征")
+                        opt_id = str(row.get("方案ID")).strip()
+                        if not opt_id or opt_id.lower() == 'nan': continue
 
-                    # === 核心：从 Excel 明细行重构【选中的方案指纹】===
-                    subset = df[df["方案ID"] == opt_id]
-                    # 过滤掉标题行
-                    details = subset[~subset["会计科目"].astype(str).str.startswith("===")]
+                        # === 核心：从 Excel 明细行重构【选中的方案指纹】===
+                        subset = df[df["方案ID"] == opt_id]
+                        # 过滤掉标题行
+                        details = subset[~subset["会计科目"].astype(str).str.startswith("===")]
                     
-                    if not details.empty:
-                        # 从 Excel 内容重建结构: {借:{贷:1}} (金额不重要，结构重要)
-                        reconstructed_sol = {}
-                        for _, d_row in details.iterrows():
-                            # 清洗: Excel 里显示的是不带后缀的科目名
-                            # 为了生成指纹，我们直接用这些名字即可
-                            # 因为 _generate_fingerprint 会自动 split('__')[0]
-                            # 所以我们直接传入 "科目名" 也是兼容的
-                            d = str(d_row["会计科目"]).strip()
-                            c = str(d_row["对方科目"]).strip()
+                        if not details.empty:
+                            # 从 Excel 内容重建结构: {借:{贷:1}} (金额不重要，结构重要)
+                            reconstructed_sol = {}
+                            for _, d_row in details.iterrows():
+                                # 清洗: Excel 里显示的是不带后缀的科目名
+                                # 为了生成指纹，我们直接用这些名字即可
+                                # 因为 _generate_fingerprint 会通过 KEYS.subject() 去掉后缀
+                                # 所以我们直接传入 "科目名" 也是兼容的
+                                d = str(d_row["会计科目"]).strip()
+                                c = str(d_row["对方科目"]).strip()
                             
-                            # 注意: Excel 里的金额是拆分后的金额
-                            # 只要有一行记录，就代表有一条边
-                            if d not in reconstructed_sol: reconstructed_sol[d] = {}
-                            reconstructed_sol[d][c] = 1.0 # 占位金额，用于生成指纹
+                                # 注意: Excel 里的金额是拆分后的金额
+                                # 只要有一行记录，就代表有一条边
+                                if d not in reconstructed_sol: reconstructed_sol[d] = {}
+                                reconstructed_sol[d][c] = 1.0 # 占位金额，用于生成指纹
                         
-                        # 生成目标指纹
-                        target_fingerprint = self.kb._generate_fingerprint(reconstructed_sol)
+                            # 生成目标指纹
+                            target_fingerprint = self.kb._generate_fingerprint(reconstructed_sol)
                         
-                        # === 核心：获取背景板 (All Solutions) ===
-                        # 为了给没选中的方案降分，我们需要重新跑一遍算法获取全量
-                        # (虽然有点耗时，但这是训练过程，值得)
-                        sample = None
-                        for k, s in self.processor.cluster_samples.items():
-                            if s['name'] == pattern_name:
-                                sample = s; break
+                            # === 核心：获取背景板 (All Solutions) ===
+                            # 为了给没选中的方案降分，需要该模式的全量方案：
+                            # 优先复用导出时保存的方案集，缓存缺失才重新跑算法
+                            sample, key_hash = None, None
+                            for k, s in self.processor.cluster_samples.items():
+                                if s['name'] == pattern_name:
+                                    sample, key_hash = s, k; break
                         
-                        if sample:
-                            # 跑算法
-                            all_solutions, _ = solver.calculate_combinations(
-                                sample['debits'], sample['credits'], max_solutions=200, timeout=2.0
-                            )
-                            # 更新记忆 (传入指纹)
-                            self.kb.update_memory_by_fingerprint(pattern_name, all_solutions, target_fingerprint)
-                            learn_count += 1
+                            if sample:
+                                cached = self.processor.solution_cache.get(key_hash, sample)
+                                if cached:
+                                    all_solutions = cached[0]; reused_count += 1
+                                else:
+                                    all_solutions, is_timeout = self.processor.solve_pattern(
+                                        sample['debits'], sample['credits'], max_solutions=200, timeout=2.0,
+                                        pattern_name=pattern_name
+                                    )
+                                    self.processor.solution_cache.put(key_hash, sample, all_solutions, is_timeout)
+                                # 更新记忆 (传入指纹)
+                                self.kb.update_memory_by_fingerprint(pattern_name, all_solutions, target_fingerprint)
+                                learn_count += 1
                 
-                self.log(f"已强化记忆 {learn_count} 个模式的规则 (EMA更新)。")
+                self.log(f"已强化记忆 {learn_count} 个模式的规则 (EMA更新，其中 {reused_count} 个复用导出方案集)。")
                 self.log("正在应用规则并生成全量数据...")
                 
                 # 3. 重新生成 (此时 Memory 已更新，Rank 会正确置顶)
                 final_df = self.processor.finalize_report(self.kb, self.log)
                 
-                final_df.to_excel(save_path, index=False)
+                with profiler.stage("写入Excel"):
+                    final_df.to_excel(save_path, index=False)
                 self.log(f"最终报告生成完毕: {save_path}")
                 os.startfile(os.path.dirname(save_path))
                 messagebox.showinfo("完成", "所有步骤已完成！")
@@ -356,6 +368,7 @@ class ContraAnalyzerUI:
                 import traceback
                 print(traceback.format_exc())
             finally:
+                self._end_profile(profiler, save_path)
                 self.progress_bar.stop(); self.progress_bar.set(0)
                 self.btn_import.configure(state="normal", text="📤 导入并生成")
 
@@ -2,15 +2,12 @@ import os
 import re
 import threading
 import pandas as pd
-import jieba.analyse
 import customtkinter as ctk
 from tkinter import filedialog, messagebox
-from sklearn.cluster import KMeans
-from sklearn.metrics import silhouette_score
 from modules.path_manager import get_model_path
 from difflib import SequenceMatcher
 
-# --- 注意：这里不再导入 sentence_transformers，防止启动卡顿 ---
+# --- 注意：这里不再导入 sentence_transformers / sklearn / jieba，防止启动卡顿 (用到时再导入，见 warm_up) ---
 # try:
 #     from sentence_transformers import SentenceTransformer
 # except ImportError:
@@ -43,8 +40,18 @@ class NLPClusterModule:
         self.filter_strictness = 0.6
         self.label_topk = 2 
 
+    @staticmethod
+    def warm_up():
+        """后台预加载 sklearn / jieba (只导入，不加载语义模型)，首次运行不再卡在导入上"""
+        try:
+            import jieba.analyse
+            from sklearn.cluster import KMeans
+        except ImportError:
+            pass
+
     def render(self, parent_frame):
         for widget in parent_frame.winfo_children(): widget.destroy()
+        threading.Thread(target=self.warm_up, daemon=True).start()
 
         scroll = ctk.CTkScrollableFrame(
             parent_frame, 
@@ -260,6 +267,7 @@ class NLPClusterModule:
         return re.sub(r'\s+', ' ', text).strip()
 
     def generate_cluster_label(self, texts_in_cluster, group_name):
+        import jieba.analyse
         full_text = " ".join(texts_in_cluster)
         keywords = jieba.analyse.extract_tags(full_text, topK=15)
         
@@ -368,6 +376,7 @@ class NLPClusterModule:
                 except ImportError:
                     self.log("错误: 未检测到 sentence-transformers 库，无法运行。")
                     return
+                from sklearn.cluster import KMeans
 
                 self.log(f"加载模型: {self.model_name} ...")
                 model = SentenceTransformer(model_path)